@@ -0,0 +1,124 @@
+# ========================================
+# コミュニティ別シェア（main_community.py の pct）のブートストラップ区間
+#  - 母集団 = 少なくとも1つのコミュニティに属している企業（n 社）
+#  - 1回の復元抽出 = 各企業が何回選ばれたか（多項分布 Multinomial(n, 1/n) の重み）
+#    → コミュニティ c の延べ企業数 = 所属（company_row, community_id）のロング形式上で重みを足すだけ
+#    （explode / value_counts はやり直さない。replicates × 所属行数 の配列演算）
+#  - replicates 回をチャンクに分け、チャンク i は SeedSequence(seed).spawn の i 番目の乱数で作る
+#    → ワーカー数を変えても結果は同じ。チャンクはワーカープロセスで並列
+#
+#  main_community.py から自動で呼ばれる（BOOTSTRAP_REPLICATES > 0 のとき）。単体でも実行可:
+#    python bootstrap_share.py --replicates 5000 --workers 4 --out community_share_bootstrap.csv
+# ========================================
+
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from community_io import COMPANY_COMM_PARQUET, load_company_communities
+from pipeline import run_pool
+
+CHUNK = 200  # 1チャンクの replicate 数（チャンクの区切りは乱数の割り当てに効くので固定）
+
+_firm = None
+_comm_starts = None
+_n_firms = None
+
+
+def membership_by_community(company_row, community_id):
+    """
+    所属のロング形式 → (企業の通し番号（community 順に並べたもの）, community ごとの開始位置, 企業数, community id)
+    企業の通し番号は「少なくとも1つのコミュニティに属している企業」だけで 0..n-1
+    """
+    firms, firm = np.unique(company_row, return_inverse=True)
+    order = np.argsort(community_id, kind="stable")
+    comms, starts = np.unique(community_id[order], return_index=True)
+    return firm[order], starts, len(firms), comms
+
+
+def bootstrap_counts(firm, comm_starts, n_firms, seed_seq, replicates):
+    """(replicates, n_comm) の延べ企業数。firm は community 順の企業番号、comm_starts は各 community の開始位置"""
+    rng = np.random.default_rng(seed_seq)
+    # 各 replicate で n 社を復元抽出し、企業ごとの選ばれた回数を数える（= 多項分布の重み。
+    # rng.multinomial を n カテゴリで回すより速い）
+    drawn = rng.integers(0, n_firms, size=(replicates, n_firms))
+    drawn += np.arange(replicates)[:, None] * n_firms
+    weights = np.bincount(drawn.ravel(), minlength=replicates * n_firms).reshape(replicates, n_firms)
+    return np.add.reduceat(weights[:, firm], comm_starts, axis=1)
+
+
+def _init_worker(firm, comm_starts, n_firms):
+    global _firm, _comm_starts, _n_firms
+    _firm, _comm_starts, _n_firms = firm, comm_starts, n_firms
+
+
+def _run_chunk(task):
+    seed_seq, replicates = task
+    return bootstrap_counts(_firm, _comm_starts, _n_firms, seed_seq, replicates)
+
+
+def bootstrap_share(company_row, community_id, replicates=5000, seed=0, n_workers=1, ci=95.0):
+    """
+    コミュニティごとの pct（延べ企業数 / 所属企業数 × 100）の点推定とブートストラップ区間
+    列：n_firms, pct, pct_se, pct_lo, pct_hi（index = community_id）
+    """
+    firm, starts, n_firms, comms = membership_by_community(
+        np.asarray(company_row), np.asarray(community_id)
+    )
+    if n_firms == 0:
+        # どの企業もコミュニティに属していない（区間は作れない）
+        return pd.DataFrame(
+            columns=["n_firms", "pct", "pct_se", "pct_lo", "pct_hi"],
+            index=pd.Index([], name="community_id"),
+        )
+    sizes = [min(CHUNK, replicates - a) for a in range(0, replicates, CHUNK)]
+    tasks = list(zip(np.random.SeedSequence(seed).spawn(len(sizes)), sizes))
+
+    parts = run_pool(_run_chunk, tasks, n_workers, _init_worker, (firm, starts, n_firms))
+
+    # 復元抽出しても企業数は n のままなので、母数も n
+    pct = np.concatenate(parts) / n_firms * 100
+    n_obs = np.diff(np.r_[starts, len(firm)])
+    lo, hi = np.percentile(pct, [(100 - ci) / 2, 100 - (100 - ci) / 2], axis=0)
+    return pd.DataFrame(
+        {
+            "n_firms": n_obs,
+            "pct": n_obs / n_firms * 100,
+            "pct_se": pct.std(axis=0, ddof=1) if replicates > 1 else np.nan,
+            "pct_lo": lo,
+            "pct_hi": hi,
+        },
+        index=pd.Index(comms, name="community_id"),
+    )
+
+
+def main():
+    ap = argparse.ArgumentParser(description="コミュニティ別シェアのブートストラップ区間（並列）")
+    ap.add_argument("--parquet", default=COMPANY_COMM_PARQUET)
+    ap.add_argument("--csv", default="startups_with_communities_louvain.csv")
+    ap.add_argument("--out", default="community_share_bootstrap.csv")
+    ap.add_argument("--replicates", type=int, default=5000)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--ci", type=float, default=95.0, help="区間の幅（%）")
+    ap.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1))
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
+    company_row, community_id, _, src = load_company_communities(args.parquet, args.csv)
+    result = bootstrap_share(
+        company_row,
+        community_id,
+        replicates=args.replicates,
+        seed=args.seed,
+        n_workers=args.workers,
+        ci=args.ci,
+    )
+    result.to_csv(args.out, encoding="utf-8-sig")
+    print(f"ブートストラップ {args.replicates} 回（{src}、{time.perf_counter() - t0:.1f}s）→ {args.out}")
+
+
+if __name__ == "__main__":
+    main()
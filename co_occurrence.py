@@ -4,16 +4,26 @@
 #  - 全体ネットワーク：共起100以上のみ可視化
 #  - コミュニティ別ネットワーク：閾値なしで可視化
 #  - すべて PyVis の HTML 出力 & 物理シミュレーションOFF
+#  - 各処理はステージ（pipeline.py）。パラメータ・入力が変わったステージとその下流だけ再実行
+#    例）THRESHOLD_OVERALL を変える → 全体ネットワークのレイアウトと HTML だけ
 # ========================================
 
+import numpy as np
 import pandas as pd
-from itertools import combinations
-from collections import Counter
 import networkx as nx
 from pyvis.network import Network
 from networkx.algorithms.community import louvain_communities
 import os
 
+from tag_parse import parse_tags, count_pairs, assign_groups, primary_group, ragged_lists
+from community_io import COMPANY_COMM_PARQUET, write_company_communities
+from run_report import RunReport
+from pipeline import Pipeline
+from threshold_index import build_threshold_index, write_threshold_curves
+from minhash_lsh import MinHashLSH
+from lod_export import export_lod, INDEX_JSON, VIEWER_HTML
+from cocluster import cocluster, write_cocluster, nmi, TAG_COMM_CSV, SUMMARY_CSV, COMPANY_CSV
+
 # ---------------------------
 # 0. ファイルパス
 # ---------------------------
@@ -31,176 +41,323 @@ HTML_COMM_PREFIX = os.path.join(
     OUTPUT_DIR, "cooccurrence_network_community_"  # + {id}.html
 )
 
+# 閾値カーブ（閾値ごとのノード数・エッジ数・連結成分数）。閾値を決めるときに見る
+CSV_CURVE_OVERALL = os.path.join(OUTPUT_DIR, "threshold_curve_overall.csv")
+CSV_CURVE_BY_COMM = os.path.join(OUTPUT_DIR, "threshold_curve_by_community.csv")
+
+# 全エッジを段階読み込みで見るビューア（lod_export.py）。python -m http.server --directory <LOD_DIR> で開く
+LOD_DIR = os.path.join(OUTPUT_DIR, "lod")
+
+# 重複候補（タグ集合の Jaccard >= DUPLICATE_JACCARD の企業の組）
+CSV_NEAR_DUP = os.path.join(OUTPUT_DIR, "near_duplicate_pairs.csv")
+
+# 全体ネットワーク表示用の閾値（共起回数）
+THRESHOLD_OVERALL = 100
+
+# 小さすぎるコミュニティをスキップしたい場合はここを変える
+COMM_MIN_NODES_FOR_HTML = 1  # 例: 5 にするとノード数5未満は出力しない
+
+# Louvain のパラメータ
+LOUVAIN_RESOLUTION = 1.0
+LOUVAIN_SEED = 0
+
+# 企業 × タグ の共クラスタリング（cocluster.py）。True にすると Louvain と並べて出す
+#   タグ×タグの共起グラフを作らずに、企業とタグを同時にクラスタリング（企業のクラスタも直接付く）
+COCLUSTER = False
+COCLUSTER_K = 0  # クラスタ数。0 なら Louvain のコミュニティ数と同じ
+
+# 段階読み込みの階層（weight 上位 LOD_TIER0_EDGES 本から 2 倍ずつ）と 1ファイルのエッジ数の上限
+LOD_TIER0_EDGES = 2000
+LOD_CHUNK_EDGES = 20000
+
+# タグ構成の似た企業（MinHash + LSH、minhash_lsh.py）
+SIMILAR_TOP_K = 5          # 企業ごとに出す似た企業の数
+SIMILAR_MIN_JACCARD = 0.5  # これ未満は「似た企業」に入れない
+DUPLICATE_JACCARD = 0.8    # これ以上を重複候補とする
+
+# 実行レポート（各ステージの時間・メモリ・件数）→ run_reports/co_occurrence_<日時>.json
+report = RunReport("co_occurrence", params={
+    "data_path": DATA_PATH,
+    "threshold_overall": THRESHOLD_OVERALL,
+    "comm_min_nodes_for_html": COMM_MIN_NODES_FOR_HTML,
+    "louvain_resolution": LOUVAIN_RESOLUTION,
+    "louvain_seed": LOUVAIN_SEED,
+    "similar_top_k": SIMILAR_TOP_K,
+    "similar_min_jaccard": SIMILAR_MIN_JACCARD,
+    "duplicate_jaccard": DUPLICATE_JACCARD,
+    "cocluster": COCLUSTER,
+    "cocluster_k": COCLUSTER_K,
+    "lod_tier0_edges": LOD_TIER0_EDGES,
+    "lod_chunk_edges": LOD_CHUNK_EDGES,
+    "layout": {"method": "spring_layout", "seed": 0, "k": 0.3, "iterations": 80},
+})
+
+# 中間成果物は .pipeline_cache/co_occurrence/ に保存
+pipe = Pipeline("co_occurrence", report=report)
+
 # ---------------------------
 # 1. データ読み込み
 # ---------------------------
-df = pd.read_csv(DATA_PATH, encoding="utf-8-sig")
+def load_csv(csv, st):
+    df = pd.read_csv(csv, encoding="utf-8-sig")
+    st["rows"] = len(df)
+    return df
+
+df_art = pipe.stage("load_csv", load_csv, files={"csv": DATA_PATH})
 
 #pd:pandas dataframeのこと
 
 # ---------------------------
-# 2. タグ列をリスト化
+# 2. タグ列を tag id の ragged array に（tag_parse.py）
 # ---------------------------
-df["タグリスト"] = df["タグ"].fillna("").apply(
-    lambda x: [t.strip() for t in str(x).split(",") if t.strip() != ""]
-)
+def parse_tag_col(df, st):
+    tags = parse_tags(df["タグ"])  # tags.vocab：タグ文字列、tags.ids：企業ごとの tag id を連結したもの
+    st.update(rows=tags.n_rows, tags=tags.n_tags, tag_occurrences=len(tags.ids))
+    print(f"ユニークタグ数: {tags.n_tags}, 延べタグ数: {len(tags.ids)}")
+    return tags
+
+tags_art = pipe.stage("parse_tags", parse_tag_col, inputs={"df": df_art})
 
 # ---------------------------
 # 3. 同じ企業内のタグ組を作り、共起回数を数える（全エッジ）
 # ---------------------------
-co_counts = Counter()
-
-for tags in df["タグリスト"]:
-    unique_tags = sorted(set(tags))          # 企業内の重複タグを消す
-    for pair in combinations(unique_tags, 2): # 2つ組の全てを作る
-        co_counts[pair] += 1                  # 共起回数をカウント　co_countsはキー： (tag1, tag2) のタプル、値：共起回数という構造になっている。
+def count_edges(tags, st):
+    # 企業内の重複タグを消して、2つ組の全てを id のまま数える
+    # （並びは企業を上から見て初めて出てきた順 = 以前の Counter と同じ）
+    tag1_ids, tag2_ids, co_weights = count_pairs(tags)
+
+    # DataFrameへ変換（全エッジ）
+    edges = pd.DataFrame({
+        "tag1": tags.vocab[tag1_ids],
+        "tag2": tags.vocab[tag2_ids],
+        "weight": co_weights,  #タグa、タグbと、weightって感じ
+    })
+    st["edges"] = len(edges)
 
-# DataFrameへ変換（全エッジ）
-edges = pd.DataFrame(
-    [(a, b, w) for (a, b), w in co_counts.items()],
-    columns=["tag1", "tag2", "weight"] #タグa、タグbと、weightって感じ
-)
+    print("▼共起回数 上位10件")
+    print(edges.sort_values("weight", ascending=False).head(10)) #ascending:昇順　　#上から10行だけプリント
+    print(f"\n全エッジ数（weight >= 1）: {len(edges)}")
+    return edges
 
-print("▼共起回数 上位10件")
-print(edges.sort_values("weight", ascending=False).head(10)) #ascending:昇順　　#上から10行だけプリント
-print(f"\n全エッジ数（weight >= 1）: {len(edges)}")
+edges_art = pipe.stage("count_pairs", count_edges, inputs={"tags": tags_art})
 
 # ---------------------------
 # 4. NetworkXで「全エッジ」のグラフ構築（コミュニティ検出用）
 # ---------------------------
-G_all = nx.Graph() #NetworkX の 無向グラフオブジェクト を1個作っている
-for _, row in edges.iterrows():
-    G_all.add_edge(row["tag1"], row["tag2"], weight=row["weight"])
+def build_graph(edges, st):
+    G_all = nx.Graph() #NetworkX の 無向グラフオブジェクト を1個作っている
+    for _, row in edges.iterrows():
+        G_all.add_edge(row["tag1"], row["tag2"], weight=row["weight"])
+    st.update(nodes=G_all.number_of_nodes(), edges=G_all.number_of_edges())
+
+    print(f"全体グラフ ノード数: {G_all.number_of_nodes()}")
+    print(f"全体グラフ エッジ数: {G_all.number_of_edges()}")
+    return G_all
 
-print(f"全体グラフ ノード数: {G_all.number_of_nodes()}")
-print(f"全体グラフ エッジ数: {G_all.number_of_edges()}")
+graph_art = pipe.stage("build_graph", build_graph, inputs={"edges": edges_art})
 
 # ---------------------------
 # 5. Louvain法でコミュニティ検出（全エッジ使用）
 # ---------------------------
-communities = list(
-    louvain_communities(G_all, weight="weight", resolution=1.0, seed=0)
+def detect_communities(G_all, resolution, seed, st):
+    # set のままだと読み戻したときに並びが変わるので、検出時の並びを list で持つ
+    communities = [
+        list(c) for c in louvain_communities(G_all, weight="weight", resolution=resolution, seed=seed)
+    ]
+    st["communities"] = len(communities)
+    print(f"\n見つかったコミュニティ数: {len(communities)}")
+    return communities
+
+comm_art = pipe.stage(
+    "louvain", detect_communities,
+    inputs={"G_all": graph_art},
+    params={"resolution": LOUVAIN_RESOLUTION, "seed": LOUVAIN_SEED},
 )
 
-print(f"\n見つかったコミュニティ数: {len(communities)}")
-
-summary_rows = []
-tag_to_comm = {}
-
-for i, comm in enumerate(communities):
-    subG = G_all.subgraph(comm) #サブフラフを作成
-    top_tags = sorted(subG.degree(), key=lambda x: x[1], reverse=True)[:10]
-
-    summary_rows.append({
-        "community_id": i,
-        "num_tags": len(comm),
-        "num_edges": subG.number_of_edges(),
-        "top_tags": ", ".join([t for t, d in top_tags])
-    })
-
-    # tag→community の対応付け
-    for tag in comm:
-        tag_to_comm[tag] = i
+# ---------------------------
+# 6. コミュニティ概要 & タグ→コミュニティ 対応CSV
+# ---------------------------
+def community_tables(G_all, communities, output_dir, st):
+    summary_rows = []
+    tag_to_comm = {}
+
+    for i, comm in enumerate(communities):
+        subG = G_all.subgraph(comm) #サブフラフを作成
+        top_tags = sorted(subG.degree(), key=lambda x: x[1], reverse=True)[:10]
+
+        summary_rows.append({
+            "community_id": i,
+            "num_tags": len(comm),
+            "num_edges": subG.number_of_edges(),
+            "top_tags": ", ".join([t for t, d in top_tags])
+        })
+
+        # tag→community の対応付け
+        for tag in comm:
+            tag_to_comm[tag] = i
+
+    summary_df = pd.DataFrame(summary_rows)
+    summary_df.to_csv(
+        os.path.join(output_dir, "community_summary_louvain.csv"),
+        index=False,
+        encoding="utf-8-sig"
+    )
+    print("\n▼コミュニティ概要（上位タグ）")
+    print(summary_df)
 
-summary_df = pd.DataFrame(summary_rows)
-summary_df.to_csv(
-    os.path.join(OUTPUT_DIR, "community_summary_louvain.csv"),
-    index=False,
-    encoding="utf-8-sig"
+    tag_comm_df = pd.DataFrame(
+        [{"tag": tag, "community_id": comm_id} for tag, comm_id in tag_to_comm.items()]
+    )
+    tag_comm_df.to_csv(
+        os.path.join(output_dir, "tag_communities_all_edges_louvain.csv"),
+        index=False,
+        encoding="utf-8-sig"
+    )
+    st.update(communities=len(summary_df), tags=len(tag_comm_df))
+    return tag_to_comm
+
+tag_comm_art = pipe.stage(
+    "community_tables", community_tables,
+    inputs={"G_all": graph_art, "communities": comm_art},
+    params={"output_dir": OUTPUT_DIR},
+    outputs=[
+        os.path.join(OUTPUT_DIR, "community_summary_louvain.csv"),
+        os.path.join(OUTPUT_DIR, "tag_communities_all_edges_louvain.csv"),
+    ],
 )
-print("\n▼コミュニティ概要（上位タグ）")
-print(summary_df)
 
 # ---------------------------
-# 6. タグ→コミュニティ 対応CSV
+# 6-1. 企業 × タグ の共クラスタリング（COCLUSTER = True のとき。cocluster.py）
+#      tag_communities_cocluster.csv（tag, community_id）・community_summary_cocluster.csv・company_cocluster.csv
+#      時間・ピークRSS は実行レポートの louvain ステージと比べる（別プロセスで測るなら python cocluster.py --benchmark）
 # ---------------------------
-tag_comm_df = pd.DataFrame(
-    [{"tag": tag, "community_id": comm_id} for tag, comm_id in tag_to_comm.items()]
-)
-tag_comm_df.to_csv(
-    os.path.join(OUTPUT_DIR, "tag_communities_all_edges_louvain.csv"),
-    index=False,
-    encoding="utf-8-sig"
+def cocluster_communities(tags, tag_to_comm, k, output_dir, st):
+    k = k or len(set(tag_to_comm.values()))
+    tag_cluster, company_cluster = cocluster(tags, k)
+    summary = write_cocluster(tags, tag_cluster, company_cluster, output_dir)
+
+    # Louvain との一致度（両方でコミュニティが付いたタグだけ）
+    louvain = np.array([tag_to_comm.get(t, -1) for t in tags.vocab.tolist()])
+    both = (louvain >= 0) & (tag_cluster >= 0)
+    st.update(clusters=len(summary), nmi_vs_louvain=round(nmi(louvain[both], tag_cluster[both]), 3))
+    print(f"\n共クラスタ数: {len(summary)}（Louvain との NMI {st['nmi_vs_louvain']}）")
+
+if COCLUSTER:
+    pipe.stage(
+        "cocluster", cocluster_communities,
+        inputs={"tags": tags_art, "tag_to_comm": tag_comm_art},
+        params={"k": COCLUSTER_K, "output_dir": OUTPUT_DIR},
+        outputs=[os.path.join(OUTPUT_DIR, p) for p in (TAG_COMM_CSV, SUMMARY_CSV, COMPANY_CSV)],
+    )
+
+# ---------------------------
+# 6-2. 閾値インデックス（threshold_index.py）
+#      エッジを weight 降順（全体・コミュニティ内ごと）に並べ、「weight >= t」を区間で取れるようにする
+#      あわせて閾値カーブ（全体・コミュニティ別）を CSV に出す
+# ---------------------------
+def threshold_index(edges, tag_to_comm, overall_path, by_comm_path, st):
+    index = build_threshold_index(edges, tag_to_comm)
+    overall, by_comm = write_threshold_curves(index, overall_path, by_comm_path)
+    st.update(edges=len(index), communities=index.n_groups, curve_points=len(overall) + len(by_comm))
+    print(f"\n閾値カーブ CSV 出力: {overall_path}, {by_comm_path}")
+    return index
+
+index_art = pipe.stage(
+    "threshold_index", threshold_index,
+    inputs={"edges": edges_art, "tag_to_comm": tag_comm_art},
+    params={"overall_path": CSV_CURVE_OVERALL, "by_comm_path": CSV_CURVE_BY_COMM},
+    outputs=[CSV_CURVE_OVERALL, CSV_CURVE_BY_COMM],
 )
 
 # ---------------------------
 # 7. 全体ネットワーク（共起100以上のみ）の HTML 可視化（静止）
+#    レイアウト（閾値だけで決まる）と HTML（コミュニティの色分けも使う）は別ステージ
 # ---------------------------
-
-THRESHOLD_OVERALL = 100
-edges_100 = edges[edges["weight"] >= THRESHOLD_OVERALL].copy()
-print(f"\n閾値 {THRESHOLD_OVERALL}以上のエッジ数（可視化対象）: {len(edges_100)}")
-
-# 100以上のエッジだけでグラフを作成（レイアウト用）
-G_100 = nx.Graph()
-for _, row in edges_100.iterrows():
-    G_100.add_edge(row["tag1"], row["tag2"], weight=row["weight"])
-
-# spring_layout でレイアウト計算（静止）
-pos_100 = nx.spring_layout(G_100, seed=0, k=0.3, iterations=80)
-
-# PyVis ネットワーク（物理エンジン OFF）
-net_overall = Network(
-    height="800px",
-    width="100%",
-    bgcolor="#ffffff",
-    font_color="#000000",
-    notebook=False,
-    directed=False
+def layout_overall(edges, index, threshold, st):
+    edges_100 = edges.iloc[index.edge_ids(threshold)].copy()
+    print(f"\n閾値 {threshold}以上のエッジ数（可視化対象）: {len(edges_100)}")
+
+    # 100以上のエッジだけでグラフを作成（レイアウト用）
+    G_100 = nx.Graph()
+    for _, row in edges_100.iterrows():
+        G_100.add_edge(row["tag1"], row["tag2"], weight=row["weight"])
+
+    # spring_layout でレイアウト計算（静止）
+    pos_100 = nx.spring_layout(G_100, seed=0, k=0.3, iterations=80)
+    st.update(nodes=G_100.number_of_nodes(), edges=G_100.number_of_edges())
+    return edges_100, pos_100
+
+layout_art = pipe.stage(
+    "layout_overall", layout_overall,
+    inputs={"edges": edges_art, "index": index_art}, params={"threshold": THRESHOLD_OVERALL},
 )
 
-# physics を完全に停止
-net_overall.set_options("""
-{
-  "physics": {
-    "enabled": false
-  }
-}
-""")
-
-
-# ノード追加（座標固定・コミュニティで色分け）
-for node, (x, y) in pos_100.items():
-    comm_id = tag_to_comm.get(node, -1)
-    net_overall.add_node(
-        node,
-        label=node,
-        x=float(x) * 1000,   # PyVis 用にスケール
-        y=float(y) * 1000,
-        physics=False,       # ノードごとの物理もOFF
-        group=comm_id,
-        title=f"Tag: {node}<br>Community: {comm_id}"
-    )
+def html_overall(layout, tag_to_comm, html_path, st):
+    edges_100, pos_100 = layout
 
-# エッジ追加
-for _, row in edges_100.iterrows():
-    net_overall.add_edge(
-        row["tag1"],
-        row["tag2"],
-        value=row["weight"],  # weight に応じて太さ
-        title=f"共起回数: {row['weight']}"
+    # PyVis ネットワーク（物理エンジン OFF）
+    net_overall = Network(
+        height="800px",
+        width="100%",
+        bgcolor="#ffffff",
+        font_color="#000000",
+        notebook=False,
+        directed=False
     )
 
-# write_html でテンプレートバグ回避 & ブラウザ自動起動なし
-net_overall.write_html(HTML_OVERALL_100, open_browser=False)
-print(f"\n全体ネットワーク HTML 出力: {HTML_OVERALL_100}")
+    # physics を完全に停止
+    net_overall.set_options("""
+    {
+      "physics": {
+        "enabled": false
+      }
+    }
+    """)
+
+
+    # ノード追加（座標固定・コミュニティで色分け）
+    for node, (x, y) in pos_100.items():
+        comm_id = tag_to_comm.get(node, -1)
+        net_overall.add_node(
+            node,
+            label=node,
+            x=float(x) * 1000,   # PyVis 用にスケール
+            y=float(y) * 1000,
+            physics=False,       # ノードごとの物理もOFF
+            group=comm_id,
+            title=f"Tag: {node}<br>Community: {comm_id}"
+        )
+
+    # エッジ追加
+    for _, row in edges_100.iterrows():
+        net_overall.add_edge(
+            row["tag1"],
+            row["tag2"],
+            value=row["weight"],  # weight に応じて太さ
+            title=f"共起回数: {row['weight']}"
+        )
+
+    # write_html でテンプレートバグ回避 & ブラウザ自動起動なし
+    net_overall.write_html(html_path, open_browser=False)
+    st.update(nodes=len(pos_100), edges=len(edges_100))
+    print(f"\n全体ネットワーク HTML 出力: {html_path}")
+
+pipe.stage(
+    "html_overall", html_overall,
+    inputs={"layout": layout_art, "tag_to_comm": tag_comm_art},
+    params={"html_path": HTML_OVERALL_100},
+    outputs=[HTML_OVERALL_100],
+)
 
 # ---------------------------
 # 8. コミュニティ別ネットワーク（閾値なし）HTML出力（静止）
+#    コミュニティごとに別ステージ
 # ---------------------------
-
-# 小さすぎるコミュニティをスキップしたい場合はここを変える
-COMM_MIN_NODES_FOR_HTML = 1  # 例: 5 にするとノード数5未満は出力しない
-
-for i, comm in enumerate(communities):
-    comm_nodes = set(comm)
-    if len(comm_nodes) < COMM_MIN_NODES_FOR_HTML:
-        continue
+def render_community(edges, index, communities, i, html_path, st):
+    comm_nodes = set(communities[i])
 
     # このコミュニティ内のエッジ（両端ノードがコミュニティ内にあるもの全部）
-    edges_comm = edges[
-        edges["tag1"].isin(comm_nodes) & edges["tag2"].isin(comm_nodes)
-    ]
+    edges_comm = edges.iloc[index.edge_ids(group=i)]
 
     print(f"コミュニティ {i}: ノード数={len(comm_nodes)}, エッジ数={len(edges_comm)}")
 
@@ -253,31 +410,139 @@ for i, comm in enumerate(communities):
             title=f"共起回数: {row['weight']}"
         )
 
-    html_path = f"{HTML_COMM_PREFIX}{i}.html"
     net_comm.write_html(html_path, open_browser=False)
+    st.update(nodes=len(pos_comm), edges=len(edges_comm))
     print(f"  → コミュニティ {i} ネットワーク HTML 出力: {html_path}")
 
+communities = comm_art.value
+
+for i, comm in enumerate(communities):
+    if len(set(comm)) < COMM_MIN_NODES_FOR_HTML:
+        continue
+
+    html_path = f"{HTML_COMM_PREFIX}{i}.html"
+    pipe.stage(
+        f"render_community_{i}", render_community,
+        inputs={"edges": edges_art, "index": index_art, "communities": comm_art},
+        params={"i": i, "html_path": html_path},
+        outputs=[html_path],
+    )
+
 # ---------------------------
-# 9. 各企業にコミュニティIDをふる
+# 8-2. 全エッジの段階読み込みビューア（lod_export.py）
+#      引いた表示はコミュニティのスーパーノード、展開・ズームに合わせて weight の階層ごとの JSON を fetch
 # ---------------------------
-def get_comms(tag_list):
-    # その企業のタグのうち、コミュニティに属しているもののID集合
-    return sorted({tag_to_comm[t] for t in tag_list if t in tag_to_comm})
-
-df["コミュニティIDリスト"] = df["タグリスト"].apply(get_comms)
-df["コミュニティIDリスト_str"] = df["コミュニティIDリスト"].apply(
-    lambda li: ",".join(str(x) for x in li)
+def lod_viewer(edges, index, tag_to_comm, out_dir, tier0_edges, chunk_edges, st):
+    os.makedirs(out_dir, exist_ok=True)
+    meta = export_lod(edges, tag_to_comm, out_dir, index=index, tier0_edges=tier0_edges, chunk_edges=chunk_edges)
+    st.update(communities=len(meta["communities"]), tiers=len(meta["tiers"]))
+    print(f"\n段階読み込みビューア 出力: {os.path.join(out_dir, VIEWER_HTML)}（階層 {len(meta['tiers'])}）")
+
+pipe.stage(
+    "lod_viewer", lod_viewer,
+    inputs={"edges": edges_art, "index": index_art, "tag_to_comm": tag_comm_art},
+    params={"out_dir": LOD_DIR, "tier0_edges": LOD_TIER0_EDGES, "chunk_edges": LOD_CHUNK_EDGES},
+    outputs=[os.path.join(LOD_DIR, INDEX_JSON), os.path.join(LOD_DIR, VIEWER_HTML)],
 )
 
-df.to_csv(
-    os.path.join(OUTPUT_DIR, "startups_with_communities_louvain.csv"),
-    index=False,
-    encoding="utf-8-sig"
+# ---------------------------
+# 9. タグ構成の似た企業・重複候補（MinHash + LSH。全企業×全企業の比較はしない）
+# ---------------------------
+def similar_companies(tags, top_k, min_jaccard, dup_threshold, pairs_path, st):
+    lsh = MinHashLSH(tags)
+    offsets, rows, jac = lsh.top_k(k=top_k, threshold=min_jaccard)
+    pairs, dup_group = lsh.near_duplicates(dup_threshold)
+    pairs.to_csv(pairs_path, index=False, encoding="utf-8-sig")
+    st.update(
+        tag_sets=lsh.n_sets,
+        duplicate_pairs=len(pairs),
+        duplicate_groups=int(dup_group.max(initial=-1)) + 1,
+        companies_in_duplicate_groups=int((dup_group >= 0).sum()),
+    )
+    print(f"重複候補（Jaccard >= {dup_threshold}）: {len(pairs)} 組 → {pairs_path}")
+    # startups_with_communities_louvain.csv に足す列（行 = 入力CSVの行）
+    return pd.DataFrame({
+        "類似企業_行番号": [",".join(str(x) for x in li) for li in ragged_lists(offsets, rows)],
+        "類似企業_Jaccard": [",".join(f"{x:.3f}" for x in li) for li in ragged_lists(offsets, jac)],
+        "重複グループID": dup_group,
+    })
+
+similar_art = pipe.stage(
+    "similar_companies", similar_companies,
+    inputs={"tags": tags_art},
+    params={
+        "top_k": SIMILAR_TOP_K,
+        "min_jaccard": SIMILAR_MIN_JACCARD,
+        "dup_threshold": DUPLICATE_JACCARD,
+        "pairs_path": CSV_NEAR_DUP,
+    },
+    outputs=[CSV_NEAR_DUP],
 )
 
+# ---------------------------
+# 10. 各企業にコミュニティIDをふる
+# ---------------------------
+def assign_companies(df, tags, communities, tag_to_comm, similar, output_dir, parquet_path, st):
+    # tag id → community id（コミュニティに属さないタグは -1）
+    tag_comm = np.full(tags.n_tags, -1, dtype=np.int64)
+    tag_comm[tags.lookup(tag_to_comm.keys())] = list(tag_to_comm.values())
+
+    # その企業のタグのうち、コミュニティに属しているもののID集合（昇順）
+    comm_offsets, comm_ids = assign_groups(tags, tag_comm, n_groups=len(communities))
+    # 代表コミュニティ（その企業のタグが一番多く属するコミュニティ）。company_cube.py の primary 集計用
+    primary_comm = primary_group(tags, tag_comm, len(communities))
+    comm_lists = ragged_lists(comm_offsets, comm_ids)
+
+    df = df.assign(
+        タグリスト=tags.to_lists(),
+        コミュニティIDリスト=comm_lists,
+        コミュニティIDリスト_str=[",".join(str(x) for x in li) for li in comm_lists],
+    )
+    # 似た企業（行番号は入力CSVの行 = この表の行）・重複グループ
+    df = pd.concat([df, similar.set_axis(df.index)], axis=1)
+
+    df.to_csv(
+        os.path.join(output_dir, "startups_with_communities_louvain.csv"),
+        index=False,
+        encoding="utf-8-sig"
+    )
+
+    # main_community.py 用：(company_row, community_id) のロング形式（型付き・列指定で読める）
+    wrote_comm_parquet = write_company_communities(
+        parquet_path, comm_offsets, comm_ids, primary=primary_comm
+    )
+    st.update(
+        companies=len(df),
+        companies_with_community=int((np.diff(comm_offsets) > 0).sum()),
+        memberships=len(comm_ids),
+        parquet=wrote_comm_parquet,
+    )
+    return wrote_comm_parquet
+
+wrote_comm_parquet = pipe.stage(
+    "assign_companies", assign_companies,
+    inputs={
+        "df": df_art, "tags": tags_art, "communities": comm_art, "tag_to_comm": tag_comm_art,
+        "similar": similar_art,
+    },
+    params={"output_dir": OUTPUT_DIR, "parquet_path": os.path.join(OUTPUT_DIR, COMPANY_COMM_PARQUET)},
+    outputs=[
+        os.path.join(OUTPUT_DIR, "startups_with_communities_louvain.csv"),
+        os.path.join(OUTPUT_DIR, COMPANY_COMM_PARQUET),
+    ],
+).value
+
 print("\n=== 完了!! ===")
 print(f"・タグ×コミュニティ → {os.path.join(OUTPUT_DIR, 'tag_communities_all_edges_louvain.csv')}")
 print(f"・企業×コミュニティ → {os.path.join(OUTPUT_DIR, 'startups_with_communities_louvain.csv')}")
+if wrote_comm_parquet:
+    print(f"・企業×コミュニティ（ロング形式） → {os.path.join(OUTPUT_DIR, COMPANY_COMM_PARQUET)}")
 print(f"・コミュニティ概要 → {os.path.join(OUTPUT_DIR, 'community_summary_louvain.csv')}")
 print(f"・全体ネットワーク(共起>= {THRESHOLD_OVERALL}) → {HTML_OVERALL_100}")
 print(f"・コミュニティ別ネットワーク → {HTML_COMM_PREFIX}{{community_id}}.html")
+print(f"・閾値カーブ → {CSV_CURVE_OVERALL}, {CSV_CURVE_BY_COMM}")
+print(f"・全エッジの段階読み込みビューア → {os.path.join(LOD_DIR, VIEWER_HTML)}（python -m http.server --directory {LOD_DIR}）")
+if COCLUSTER:
+    print(f"・共クラスタリング（タグ / 企業） → {os.path.join(OUTPUT_DIR, TAG_COMM_CSV)}, {os.path.join(OUTPUT_DIR, COMPANY_CSV)}")
+print(f"・重複候補（Jaccard >= {DUPLICATE_JACCARD}） → {CSV_NEAR_DUP}")
+print(f"・実行レポート → {report.finish()}")
@@ -4,15 +4,26 @@
 #  - 全体ネットワーク：共起100以上のみ表示（静止・ドラッグ不可）
 #  - コミュニティ別ネットワーク：共起30以上のみ表示（静止・ドラッグ不可）
 #  - 出力形式：PyVis HTML
+#  - 各処理はステージ（pipeline.py）。パラメータ・入力が変わったステージとその下流だけ再実行
+#    例）THRESHOLD_OVERALL → 全体 HTML だけ、COMM_EDGE_THRESHOLD_BY_COMM の1件 → そのコミュニティだけ
 # ========================================
 
+import os
+import tempfile
+
+import numpy as np
 import pandas as pd
-from itertools import combinations
-from collections import Counter
 import networkx as nx
 from pyvis.network import Network
 from networkx.algorithms.community import louvain_communities
 
+from tag_parse import REMOVE_TAGS, parse_tags, count_pairs, assign_groups, primary_group, ragged_lists, save_table
+from community_io import COMPANY_COMM_PARQUET, write_company_communities
+from run_report import RunReport
+from pipeline import Pipeline, run_script
+from threshold_index import build_threshold_index, write_threshold_curves
+from edge_significance import edge_significance
+
 # ---------------------------
 # 0. ファイルパス・パラメータ
 # ---------------------------
@@ -21,6 +32,15 @@ DATA_PATH = "/Users/monetanikawa/startup_location_analysis/python_project_startu
 HTML_OVERALL_100 = "cooccurrence_network_overall_100plus_static.html"
 HTML_COMM_PREFIX = "cooccurrence_network_community_"  # + {id}.html
 
+# 閾値カーブ（閾値ごとのノード数・エッジ数・連結成分数）。閾値を決めるときに見る
+CSV_CURVE_OVERALL = "threshold_curve_overall.csv"
+CSV_CURVE_BY_COMM = "threshold_curve_by_community.csv"
+
+# 共起エッジの有意性（超幾何分布の z・p・BH の q。edge_significance.py）
+CSV_EDGE_SIGNIFICANCE = "edge_significance.csv"
+NULL_MODEL_SAMPLES = 0  # > 0 にすると curveball ランダム化もこの回数行う（別プロセス・並列）
+NULL_MODEL_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+
 # 全体ネットワーク表示用の閾値
 THRESHOLD_OVERALL = 100
 
@@ -38,184 +58,293 @@ COMM_EDGE_THRESHOLD_BY_COMM = {
 # 小さすぎるコミュニティをスキップする場合の最小ノード数
 COMM_MIN_NODES_FOR_HTML = 1  # 例: 5 にするとノード数5未満は出力しない
 
+# Louvain のパラメータ
+LOUVAIN_RESOLUTION = 1.0
+LOUVAIN_SEED = 0
+
+# 頻出アイテムセット（3〜5個のタグの組み合わせ。itemsets.py を別プロセスで実行）
+CSV_ITEMSETS = "tag_itemsets.csv"
+ITEMSET_MIN_SUPPORT = 0.005  # 全企業に対する割合（1 以上なら企業数）
+ITEMSET_MIN_LEN = 3
+ITEMSET_MAX_LEN = 5
+ITEMSET_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+
+# 実行レポート（各ステージの時間・メモリ・件数）→ run_reports/co_occurrence_new_<日時>.json
+report = RunReport("co_occurrence_new", params={
+    "data_path": DATA_PATH,
+    "remove_tags": REMOVE_TAGS,
+    "threshold_overall": THRESHOLD_OVERALL,
+    "comm_edge_threshold_default": COMM_EDGE_THRESHOLD_DEFAULT,
+    "comm_edge_threshold_by_comm": COMM_EDGE_THRESHOLD_BY_COMM,
+    "comm_min_nodes_for_html": COMM_MIN_NODES_FOR_HTML,
+    "louvain_resolution": LOUVAIN_RESOLUTION,
+    "louvain_seed": LOUVAIN_SEED,
+    "null_model_samples": NULL_MODEL_SAMPLES,
+    "itemset_min_support": ITEMSET_MIN_SUPPORT,
+    "itemset_len": [ITEMSET_MIN_LEN, ITEMSET_MAX_LEN],
+    "layout": {"overall": "kamada_kawai_layout", "community": "spring_layout(seed=0, k=0.3, iterations=80)"},
+})
+
+# 中間成果物は .pipeline_cache/co_occurrence_new/ に保存
+pipe = Pipeline("co_occurrence_new", report=report)
+
 
 # ---------------------------
 # 1. データ読み込み
 # ---------------------------
-df = pd.read_csv(DATA_PATH, encoding="utf-8-sig")
+def load_csv(csv, st):
+    df = pd.read_csv(csv, encoding="utf-8-sig")
+    st["rows"] = len(df)
+    return df
+
+df_art = pipe.stage("load_csv", load_csv, files={"csv": DATA_PATH})
 
 # ---------------------------
-# 2. タグ列をリスト化
+# 2. タグ列を tag id の ragged array に（REMOVE_TAGS の事業形態タグは除く）
 # ---------------------------
-df["タグリスト"] = df["タグ"].fillna("").apply(
-    lambda x: [t.strip() for t in str(x).split(",") if t.strip() != ""]
-)
-
-REMOVE_TAGS={
-  # 事業形態
-  "B2B","BtoB","B2C","BtoC","CtoC","D2C"}
-def clean_tags(x):
-    tags = [t.strip() for t in str(x).split(",") if t.strip()]
-    tags = [t for t in tags if t not in REMOVE_TAGS]
+def parse_tag_col(df, remove_tags, st):
+    tags = parse_tags(df["タグ"], remove_tags=remove_tags)
+    st.update(rows=tags.n_rows, tags=tags.n_tags, tag_occurrences=len(tags.ids))
+    print(f"ユニークタグ数: {tags.n_tags}, 延べタグ数: {len(tags.ids)}")
     return tags
 
-df["タグリスト"] = df["タグ"].fillna("").apply(clean_tags)
+tags_art = pipe.stage(
+    "parse_tags", parse_tag_col, inputs={"df": df_art}, params={"remove_tags": REMOVE_TAGS}
+)
 
 
 # ---------------------------
 # 3. 同じ企業内のタグ組を作り、共起回数を数える
 # ---------------------------
-co_counts = Counter()
+def count_edges(tags, st):
+    # 企業内の重複タグを消して、2つ組の全てを id のまま数える
+    tag1_ids, tag2_ids, co_weights = count_pairs(tags)
+
+    # DataFrameへ変換（全エッジ）
+    edges = pd.DataFrame({
+        "tag1": tags.vocab[tag1_ids],
+        "tag2": tags.vocab[tag2_ids],
+        "weight": co_weights,
+    })
+    st["edges"] = len(edges)
 
-for tags in df["タグリスト"]:
-    unique_tags = sorted(set(tags))          # 企業内の重複タグを消す
-    for pair in combinations(unique_tags, 2):  # 2つ組の全てを作る
-        co_counts[pair] += 1                  # 共起回数をカウント
+    print("▼共起回数 上位10件")
+    print(edges.sort_values("weight", ascending=False).head(10))
+    print(f"\n全エッジ数: {len(edges)}")
+    return edges
 
-# DataFrameへ変換（全エッジ）
-edges = pd.DataFrame(
-    [(a, b, w) for (a, b), w in co_counts.items()],
-    columns=["tag1", "tag2", "weight"]
-)
+edges_art = pipe.stage("count_pairs", count_edges, inputs={"tags": tags_art})
 
-print("▼共起回数 上位10件")
-print(edges.sort_values("weight", ascending=False).head(10))
-print(f"\n全エッジ数: {len(edges)}")
+# ---------------------------
+# 3-2. 共起の有意性（共起回数が、タグの企業数から期待される値よりどれだけ多いか）
+# ---------------------------
+def significance(tags, edges, samples, workers, out_path, st):
+    null = None
+    if samples > 0:
+        with tempfile.TemporaryDirectory() as tmp:
+            tags_path = os.path.join(tmp, "tags.npz")
+            null_path = os.path.join(tmp, "null.npz")
+            save_table(tags_path, tags)
+            run_script(
+                "edge_significance.py",
+                "--tags", tags_path,
+                "--out", null_path,
+                "--samples", samples,
+                "--workers", workers,
+            )
+            with np.load(null_path) as z:
+                null = (z["keys"], z["null_mean"], z["null_sd"], z["n_ge"])
+
+    sig = edge_significance(tags, edges, null, samples)
+    sig.to_csv(out_path, index=False, encoding="utf-8-sig")
+    st.update(edges=len(sig), significant_q05=int((sig["q_hypergeom"] < 0.05).sum()), samples=samples)
+    print(f"有意な共起（超幾何 q < 0.05）: {st['significant_q05']} / {len(sig)} → {out_path}")
+
+pipe.stage(
+    "significance", significance,
+    inputs={"tags": tags_art, "edges": edges_art},
+    params={
+        "samples": NULL_MODEL_SAMPLES,
+        "workers": NULL_MODEL_WORKERS,
+        "out_path": CSV_EDGE_SIGNIFICANCE,
+    },
+    outputs=[CSV_EDGE_SIGNIFICANCE],
+)
 
 # ---------------------------
 # 4. NetworkXで「全エッジ」のグラフ構築
 # ---------------------------
-G_all = nx.Graph()
-for _, row in edges.iterrows():
-    G_all.add_edge(row["tag1"], row["tag2"], weight=row["weight"])
+def build_graph(edges, st):
+    G_all = nx.Graph()
+    for _, row in edges.iterrows():
+        G_all.add_edge(row["tag1"], row["tag2"], weight=row["weight"])
+    st.update(nodes=G_all.number_of_nodes(), edges=G_all.number_of_edges())
 
-print(f"全体グラフ ノード数: {G_all.number_of_nodes()}")
-print(f"全体グラフ エッジ数: {G_all.number_of_edges()}")
+    print(f"全体グラフ ノード数: {G_all.number_of_nodes()}")
+    print(f"全体グラフ エッジ数: {G_all.number_of_edges()}")
+    return G_all
+
+graph_art = pipe.stage("build_graph", build_graph, inputs={"edges": edges_art})
 
 # ---------------------------
 # 5. Louvain法でコミュニティ検出（全エッジ使用）
 # ---------------------------
-communities = list(
-    louvain_communities(G_all, weight="weight", resolution=1.0, seed=0)
+def detect_communities(G_all, resolution, seed, st):
+    # set のままだと読み戻したときに並びが変わるので、検出時の並びを list で持つ
+    communities = [
+        list(c) for c in louvain_communities(G_all, weight="weight", resolution=resolution, seed=seed)
+    ]
+    st["communities"] = len(communities)
+    print(f"\n見つかったコミュニティ数: {len(communities)}")
+    return communities
+
+comm_art = pipe.stage(
+    "louvain", detect_communities,
+    inputs={"G_all": graph_art},
+    params={"resolution": LOUVAIN_RESOLUTION, "seed": LOUVAIN_SEED},
 )
 
-print(f"\n見つかったコミュニティ数: {len(communities)}")
+def community_tables(G_all, communities, st):
+    summary_rows = []
+    tag_to_comm = {}
 
-summary_rows = []
-tag_to_comm = {}
+    for i, comm in enumerate(communities):
+        subG = G_all.subgraph(comm)
+        top_tags = sorted(subG.degree(), key=lambda x: x[1], reverse=True)[:10]
 
-for i, comm in enumerate(communities):
-    subG = G_all.subgraph(comm)
-    top_tags = sorted(subG.degree(), key=lambda x: x[1], reverse=True)[:10]
-
-    summary_rows.append({
-        "community_id": i,
-        "num_tags": len(comm),
-        "num_edges": subG.number_of_edges(),
-        "top_tags": ", ".join([t for t, d in top_tags])
-    })
+        summary_rows.append({
+            "community_id": i,
+            "num_tags": len(comm),
+            "num_edges": subG.number_of_edges(),
+            "top_tags": ", ".join([t for t, d in top_tags])
+        })
 
-    for tag in comm:
-        tag_to_comm[tag] = i
+        for tag in comm:
+            tag_to_comm[tag] = i
 
-summary_df = pd.DataFrame(summary_rows)
-print("\n▼コミュニティ概要（上位タグ）")
-print(summary_df)
+    summary_df = pd.DataFrame(summary_rows)
+    print("\n▼コミュニティ概要（上位タグ）")
+    print(summary_df)
 
-summary_df.to_csv("community_summary_louvain.csv", index=False, encoding="utf-8-sig")
+    summary_df.to_csv("community_summary_louvain.csv", index=False, encoding="utf-8-sig")
 
-# タグ→コミュニティ 対応CSV
-tag_comm_df = pd.DataFrame(
-    [{"tag": tag, "community_id": comm_id} for tag, comm_id in tag_to_comm.items()]
+    # タグ→コミュニティ 対応CSV
+    tag_comm_df = pd.DataFrame(
+        [{"tag": tag, "community_id": comm_id} for tag, comm_id in tag_to_comm.items()]
+    )
+    tag_comm_df.to_csv("tag_communities_all_edges_louvain.csv", index=False, encoding="utf-8-sig")
+    st.update(communities=len(summary_df), tags=len(tag_comm_df))
+    return tag_to_comm
+
+tag_comm_art = pipe.stage(
+    "community_tables", community_tables,
+    inputs={"G_all": graph_art, "communities": comm_art},
+    outputs=["community_summary_louvain.csv", "tag_communities_all_edges_louvain.csv"],
 )
-tag_comm_df.to_csv("tag_communities_all_edges_louvain.csv", index=False, encoding="utf-8-sig")
 
 # ---------------------------
-# 6. 全体ネットワーク（共起100以上）HTML可視化（静止・ドラッグ不可）
+# 5-2. 閾値インデックス（threshold_index.py）
+#      エッジを weight 降順（全体・コミュニティ内ごと）に並べ、「weight >= t」を区間で取れるようにする
+#      あわせて閾値カーブ（全体・コミュニティ別）を CSV に出す
 # ---------------------------
-
-edges_100 = edges[edges["weight"] >= THRESHOLD_OVERALL].copy()
-print(f"\n閾値 {THRESHOLD_OVERALL}以上のエッジ数（可視化対象）: {len(edges_100)}")
-
-# 100以上のエッジだけでグラフを作成（レイアウト計算用）
-G_100 = nx.Graph()
-for _, row in edges_100.iterrows():
-    G_100.add_edge(row["tag1"], row["tag2"], weight=row["weight"])
-
-# レイアウト計算（重なりをある程度減らすために kamada_kawai_layout を使用）
-if G_100.number_of_nodes() > 0:
-    pos_100 = nx.kamada_kawai_layout(G_100)
-else:
-    pos_100 = {}
-
-net_overall = Network(
-    height="900px",
-    width="100%",
-    bgcolor="#ffffff",
-    font_color="#000000",
-    notebook=False,
-    directed=False
+def threshold_index(edges, tag_to_comm, overall_path, by_comm_path, st):
+    index = build_threshold_index(edges, tag_to_comm)
+    overall, by_comm = write_threshold_curves(index, overall_path, by_comm_path)
+    st.update(edges=len(index), communities=index.n_groups, curve_points=len(overall) + len(by_comm))
+    print(f"\n閾値カーブ CSV 出力: {overall_path}, {by_comm_path}")
+    return index
+
+index_art = pipe.stage(
+    "threshold_index", threshold_index,
+    inputs={"edges": edges_art, "tag_to_comm": tag_comm_art},
+    params={"overall_path": CSV_CURVE_OVERALL, "by_comm_path": CSV_CURVE_BY_COMM},
+    outputs=[CSV_CURVE_OVERALL, CSV_CURVE_BY_COMM],
 )
 
-# 物理エンジンOFF＋ノードドラッグ禁止
-net_overall.set_options("""
-{
-  "physics": { "enabled": false },
-  "interaction": { "dragNodes": false },
-  "layout": { "improvedLayout": false }
-}
-""")
-
-# ノード追加（座標固定・コミュニティ色分け・ドラッグ不可）
-for node, (x, y) in pos_100.items():
-    comm_id = tag_to_comm.get(node, -1)
-    net_overall.add_node(
-        node,
-        label=node,
-        group=comm_id, #com_idでPyvisのよって自動的に色分けされている
-        title=f"Tag: {node}<br>Community: {comm_id}",
-        x=float(x) * 1000,
-        y=float(y) * 1000,
-        physics=False,
-        fixed=True           # ← ドラッグしても動かない
+# ---------------------------
+# 6. 全体ネットワーク（共起100以上）HTML可視化（静止・ドラッグ不可）
+# ---------------------------
+def render_overall(edges, index, tag_to_comm, threshold, html_path, st):
+    edges_100 = edges.iloc[index.edge_ids(threshold)].copy()
+    print(f"\n閾値 {threshold}以上のエッジ数（可視化対象）: {len(edges_100)}")
+
+    # 100以上のエッジだけでグラフを作成（レイアウト計算用）
+    G_100 = nx.Graph()
+    for _, row in edges_100.iterrows():
+        G_100.add_edge(row["tag1"], row["tag2"], weight=row["weight"])
+
+    # レイアウト計算（重なりをある程度減らすために kamada_kawai_layout を使用）
+    if G_100.number_of_nodes() > 0:
+        pos_100 = nx.kamada_kawai_layout(G_100)
+    else:
+        pos_100 = {}
+
+    net_overall = Network(
+        height="900px",
+        width="100%",
+        bgcolor="#ffffff",
+        font_color="#000000",
+        notebook=False,
+        directed=False
     )
 
-# エッジ追加
-for _, row in edges_100.iterrows():
-    net_overall.add_edge(
-        row["tag1"],
-        row["tag2"],
-        value=row["weight"],
-        title=f"共起回数: {row['weight']}"
-    )
+    # 物理エンジンOFF＋ノードドラッグ禁止
+    net_overall.set_options("""
+    {
+      "physics": { "enabled": false },
+      "interaction": { "dragNodes": false },
+      "layout": { "improvedLayout": false }
+    }
+    """)
+
+    # ノード追加（座標固定・コミュニティ色分け・ドラッグ不可）
+    for node, (x, y) in pos_100.items():
+        comm_id = tag_to_comm.get(node, -1)
+        net_overall.add_node(
+            node,
+            label=node,
+            group=comm_id, #com_idでPyvisのよって自動的に色分けされている
+            title=f"Tag: {node}<br>Community: {comm_id}",
+            x=float(x) * 1000,
+            y=float(y) * 1000,
+            physics=False,
+            fixed=True           # ← ドラッグしても動かない
+        )
 
-net_overall.write_html(HTML_OVERALL_100, open_browser=False)
-print(f"\n全体ネットワーク HTML 出力: {HTML_OVERALL_100}")
+    # エッジ追加
+    for _, row in edges_100.iterrows():
+        net_overall.add_edge(
+            row["tag1"],
+            row["tag2"],
+            value=row["weight"],
+            title=f"共起回数: {row['weight']}"
+        )
+
+    net_overall.write_html(html_path, open_browser=False)
+    st.update(nodes=len(pos_100), edges=len(edges_100))
+    print(f"\n全体ネットワーク HTML 出力: {html_path}")
+
+pipe.stage(
+    "render_overall", render_overall,
+    inputs={"edges": edges_art, "index": index_art, "tag_to_comm": tag_comm_art},
+    params={"threshold": THRESHOLD_OVERALL, "html_path": HTML_OVERALL_100},
+    outputs=[HTML_OVERALL_100],
+)
 
 # ---------------------------
 # 7. コミュニティ別ネットワーク（コミュニティごとの閾値で表示）HTML出力（静止・ドラッグ不可）
+#    コミュニティごとに別ステージ（閾値を変えたコミュニティだけ作り直す）
 # ---------------------------
-
-for i, comm in enumerate(communities):
-    if len(comm) < COMM_MIN_NODES_FOR_HTML:
-        continue
-
+def render_community(edges, index, communities, i, thr, html_path, st):
+    comm = communities[i]
     comm_nodes = set(comm)
 
-    # 🔸このコミュニティ i に対して使う閾値を決める
-    #   辞書にあればその値、なければデフォルト（30）
-    thr = COMM_EDGE_THRESHOLD_BY_COMM.get(i, COMM_EDGE_THRESHOLD_DEFAULT)
-
-    # このコミュニティ内のエッジのうち、weight >= thr のものだけ
-    edges_comm = edges[
-        (edges["tag1"].isin(comm_nodes)) &
-        (edges["tag2"].isin(comm_nodes)) &
-        (edges["weight"] >= thr)
-    ]
+    # このコミュニティ内のエッジのうち、weight >= thr のものだけ（インデックスの区間）
+    edges_comm = edges.iloc[index.edge_ids(thr, group=i)]
 
     if edges_comm.empty:
         print(f"コミュニティ {i}: weight >= {thr} のエッジなし → スキップ")
-        continue
+        return
 
     print(f"コミュニティ {i}: 閾値={thr}, ノード数={len(comm_nodes)}, エッジ数={len(edges_comm)}")
 
@@ -229,10 +358,7 @@ for i, comm in enumerate(communities):
 
     print(f"コミュニティ {i}: 閾値={thr}, ノード数={len(comm_nodes)}, エッジ数={len(edges_comm)}")
 
-    edges_comm_all = edges[
-        (edges["tag1"].isin(comm_nodes)) &
-        (edges["tag2"].isin(comm_nodes))
-    ]
+    edges_comm_all = edges.iloc[index.edge_ids(group=i)]
 
     edges_comm_all_out = edges_comm_all.copy()
     edges_comm_all_out["community_id"] = i
@@ -287,31 +413,113 @@ for i, comm in enumerate(communities):
             title=f"共起回数: {row['weight']}"
         )
 
-    html_path = f"{HTML_COMM_PREFIX}{i}.html"
     net_comm.write_html(html_path, open_browser=False)
+    st.update(threshold=thr, nodes=len(pos_comm), edges=len(edges_comm))
     print(f"  → コミュニティ {i} ネットワーク HTML 出力: {html_path}")
 
+communities = comm_art.value
+
+for i, comm in enumerate(communities):
+    if len(comm) < COMM_MIN_NODES_FOR_HTML:
+        continue
+
+    # 🔸このコミュニティ i に対して使う閾値を決める
+    #   辞書にあればその値、なければデフォルト（30）
+    thr = COMM_EDGE_THRESHOLD_BY_COMM.get(i, COMM_EDGE_THRESHOLD_DEFAULT)
+    html_path = f"{HTML_COMM_PREFIX}{i}.html"
+
+    pipe.stage(
+        f"render_community_{i}", render_community,
+        inputs={"edges": edges_art, "index": index_art, "communities": comm_art},
+        params={"i": i, "thr": thr, "html_path": html_path},
+        outputs=[f"community_{i}_edges_thr{thr}.csv", f"community_{i}_edges_all.csv", html_path],
+    )
+
 # ---------------------------
 # 8. 各企業にコミュニティIDをふる
 # ---------------------------
-def get_comms(tag_list):
-    # その企業のタグのうち、コミュニティに属しているもののID集合
-    return sorted({tag_to_comm[t] for t in tag_list if t in tag_to_comm})
+def assign_companies(df, tags, communities, tag_to_comm, parquet_path, st):
+    # tag id → community id（コミュニティに属さないタグは -1）
+    tag_comm = np.full(tags.n_tags, -1, dtype=np.int64)
+    tag_comm[tags.lookup(tag_to_comm.keys())] = list(tag_to_comm.values())
+
+    # その企業のタグのうち、コミュニティに属しているもののID集合（昇順）
+    comm_offsets, comm_ids = assign_groups(tags, tag_comm, n_groups=len(communities))
+    # 代表コミュニティ（その企業のタグが一番多く属するコミュニティ）。company_cube.py の primary 集計用
+    primary_comm = primary_group(tags, tag_comm, len(communities))
+    comm_lists = ragged_lists(comm_offsets, comm_ids)
+
+    df = df.assign(
+        タグリスト=tags.to_lists(),
+        コミュニティIDリスト=comm_lists,
+        コミュニティIDリスト_str=[",".join(str(x) for x in li) for li in comm_lists],
+    )
 
-df["コミュニティIDリスト"] = df["タグリスト"].apply(get_comms)
-df["コミュニティIDリスト_str"] = df["コミュニティIDリスト"].apply(
-    lambda li: ",".join(str(x) for x in li)
-)
+    df.to_csv("startups_with_communities_louvain.csv", index=False, encoding="utf-8-sig")
+
+    # main_community.py 用：(company_row, community_id) のロング形式（型付き・列指定で読める）
+    wrote_comm_parquet = write_company_communities(parquet_path, comm_offsets, comm_ids, primary=primary_comm)
+    st.update(
+        companies=len(df),
+        companies_with_community=int((np.diff(comm_offsets) > 0).sum()),
+        memberships=len(comm_ids),
+        parquet=wrote_comm_parquet,
+    )
+    return wrote_comm_parquet
 
-df.to_csv("startups_with_communities_louvain.csv", index=False, encoding="utf-8-sig")
+wrote_comm_parquet = pipe.stage(
+    "assign_companies", assign_companies,
+    inputs={"df": df_art, "tags": tags_art, "communities": comm_art, "tag_to_comm": tag_comm_art},
+    params={"parquet_path": COMPANY_COMM_PARQUET},
+    outputs=["startups_with_communities_louvain.csv", COMPANY_COMM_PARQUET],
+).value
+
+# ---------------------------
+# 9. 頻出アイテムセット（タグ3〜5個の組み合わせ・support・lift）
+# ---------------------------
+def mine_itemsets(tags, min_support, min_len, max_len, workers, out_path, st):
+    # パース済みの tags をそのまま渡す（CSV を読み直さない）
+    with tempfile.TemporaryDirectory() as tmp:
+        tags_path = os.path.join(tmp, "tags.npz")
+        save_table(tags_path, tags)
+        run_script(
+            "itemsets.py",
+            "--tags", tags_path,
+            "--out", out_path,
+            "--min-support", min_support,
+            "--min-len", min_len,
+            "--max-len", max_len,
+            "--workers", workers,
+        )
+    lengths = pd.read_csv(out_path, usecols=["length"], encoding="utf-8-sig")["length"]
+    st.update(itemsets=len(lengths), by_length={int(k): int(v) for k, v in lengths.value_counts().sort_index().items()})
+
+pipe.stage(
+    "itemsets", mine_itemsets,
+    inputs={"tags": tags_art},
+    params={
+        "min_support": ITEMSET_MIN_SUPPORT,
+        "min_len": ITEMSET_MIN_LEN,
+        "max_len": ITEMSET_MAX_LEN,
+        "workers": ITEMSET_WORKERS,
+        "out_path": CSV_ITEMSETS,
+    },
+    outputs=[CSV_ITEMSETS],
+)
 
 print("\n=== 完了!! ===")
 print("・タグ×コミュニティ → tag_communities_all_edges_louvain.csv")
 print("・企業×コミュニティ → startups_with_communities_louvain.csv")
+if wrote_comm_parquet:
+    print(f"・企業×コミュニティ（ロング形式） → {COMPANY_COMM_PARQUET}")
 print("・コミュニティ概要 → community_summary_louvain.csv")
 print(f"・全体ネットワーク(共起>= {THRESHOLD_OVERALL}) → {HTML_OVERALL_100}")
 print(f"・コミュニティ別ネットワーク → {HTML_COMM_PREFIX}{{community_id}}.html")
+print(f"・閾値カーブ → {CSV_CURVE_OVERALL}, {CSV_CURVE_BY_COMM}")
+print(f"・共起の有意性（z・p・q） → {CSV_EDGE_SIGNIFICANCE}")
+print(f"・頻出アイテムセット（タグ{ITEMSET_MIN_LEN}〜{ITEMSET_MAX_LEN}個） → {CSV_ITEMSETS}")
 print("\n--- コミュニティ別ネットワーク閾値一覧 ---")
 for i, comm in enumerate(communities):
     thr = COMM_EDGE_THRESHOLD_BY_COMM.get(i, COMM_EDGE_THRESHOLD_DEFAULT)
     print(f"  Community {i}: threshold = {thr} → {HTML_COMM_PREFIX}{i}.html")
+print(f"\n・実行レポート → {report.finish()}")
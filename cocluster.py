@@ -0,0 +1,338 @@
+# ========================================
+# 企業 × タグ の共クラスタリング（タグ×タグの共起グラフを作らないコミュニティ検出）
+#  - Louvain（co_occurrence*.py）は共起ペア → G_all を作ってから分けるので、
+#    エッジ数が企業ごとのタグ数の2乗で増え、企業のコミュニティはタグ経由（assign_groups）でしか付かない
+#  - ここでは TagTable（offsets + ids）をそのまま疎な行列 A（企業 × タグ、0/1）として扱う
+#    スペクトル共クラスタリング（Dhillon 2001）:
+#      An = Dr^{-1/2} A Dc^{-1/2}（Dr：企業ごとのタグ数、Dc：タグごとの企業数）
+#      An の特異ベクトル 2〜(n_components + 1) 番目を randomized SVD で求める（A・Aᵀ との積は bincount だけ）
+#      Z = [Dr^{-1/2} U ; Dc^{-1/2} V] の行（企業とタグ）を一緒に mini-batch k-means で k 個に分ける
+#    → 同じクラスタ id が、タグのクラスタ（tag_communities_*.csv と同じ tag, community_id）と
+#      企業のクラスタ（企業ごとに1つ、直接のラベル）になる
+#  - メモリは 企業数 × タグ数 の非ゼロ数 + (企業数 + タグ数) × 次元数 程度
+#
+#  co_occurrence.py から自動で呼ばれる（COCLUSTER = True のとき）。単体でも実行可:
+#    python cocluster.py --csv <CSV> --k 20 --out-dir cocluster_output
+#  Louvain の経路（共起ペア → G_all → louvain_communities）との実行時間・ピークRSS の比較（それぞれ別プロセス）:
+#    python cocluster.py --csv <CSV> --k 20 --benchmark
+# ========================================
+
+import argparse
+import math
+import multiprocessing as mp
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from community_io import write_company_communities
+from run_report import peak_rss_mb
+from tag_parse import REMOVE_TAGS, parse_tags, count_pairs
+
+TAG_COMM_CSV = "tag_communities_cocluster.csv"
+SUMMARY_CSV = "community_summary_cocluster.csv"
+COMPANY_CSV = "company_cocluster.csv"
+COMPANY_PARQUET = "company_communities_cocluster.parquet"
+BENCHMARK_CSV = "cocluster_benchmark.csv"
+
+BATCH_SIZE = 4096  # mini-batch k-means の1バッチの点数
+
+
+# ---------------------------
+# 1. 疎行列の積（TagTable の ragged をそのまま使う）
+# ---------------------------
+class Incidence:
+    """
+    企業 × タグ の 0/1 行列を正規化したもの（An = Dr^{-1/2} A Dc^{-1/2}）
+    row, col : 非ゼロ要素の (企業, タグ)、val : その値
+    """
+
+    def __init__(self, table):
+        table = table.unique_per_row()
+        self.n_rows, self.n_cols = table.n_rows, table.n_tags
+        self.row = table.row_index()
+        self.col = table.ids.astype(np.int64)
+        self.row_deg = table.lengths.astype(float)
+        self.col_deg = np.bincount(self.col, minlength=self.n_cols).astype(float)
+        self.row_scale = _inv_sqrt(self.row_deg)
+        self.col_scale = _inv_sqrt(self.col_deg)
+        self.val = self.row_scale[self.row] * self.col_scale[self.col]
+
+    def dot(self, X):
+        """An @ X（X：タグ数 × r）"""
+        out = np.empty((self.n_rows, X.shape[1]))
+        for j in range(X.shape[1]):
+            out[:, j] = np.bincount(self.row, weights=self.val * X[self.col, j], minlength=self.n_rows)
+        return out
+
+    def tdot(self, Y):
+        """Anᵀ @ Y（Y：企業数 × r）"""
+        out = np.empty((self.n_cols, Y.shape[1]))
+        for j in range(Y.shape[1]):
+            out[:, j] = np.bincount(self.col, weights=self.val * Y[self.row, j], minlength=self.n_cols)
+        return out
+
+
+def _inv_sqrt(d):
+    out = np.zeros_like(d)
+    np.divide(1.0, np.sqrt(d), out=out, where=d > 0)
+    return out
+
+
+def randomized_svd(inc, rank, oversample=10, n_iter=5, seed=0):
+    """An の上位 rank 個の特異値・特異ベクトル（Halko et al. 2011、べき乗反復つき）→ U, s, V"""
+    rng = np.random.default_rng(seed)
+    size = min(rank + oversample, inc.n_rows, inc.n_cols)
+    Q, _ = np.linalg.qr(inc.dot(rng.standard_normal((inc.n_cols, size))))
+    for _ in range(n_iter):
+        # 反復ごとに直交化しないと、上位の特異ベクトルに潰れて精度が落ちる
+        P, _ = np.linalg.qr(inc.tdot(Q))
+        Q, _ = np.linalg.qr(inc.dot(P))
+    B = inc.tdot(Q).T  # Qᵀ An（size × タグ数）
+    Ub, s, Vt = np.linalg.svd(B, full_matrices=False)
+    return (Q @ Ub)[:, :rank], s[:rank], Vt[:rank].T
+
+
+# ---------------------------
+# 2. mini-batch k-means
+# ---------------------------
+def _nearest(X, centers, chunk=65536):
+    """各点に一番近い中心の番号と、その距離の2乗（メモリを抑えるため chunk 点ずつ）"""
+    labels = np.empty(len(X), dtype=np.int64)
+    dist = np.empty(len(X))
+    c2 = (centers ** 2).sum(axis=1)
+    for a in range(0, len(X), chunk):
+        x = X[a:a + chunk]
+        d = c2[None, :] - 2 * x @ centers.T
+        labels[a:a + chunk] = d.argmin(axis=1)
+        dist[a:a + chunk] = d[np.arange(len(x)), labels[a:a + chunk]] + (x ** 2).sum(axis=1)
+    return labels, np.maximum(dist, 0)
+
+
+def _kmeans_pp(X, k, rng):
+    """k-means++ の初期中心"""
+    centers = [X[rng.integers(len(X))]]
+    dist = ((X - centers[0]) ** 2).sum(axis=1)
+    for _ in range(1, k):
+        total = dist.sum()
+        i = rng.choice(len(X), p=dist / total) if total > 0 else rng.integers(len(X))
+        centers.append(X[i])
+        dist = np.minimum(dist, ((X - X[i]) ** 2).sum(axis=1))
+    return np.array(centers)
+
+
+def minibatch_kmeans(X, k, batch_size=BATCH_SIZE, max_iter=100, n_init=3, tol=1e-4, seed=0):
+    """
+    mini-batch k-means（Sculley 2010）。中心ごとの学習率 = 1 / それまでに割り当てた点数
+    初期化を n_init 回変え、全点の二乗誤差が一番小さいものを返す → (labels, centers, inertia)
+    """
+    rng = np.random.default_rng(seed)
+    k = min(k, len(X))
+    best = None
+    for _ in range(n_init):
+        # 初期化は一部の点だけで（k-means++ は点数 × k の計算）
+        sample = X[rng.choice(len(X), size=min(len(X), max(10 * k, batch_size)), replace=False)]
+        centers = _kmeans_pp(sample, k, rng)
+        counts = np.zeros(k)
+        for _ in range(max_iter):
+            batch = X[rng.integers(0, len(X), size=min(batch_size, len(X)))]
+            lab, _ = _nearest(batch, centers)
+            old = centers.copy()
+            n = np.bincount(lab, minlength=k)
+            sums = np.zeros_like(centers)
+            np.add.at(sums, lab, batch)
+            hit = n > 0
+            counts[hit] += n[hit]
+            # 中心ごとに、バッチの平均へ n / counts だけ近づける（= 点ごとに 1 / count で更新するのと同じ）
+            eta = n[hit] / counts[hit]
+            centers[hit] = (1 - eta)[:, None] * centers[hit] + eta[:, None] * (sums[hit] / n[hit][:, None])
+            if ((centers - old) ** 2).sum() <= tol * max((old ** 2).sum(), 1e-12):
+                break
+        labels, dist = _nearest(X, centers)
+        inertia = float(dist.sum())
+        if best is None or inertia < best[2]:
+            best = (labels, centers, inertia)
+    return best
+
+
+# ---------------------------
+# 3. 共クラスタリング
+# ---------------------------
+def cocluster(table, k, n_components=None, seed=0, n_init=3):
+    """
+    TagTable → (タグのクラスタ id（タグ数,）, 企業のクラスタ id（企業数,）)
+    タグが1つもない企業は -1。クラスタ id は所属タグ数の多い順に 0 から（タグのないクラスタはその後ろ）
+    n_components：使う特異ベクトルの数（None なら k - 1。Dhillon 2001 の ceil(log2 k) だと k が大きいとき分け切れない）
+    """
+    inc = Incidence(table)
+    if n_components is None:
+        n_components = max(1, k - 1)
+    # 1番目の特異ベクトル（特異値 1、次数の平方根に比例）は全員同じ向きなので捨てる
+    U, s, V = randomized_svd(inc, n_components + 1, seed=seed)
+    Z = np.vstack([inc.row_scale[:, None] * U[:, 1:], inc.col_scale[:, None] * V[:, 1:]])
+
+    active = np.r_[inc.row_deg > 0, inc.col_deg > 0]
+    labels = np.full(len(Z), -1, dtype=np.int64)
+    labels[active], _, _ = minibatch_kmeans(Z[active], k, n_init=n_init, seed=seed)
+    company, tag = labels[:inc.n_rows], labels[inc.n_rows:]
+
+    # 空のクラスタを詰めて、タグ数の多い順に番号を振り直す
+    n_tag = np.bincount(tag[tag >= 0], minlength=k)
+    n_all = np.bincount(labels[labels >= 0], minlength=k)
+    used = np.flatnonzero(n_all > 0)
+    used = used[np.lexsort((used, -n_tag[used]))]
+    remap = np.full(k + 1, -1, dtype=np.int64)  # 最後の要素は -1 → -1 用
+    remap[used] = np.arange(len(used))
+    return remap[tag], remap[company]
+
+
+def cluster_lists(vocab, tag_cluster):
+    """タグのクラスタ id → [[タグ, ...], ...]（co_occurrence*.py の communities と同じ形）"""
+    n = int(tag_cluster.max()) + 1 if len(tag_cluster) else 0
+    order = np.argsort(tag_cluster, kind="stable")
+    order = order[tag_cluster[order] >= 0]
+    starts = np.r_[0, np.cumsum(np.bincount(tag_cluster[order], minlength=n))]
+    return [vocab[order[starts[c]:starts[c + 1]]].tolist() for c in range(n)]
+
+
+def write_cocluster(table, tag_cluster, company_cluster, out_dir):
+    """tag_communities_cocluster.csv・community_summary_cocluster.csv・company_cocluster.csv（＋ Parquet）"""
+    tag_comm = tag_cluster >= 0
+    pd.DataFrame({"tag": table.vocab[tag_comm], "community_id": tag_cluster[tag_comm]}).to_csv(
+        os.path.join(out_dir, TAG_COMM_CSV), index=False, encoding="utf-8-sig"
+    )
+
+    # 概要：クラスタごとのタグ数・企業数・企業数の多いタグ上位10
+    doc_freq = table.doc_freq()
+    n = int(max(tag_cluster.max(initial=-1), company_cluster.max(initial=-1))) + 1
+    lists = cluster_lists(table.vocab, tag_cluster)
+    lists += [[]] * (n - len(lists))  # タグのないクラスタ（企業だけ）
+    rows = []
+    for c, tags in enumerate(lists):
+        ids = table.lookup(tags)
+        top = ids[np.argsort(-doc_freq[ids], kind="stable")[:10]]
+        rows.append({
+            "community_id": c,
+            "num_tags": len(tags),
+            "num_companies": int((company_cluster == c).sum()),
+            "top_tags": ", ".join(table.vocab[top].tolist()),
+        })
+    summary = pd.DataFrame(rows, columns=["community_id", "num_tags", "num_companies", "top_tags"])
+    summary.to_csv(os.path.join(out_dir, SUMMARY_CSV), index=False, encoding="utf-8-sig")
+
+    # 企業のクラスタ（1社1つ）。ロング形式の Parquet は main_community.py / bootstrap_share.py と同じ形
+    pd.DataFrame({"company_row": np.arange(len(company_cluster)), "community_id": company_cluster}).to_csv(
+        os.path.join(out_dir, COMPANY_CSV), index=False, encoding="utf-8-sig"
+    )
+    has = company_cluster >= 0
+    write_company_communities(
+        os.path.join(out_dir, COMPANY_PARQUET), np.r_[0, np.cumsum(has)], company_cluster[has], primary=company_cluster
+    )
+    return summary
+
+
+def _entropy(p):
+    p = p[p > 0]
+    return float(-(p * np.log(p)).sum())
+
+
+def nmi(a, b):
+    """2つの分け方の正規化相互情報量（0〜1。同じ分け方なら 1）"""
+    _, a = np.unique(a, return_inverse=True)
+    _, b = np.unique(b, return_inverse=True)
+    n = len(a)
+    if n == 0:
+        return np.nan
+    ha = _entropy(np.bincount(a) / n)
+    hb = _entropy(np.bincount(b) / n)
+    h_ab = _entropy(np.bincount(a * (b.max() + 1) + b) / n)
+    if ha == 0 or hb == 0:
+        return float(ha == hb)
+    return (ha + hb - h_ab) / math.sqrt(ha * hb)
+
+
+# ---------------------------
+# 4. Louvain の経路との比較（それぞれ別プロセスで、ピークRSS が混ざらないように）
+# ---------------------------
+def _bench_one(method, csv, col, remove_tags, k, resolution, seed):
+    tag_col = pd.read_csv(csv, usecols=[col], encoding="utf-8-sig")[col]
+    table = parse_tags(tag_col, remove_tags=remove_tags)
+    rss_before = peak_rss_mb()
+    t0 = time.perf_counter()
+    if method == "louvain":
+        import networkx as nx
+        from networkx.algorithms.community import louvain_communities
+
+        tag1_ids, tag2_ids, co_weights = count_pairs(table)
+        G_all = nx.Graph()
+        G_all.add_weighted_edges_from(zip(tag1_ids.tolist(), tag2_ids.tolist(), co_weights.tolist()))
+        communities = louvain_communities(G_all, weight="weight", resolution=resolution, seed=seed)
+        tag_cluster = np.full(table.n_tags, -1, dtype=np.int64)
+        for i, comm in enumerate(communities):
+            tag_cluster[list(comm)] = i
+        size = {"pairs": len(co_weights)}
+    else:
+        tag_cluster, _ = cocluster(table, k, seed=seed)
+        size = {"pairs": 0}
+    return {
+        "method": method,
+        "seconds": round(time.perf_counter() - t0, 2),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "rss_growth_mb": round(peak_rss_mb() - rss_before, 1),
+        "clusters": int(tag_cluster.max()) + 1,
+        "nnz": int(len(table.unique_per_row().ids)),
+        **size,
+        "tag_cluster": tag_cluster,
+    }
+
+
+def benchmark(csv, col="タグ", remove_tags=(), k=20, resolution=1.0, seed=0):
+    """Louvain の経路と共クラスタリングの 実行時間・ピークRSS・タグの分け方の一致度（NMI）"""
+    ctx = mp.get_context("spawn")
+    results = []
+    for method in ("louvain", "cocluster"):
+        with ctx.Pool(1) as pool:
+            results.append(pool.apply(_bench_one, (method, csv, col, remove_tags, k, resolution, seed)))
+    a, b = results[0].pop("tag_cluster"), results[1].pop("tag_cluster")
+    both = (a >= 0) & (b >= 0)  # Louvain は共起ペアのあるタグだけ
+    agreement = nmi(a[both], b[both])
+    frame = pd.DataFrame(results)
+    frame["nmi_vs_louvain"] = [1.0, agreement]
+    return frame
+
+
+def main():
+    ap = argparse.ArgumentParser(description="企業 × タグ の共クラスタリング（スペクトル + mini-batch k-means）")
+    ap.add_argument("--csv", required=True)
+    ap.add_argument("--col", default="タグ")
+    ap.add_argument("--k", type=int, default=20, help="クラスタ数")
+    ap.add_argument("--components", type=int, default=None, help="使う特異ベクトルの数（既定 k - 1）")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out-dir", default=".")
+    ap.add_argument("--remove-business-model-tags", action="store_true", help="REMOVE_TAGS を除く")
+    ap.add_argument("--benchmark", action="store_true", help="Louvain の経路と時間・メモリを比べる")
+    ap.add_argument("--resolution", type=float, default=1.0, help="比較用 Louvain の resolution")
+    args = ap.parse_args()
+
+    remove_tags = REMOVE_TAGS if args.remove_business_model_tags else ()
+    os.makedirs(args.out_dir, exist_ok=True)
+    if args.benchmark:
+        result = benchmark(args.csv, args.col, remove_tags, args.k, args.resolution, args.seed)
+        path = os.path.join(args.out_dir, BENCHMARK_CSV)
+        result.to_csv(path, index=False, encoding="utf-8-sig")
+        print(result.to_string(index=False))
+        print(f"→ {path}")
+        return
+
+    t0 = time.perf_counter()
+    tag_col = pd.read_csv(args.csv, usecols=[args.col], encoding="utf-8-sig")[args.col]
+    table = parse_tags(tag_col, remove_tags=remove_tags)
+    tag_cluster, company_cluster = cocluster(table, args.k, n_components=args.components, seed=args.seed)
+    summary = write_cocluster(table, tag_cluster, company_cluster, args.out_dir)
+    print(summary.to_string(index=False))
+    print(f"共クラスタ {len(summary)}（{time.perf_counter() - t0:.1f}s、ピークRSS {peak_rss_mb():.0f}MB）→ {args.out_dir}")
+
+
+if __name__ == "__main__":
+    main()
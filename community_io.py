@@ -0,0 +1,94 @@
+# ========================================
+# 企業 × コミュニティ所属の受け渡し（co_occurrence*.py → main_community.py）
+#  - co_occurrence 側：(company_row, community_id) のロング形式を Parquet で書く
+#      company_row  : 入力CSVの行番号（0始まり）
+#      community_id : その企業が属するコミュニティ（1社に複数行）
+#      primary      : その企業の代表コミュニティ（タグが一番多く属するコミュニティ）の行なら True
+#  - main_community 側：必要な2列だけ読む。Parquet がなければ従来の
+#    startups_with_communities_louvain.csv の「コミュニティIDリスト_str」列を split して使う
+#  Parquet の読み書きには pyarrow が必要（無い場合は CSV だけで動く）
+# ========================================
+
+import os
+
+import numpy as np
+import pandas as pd
+
+COMPANY_COMM_PARQUET = "company_communities_louvain.parquet"
+LEGACY_COMM_STR_COL = "コミュニティIDリスト_str"
+
+
+def write_company_communities(path, offsets, comm_ids, primary=None):
+    """
+    ragged（offsets + community id）→ ロング形式 Parquet。pyarrow が無ければ False
+    primary（企業ごとの代表コミュニティ、なしは -1）を渡すと、その行に primary=True の列を足す
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        print(f"pyarrow が無いため {path} は出力しません（CSV のみ）")
+        return False
+    offsets = np.asarray(offsets, dtype=np.int64)
+    n_companies = len(offsets) - 1
+    company_row = np.repeat(np.arange(n_companies, dtype=np.int32), np.diff(offsets))
+    columns = {
+        "company_row": company_row,
+        "community_id": np.asarray(comm_ids, dtype=np.int32),
+    }
+    if primary is not None:
+        columns["primary"] = np.asarray(primary)[company_row] == columns["community_id"]
+    table = pa.table(columns)
+    table = table.replace_schema_metadata({"n_companies": str(n_companies)})
+    pq.write_table(table, path)
+    return True
+
+
+def read_company_communities(path):
+    """Parquet → (company_row, community_id, n_companies)"""
+    import pyarrow.parquet as pq
+    table = pq.read_table(path, columns=["company_row", "community_id"])
+    n_companies = int(table.schema.metadata[b"n_companies"])
+    return (
+        table.column("company_row").to_numpy(),
+        table.column("community_id").to_numpy(),
+        n_companies,
+    )
+
+
+def read_primary_flags(path):
+    """Parquet の primary 列（行ごとに、その企業の代表コミュニティか）。列が無ければ None"""
+    import pyarrow.parquet as pq
+    if "primary" not in pq.read_schema(path).names:
+        return None
+    return pq.read_table(path, columns=["primary"]).column("primary").to_numpy()
+
+
+def read_legacy_csv(path):
+    """従来CSV の「コミュニティIDリスト_str」（"0,3" 形式）だけ読んで split"""
+    s = pd.read_csv(path, usecols=[LEGACY_COMM_STR_COL], dtype=str, encoding="utf-8-sig")[
+        LEGACY_COMM_STR_COL
+    ].fillna("")
+    exploded = s.str.split(",").explode().str.strip()
+    exploded = exploded[exploded != ""]
+    return (
+        exploded.index.to_numpy().astype(np.int32),
+        exploded.to_numpy().astype(np.int32),
+        len(s),
+    )
+
+
+def load_company_communities(parquet_path, csv_path):
+    """
+    Parquet があり（かつ CSV より新しければ）Parquet、なければ CSV から読む。
+    戻り値 (company_row, community_id, n_companies, 読んだファイル)
+    """
+    use_parquet = os.path.exists(parquet_path) and (
+        not os.path.exists(csv_path) or os.path.getmtime(parquet_path) >= os.path.getmtime(csv_path)
+    )
+    if use_parquet:
+        try:
+            return (*read_company_communities(parquet_path), parquet_path)
+        except ImportError:
+            pass
+    return (*read_legacy_csv(csv_path), csv_path)
@@ -0,0 +1,281 @@
+# ========================================
+# 企業 × コミュニティ × カテゴリ × 所在地 の結合キューブ
+#  - co_occurrence*.py の企業×コミュニティ（company_communities_louvain.parquet）と
+#    tag_genre.py の企業ごとのカテゴリ・所在地コード（company_categories.npz）を、整数コードのまま1回で結合
+#  - 1行 = (企業, コミュニティ, カテゴリ) の組（所属がない側は -1 の1行）＋ 丁目の leaf コード
+#      frac    : 1 / (その企業のコミュニティ数 × カテゴリ数)（企業ごとの合計が 1）
+#      primary : 代表コミュニティ × 代表カテゴリ（primary_from_tags）の行なら True（1社1行）
+#    列ごとに小さい整数型で np.savez_compressed（loc_cube.py と同じ形式）
+#  - 集計は行の絞り込み + bincount だけ（CSV の merge はしない）
+#      cube.count(["ward", "category"], mode="multilabel", community=3)
+#        → コミュニティ 3 の企業を 区 × カテゴリ で
+#    mode：multilabel（その組み合わせに当てはまる企業数）/ fractional（frac の合計）/ primary（代表どうしの1行だけ）
+#
+#  tag_genre.py → co_occurrence*.py の出力がそろったら:
+#    python company_cube.py --communities co_occurrence_output/company_communities_louvain.parquet \
+#        --codes company_categories.npz --out company_cube.npz
+#  2つの入力CSVの行が同じ並びでない場合は --key-col（両方にある企業の列）と --community-csv で突き合わせる
+# ========================================
+
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from community_io import COMPANY_COMM_PARQUET, read_company_communities, read_primary_flags
+from loc_cube import LEVELS
+
+COMPANY_CODES = "company_categories.npz"
+COMPANY_CUBE = "company_cube.npz"
+MODES = ("multilabel", "fractional", "primary")
+DIMS = ("community", "category") + LEVELS
+
+
+# ---------------------------
+# 1. tag_genre.py 側の出力（企業ごとのカテゴリ・所在地コード）
+# ---------------------------
+def save_company_codes(path, categories, cat_offsets, cat_ids, primary_tags, primary_text,
+                       leaf, level_names, level_starts, keys=None):
+    arrays = {
+        "categories": np.asarray(categories, dtype=str),
+        "cat_offsets": np.asarray(cat_offsets, dtype=np.int64),
+        "cat_ids": np.asarray(cat_ids, dtype=np.int8),
+        "primary_tags": np.asarray(primary_tags, dtype=np.int8),
+        "primary_text": np.asarray(primary_text, dtype=np.int8),
+        "leaf": np.asarray(leaf, dtype=np.int32),
+    }
+    for k, level in enumerate(LEVELS):
+        arrays[f"names_{level}"] = np.asarray(level_names[k], dtype=str)
+        arrays[f"starts_{level}"] = np.asarray(level_starts[k], dtype=np.int64)
+    if keys is not None:
+        arrays["keys"] = np.asarray(keys, dtype=str)
+    np.savez_compressed(path, **arrays)
+
+
+def load_company_codes(path):
+    with np.load(path, allow_pickle=False) as z:
+        return {key: z[key] for key in z.files}
+
+
+# ---------------------------
+# 2. キューブ
+# ---------------------------
+class CompanyCube:
+    """
+    columns      : company, community, category, leaf, frac, primary（同じ長さの配列）
+    categories   : カテゴリ名（category コードの並び）
+    level_names / level_starts : 所在地の各階層（loc_cube.LocCube と同じ持ち方）
+    n_companies  : 企業数（tag_genre.py の入力CSVの行数）
+    """
+
+    def __init__(self, columns, categories, level_names, level_starts, n_companies):
+        self.columns = dict(columns)
+        self.categories = np.asarray(categories)
+        self.level_names = [np.asarray(a) for a in level_names]
+        self.level_starts = [np.asarray(a, dtype=np.int64) for a in level_starts]
+        self.n_companies = int(n_companies)
+        self.n_communities = int(self.columns["community"].max()) + 1 if len(self) else 0
+        n_leaf = len(self.level_names[-1])
+        # leaf → 各階層の単位コード（-1 は所在地なし）
+        self._leaf_unit = [
+            np.repeat(np.arange(len(s)), np.diff(np.r_[s, n_leaf])) for s in self.level_starts
+        ]
+
+    def __len__(self):
+        return len(self.columns["company"])
+
+    def codes(self, dim):
+        """行ごとの dim のコード（-1 はなし）"""
+        if dim in ("community", "category"):
+            return self.columns[dim].astype(np.int64)
+        leaf = self.columns["leaf"].astype(np.int64)
+        unit = self._leaf_unit[LEVELS.index(dim)]
+        return np.where(leaf >= 0, unit[leaf.clip(min=0)], -1)
+
+    def names(self, dim):
+        if dim == "community":
+            return np.arange(self.n_communities)
+        if dim == "category":
+            return self.categories
+        return self.level_names[LEVELS.index(dim)]
+
+    def _lookup(self, dim, values):
+        values = values if isinstance(values, (list, tuple, set, np.ndarray)) else [values]
+        if dim == "community":
+            return np.asarray(list(values), dtype=np.int64)
+        index = {name: i for i, name in enumerate(self.names(dim).tolist())}
+        missing = [v for v in values if v not in index]
+        if missing:
+            raise KeyError(f"{dim} に無い値: {missing}")
+        return np.array([index[v] for v in values], dtype=np.int64)
+
+    def mask(self, **where):
+        """where（例：community=3, prefecture="東京都", category=["医療", "金融"]）に当てはまる行"""
+        m = np.ones(len(self), dtype=bool)
+        for dim, values in where.items():
+            if dim not in DIMS:
+                raise KeyError(f"{dim} は {DIMS} のどれか")
+            m &= np.isin(self.codes(dim), self._lookup(dim, values))
+        return m
+
+    def count(self, by=("community", "category"), mode="multilabel", drop_zero=True, **where):
+        """
+        by の組み合わせごとの集計（ロング形式の DataFrame。列 = by + ["count" or "weight"]）
+        where で行を絞る（by に無い軸で絞っても、その軸の重複は数えない）
+        """
+        by = [by] if isinstance(by, str) else list(by)
+        if mode not in MODES:
+            raise ValueError(f"mode は {MODES} のどれか")
+        m = self.mask(**where)
+        if mode == "primary":
+            m &= self.columns["primary"]
+        codes = [self.codes(d)[m] for d in by]
+        ok = np.ones(int(m.sum()), dtype=bool)
+        for c in codes:
+            ok &= c >= 0
+        shape = tuple(len(self.names(d)) for d in by)
+        size = int(np.prod(shape)) if shape else 1
+        cell = np.ravel_multi_index([c[ok] for c in codes], shape) if by else np.zeros(int(ok.sum()), dtype=np.int64)
+
+        if mode == "fractional":
+            values = np.bincount(cell, weights=self.columns["frac"][m][ok], minlength=size)
+            value_col = "weight"
+        elif mode == "multilabel":
+            # 同じ企業が同じセルに何行あっても（by に無い軸の組み合わせ）1社
+            company = self.columns["company"][m][ok].astype(np.int64)
+            values = np.bincount(np.unique(company * size + cell) % size, minlength=size)
+            value_col = "count"
+        else:
+            values = np.bincount(cell, minlength=size)
+            value_col = "count"
+
+        keys = np.flatnonzero(values) if drop_zero else np.arange(size)
+        out = {}
+        for d, idx in zip(by, np.unravel_index(keys, shape) if by else []):
+            out[d] = self.names(d)[idx]
+        out[value_col] = values[keys]
+        return pd.DataFrame(out)
+
+    def save(self, path):
+        arrays = {f"col_{k}": v for k, v in self.columns.items()}
+        arrays["categories"] = self.categories.astype(str)
+        arrays["n_companies"] = np.array(self.n_companies)
+        for k, level in enumerate(LEVELS):
+            arrays[f"names_{level}"] = self.level_names[k].astype(str)
+            arrays[f"starts_{level}"] = self.level_starts[k]
+        np.savez_compressed(path, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as z:
+            columns = {key[len("col_"):]: z[key] for key in z.files if key.startswith("col_")}
+            return cls(
+                columns,
+                z["categories"],
+                [z[f"names_{level}"] for level in LEVELS],
+                [z[f"starts_{level}"] for level in LEVELS],
+                int(z["n_companies"]),
+            )
+
+
+def _with_placeholder(offsets, ids, flags):
+    """所属が無い企業に -1（primary=True）の1件を足した ragged array（offsets, ids, flags）"""
+    lengths = np.diff(offsets)
+    new_len = np.maximum(lengths, 1)
+    new_offsets = np.r_[0, np.cumsum(new_len)]
+    new_ids = np.full(new_offsets[-1], -1, dtype=np.int64)
+    new_flags = np.ones(new_offsets[-1], dtype=bool)
+    pos = np.repeat(new_offsets[:-1], lengths) + (np.arange(len(ids)) - np.repeat(offsets[:-1], lengths))
+    new_ids[pos] = ids
+    new_flags[pos] = flags
+    return new_offsets, new_ids, new_flags
+
+
+def build_company_cube(codes, comm_company, comm_id, comm_primary=None):
+    """
+    codes        : load_company_codes の戻り値（tag_genre.py 側。企業 = その入力CSVの行）
+    comm_company : コミュニティ所属の各行の企業番号（codes の企業番号に直したもの。対応なしは -1）
+    comm_id      : 所属コミュニティ
+    comm_primary : 各行が代表コミュニティか（primary 列の無い古い Parquet なら None。
+                   そのときの primary 集計は「代表カテゴリ × 所属コミュニティ全部」になる）
+    """
+    n = len(codes["leaf"])
+    comm_company = np.asarray(comm_company, dtype=np.int64)
+    ok = comm_company >= 0
+    order = np.lexsort((comm_id[ok], comm_company[ok]))
+    c_ids = np.asarray(comm_id)[ok][order]
+    c_flags = np.ones(len(c_ids), dtype=bool) if comm_primary is None else np.asarray(comm_primary)[ok][order]
+    c_off = np.r_[0, np.cumsum(np.bincount(comm_company[ok], minlength=n))]
+    c_off, c_ids, c_flags = _with_placeholder(c_off, c_ids, c_flags)
+
+    k_off = codes["cat_offsets"]
+    k_ids = codes["cat_ids"].astype(np.int64)
+    k_flags = k_ids == np.repeat(codes["primary_tags"].astype(np.int64), np.diff(k_off))
+    k_off, k_ids, k_flags = _with_placeholder(k_off, k_ids, k_flags)
+
+    # 企業ごとに (コミュニティ × カテゴリ) の全組を並べる
+    n_c, n_k = np.diff(c_off), np.diff(k_off)
+    n_rows = n_c * n_k
+    company = np.repeat(np.arange(n), n_rows)
+    local = np.arange(n_rows.sum()) - np.repeat(np.cumsum(n_rows) - n_rows, n_rows)
+    ci = c_off[company] + local // n_k[company]
+    ki = k_off[company] + local % n_k[company]
+
+    columns = {
+        "company": company.astype(np.int32),
+        "community": c_ids[ci].astype(np.int16),
+        "category": k_ids[ki].astype(np.int8),
+        "leaf": codes["leaf"][company].astype(np.int32),
+        "frac": (1.0 / n_rows[company]).astype(np.float32),
+        "primary": c_flags[ci] & k_flags[ki],
+    }
+    return CompanyCube(
+        columns,
+        codes["categories"],
+        [codes[f"names_{level}"] for level in LEVELS],
+        [codes[f"starts_{level}"] for level in LEVELS],
+        n,
+    )
+
+
+def match_companies(codes, comm_row, n_comm_companies, key_col=None, community_csv=None):
+    """コミュニティ側の company_row → codes の企業番号（行の並びが同じなら行番号そのまま、違えば key_col で突き合わせ）"""
+    n = len(codes["leaf"])
+    if key_col is None:
+        if n_comm_companies != n:
+            raise ValueError(
+                f"企業数が違う（コミュニティ側 {n_comm_companies}, カテゴリ側 {n}）。--key-col と --community-csv で突き合わせる"
+            )
+        return np.asarray(comm_row, dtype=np.int64)
+    if "keys" not in codes:
+        raise ValueError("company_categories.npz に企業キーが無い（tag_genre.py の COMPANY_KEY_COL を設定して作り直す）")
+    comm_keys = pd.read_csv(community_csv, usecols=[key_col], dtype=str, encoding="utf-8-sig")[key_col]
+    # 同じキーが複数あれば最初の行
+    first = pd.Series(np.arange(n)).groupby(codes["keys"]).first()
+    mapped = first.reindex(comm_keys.to_numpy()).fillna(-1).to_numpy().astype(np.int64)
+    return mapped[np.asarray(comm_row, dtype=np.int64)]
+
+
+def main():
+    ap = argparse.ArgumentParser(description="企業 × コミュニティ × カテゴリ × 所在地 の結合キューブ")
+    ap.add_argument("--communities", default=COMPANY_COMM_PARQUET)
+    ap.add_argument("--codes", default=COMPANY_CODES)
+    ap.add_argument("--out", default=COMPANY_CUBE)
+    ap.add_argument("--key-col", help="2つの入力CSVで企業を突き合わせる列（行の並びが同じなら不要）")
+    ap.add_argument("--community-csv", help="co_occurrence*.py の入力CSV（--key-col の値を読む）")
+    args = ap.parse_args()
+
+    codes = load_company_codes(args.codes)
+    comm_row, comm_id, n_comm_companies = read_company_communities(args.communities)
+    comm_company = match_companies(codes, comm_row, n_comm_companies, args.key_col, args.community_csv)
+    unmatched = int((comm_company < 0).sum())
+    if unmatched:
+        print(f"カテゴリ側に無い企業の所属 {unmatched} 行は除きます")
+    cube = build_company_cube(codes, comm_company, comm_id, read_primary_flags(args.communities))
+    cube.save(args.out)
+    print(f"saved: {args.out}（{len(cube)} 行、企業数 {cube.n_companies}）")
+    print(cube.count(["community", "category"], mode="fractional").head(10))
+
+
+if __name__ == "__main__":
+    main()
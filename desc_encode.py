@@ -0,0 +1,277 @@
+# ========================================
+# 事業内容テキストの Sentence-BERT embedding（マルチプロセス・チャンク保存・再開可能）
+#  - コーパスをチャンクに分け、ワーカープロセスごとにモデルを1つ持って encode
+#  - 終わったチャンクは 1ファイルずつ保存 → 中断しても次回は未完了チャンクから再開
+#  - 全チャンク完了後、1本の memmap 配列（embeddings.npy）にまとめる
+#  - encode する行は選べる（--rows）。embeddings.npy は選んだ行の分だけで、行番号は rows.npy
+#    （tag_genre.py はキーワードで決まらない事業内容だけを渡す）
+#
+#  使い方（tag_genre.py から自動で呼ばれる。単体でも実行可）:
+#    python desc_encode.py --csv <CSV> --col 事業内容 --out-dir desc_embeddings \
+#        --workers 4 --threads 2 --chunk-size 2000 [--rows rows.npy]
+# ========================================
+
+import argparse
+import hashlib
+import json
+import multiprocessing as mp
+import os
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_MODEL_NAME = "sonoisa/sentence-bert-base-ja-mean-tokens"
+
+MANIFEST_NAME = "manifest.json"
+FINAL_NAME = "embeddings.npy"
+ROWS_NAME = "rows.npy"
+CHUNK_DIR_NAME = "chunks"
+
+
+# ---------------------------
+# 1. コーパス・マニフェスト
+# ---------------------------
+def load_texts(csv_path, col):
+    # tag_genre.py と同じ読み方（fillna("") → str）
+    return pd.read_csv(csv_path, usecols=[col])[col].fillna("").astype(str).tolist()
+
+
+def corpus_hash(texts):
+    h = hashlib.sha1()
+    for t in texts:
+        h.update(t.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def select_rows(texts, rows=None):
+    """encode する行番号（rows=None なら全行）。空テキストは encode しない（除く）"""
+    rows = np.arange(len(texts), dtype=np.int64) if rows is None else np.asarray(rows, dtype=np.int64)
+    return rows[[texts[i].strip() != "" for i in rows.tolist()]].astype(np.int64)
+
+
+def rows_hash(rows):
+    return hashlib.sha1(np.asarray(rows, dtype=np.int64).tobytes()).hexdigest()
+
+
+def make_manifest(texts, model_name, chunk_size, rows):
+    return {
+        "model": model_name,
+        "n_rows": len(texts),
+        "chunk_size": chunk_size,
+        "corpus_sha1": corpus_hash(texts),
+        "rows_sha1": rows_hash(rows),
+    }
+
+
+def _read_manifest(out_dir):
+    path = os.path.join(out_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_manifest(out_dir, manifest):
+    path = os.path.join(out_dir, MANIFEST_NAME)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def _same_corpus(old, new):
+    keys = ("model", "n_rows", "chunk_size", "corpus_sha1", "rows_sha1")
+    return old is not None and all(old.get(k) == new[k] for k in keys)
+
+
+def is_complete(out_dir, texts, model_name=DEFAULT_MODEL_NAME, rows=None):
+    """embeddings.npy がこのコーパス・行・モデルで作成済みなら True（chunk_size は問わない）"""
+    old = _read_manifest(out_dir)
+    return (
+        old is not None
+        and old.get("complete", False)
+        and old["model"] == model_name
+        and old["n_rows"] == len(texts)
+        and old["corpus_sha1"] == corpus_hash(texts)
+        and old.get("rows_sha1") == rows_hash(select_rows(texts, rows))
+        and os.path.exists(os.path.join(out_dir, FINAL_NAME))
+        and os.path.exists(os.path.join(out_dir, ROWS_NAME))
+    )
+
+
+def load_embeddings(out_dir):
+    """(行番号 (n,) int64, embedding (n, dim) float32 の memmap)。embedding の k 行目 = 行番号 k 番目の行"""
+    rows = np.load(os.path.join(out_dir, ROWS_NAME))
+    return rows, np.load(os.path.join(out_dir, FINAL_NAME), mmap_mode="r")
+
+
+# ---------------------------
+# 2. ワーカー（プロセスごとにモデル1つ）
+# ---------------------------
+_worker_model = None
+_worker_error = None
+
+
+def _init_worker(model_name, n_threads):
+    global _worker_model, _worker_error
+    try:
+        # torch を import する前にスレッド数を固定しておく
+        for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+            os.environ[var] = str(n_threads)
+        import torch
+        torch.set_num_threads(n_threads)
+        from sentence_transformers import SentenceTransformer
+        _worker_model = SentenceTransformer(model_name)
+    except Exception as e:
+        # initializer で例外を出すと Pool がワーカーを延々と再起動するので、タスク側で投げ直す
+        _worker_error = e
+
+
+def _encode_chunk(task):
+    if _worker_error is not None:
+        raise _worker_error
+    chunk_id, texts, path, batch_size = task
+    vecs = _worker_model.encode(
+        texts, normalize_embeddings=True, batch_size=batch_size, show_progress_bar=False
+    )
+    # 書きかけのファイルを完了チャンクと誤認しないよう、tmp に書いてから rename
+    tmp = path + ".tmp.npy"
+    np.save(tmp, np.asarray(vecs, dtype=np.float32))
+    os.replace(tmp, path)
+    return chunk_id, len(texts)
+
+
+# ---------------------------
+# 3. チャンク分割 → encode → memmap に集約
+# ---------------------------
+def encode_corpus(
+    texts,
+    out_dir,
+    model_name=DEFAULT_MODEL_NAME,
+    n_workers=4,
+    threads_per_worker=2,
+    chunk_size=2000,
+    batch_size=64,
+    rows=None,
+):
+    """texts のうち rows（None なら全行）の embedding を out_dir/embeddings.npy に作成して (行番号, memmap) で返す"""
+    os.makedirs(out_dir, exist_ok=True)
+    chunk_dir = os.path.join(out_dir, CHUNK_DIR_NAME)
+
+    # 空テキストは encode しない
+    nonempty = select_rows(texts, rows)
+    manifest = make_manifest(texts, model_name, chunk_size, nonempty)
+    old = _read_manifest(out_dir)
+    if not _same_corpus(old, manifest):
+        # コーパス・行・モデル・チャンク幅が変わったらチェックポイントは使えない
+        if os.path.isdir(chunk_dir):
+            shutil.rmtree(chunk_dir)
+        for name in (FINAL_NAME, ROWS_NAME):
+            if os.path.exists(os.path.join(out_dir, name)):
+                os.remove(os.path.join(out_dir, name))
+    elif old.get("complete", False) and is_complete(out_dir, texts, model_name, rows):
+        print("desc embeddings: already complete →", out_dir)
+        return load_embeddings(out_dir)
+    os.makedirs(chunk_dir, exist_ok=True)
+    _write_manifest(out_dir, manifest)
+
+    n_chunks = (len(nonempty) + chunk_size - 1) // chunk_size
+
+    def chunk_path(c):
+        return os.path.join(chunk_dir, f"chunk_{c:05d}.npy")
+
+    tasks = []
+    for c in range(n_chunks):
+        if os.path.exists(chunk_path(c)):
+            continue
+        rows = nonempty[c * chunk_size:(c + 1) * chunk_size]
+        tasks.append((c, [texts[i] for i in rows], chunk_path(c), batch_size))
+
+    print(
+        f"desc embeddings: {len(nonempty)} texts, {n_chunks} chunks "
+        f"({n_chunks - len(tasks)} done, {len(tasks)} remaining), "
+        f"workers={n_workers}, threads/worker={threads_per_worker}"
+    )
+
+    t0 = time.perf_counter()
+    done_rows = 0
+    if tasks:
+        if n_workers <= 1:
+            _init_worker(model_name, threads_per_worker)
+            results = map(_encode_chunk, tasks)
+            pool = None
+        else:
+            # fork だと torch / macOS で不安定なので spawn
+            ctx = mp.get_context("spawn")
+            pool = ctx.Pool(
+                processes=min(n_workers, len(tasks)),
+                initializer=_init_worker,
+                initargs=(model_name, threads_per_worker),
+            )
+            results = pool.imap_unordered(_encode_chunk, tasks)
+        try:
+            for k, (c, n) in enumerate(results, 1):
+                done_rows += n
+                elapsed = time.perf_counter() - t0
+                print(
+                    f"  chunk {c} done ({k}/{len(tasks)}), "
+                    f"{done_rows / max(elapsed, 1e-9):.1f} texts/s"
+                )
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+    # --- 集約：チャンク → 1本の memmap ---
+    if n_chunks > 0:
+        dim = np.load(chunk_path(0), mmap_mode="r").shape[1]
+    else:
+        dim = 0
+    final_path = os.path.join(out_dir, FINAL_NAME)
+    tmp_path = final_path + ".tmp.npy"
+    out = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.float32, shape=(len(nonempty), dim))
+    for c in range(n_chunks):
+        out[c * chunk_size:(c + 1) * chunk_size] = np.load(chunk_path(c))
+    out.flush()
+    del out
+    np.save(os.path.join(out_dir, ROWS_NAME), nonempty)
+    os.replace(tmp_path, final_path)
+
+    manifest["complete"] = True
+    manifest["dim"] = int(dim)
+    _write_manifest(out_dir, manifest)
+    print(f"desc embeddings: saved {final_path} ({len(nonempty)} of {len(texts)} rows x {dim})")
+    return load_embeddings(out_dir)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="事業内容テキストの embedding を並列・再開可能に計算")
+    ap.add_argument("--csv", required=True)
+    ap.add_argument("--col", default="事業内容")
+    ap.add_argument("--out-dir", default="desc_embeddings")
+    ap.add_argument("--model", default=DEFAULT_MODEL_NAME)
+    ap.add_argument("--workers", type=int, default=4)
+    ap.add_argument("--threads", type=int, default=2, help="ワーカー1つあたりの torch スレッド数")
+    ap.add_argument("--chunk-size", type=int, default=2000)
+    ap.add_argument("--batch-size", type=int, default=64)
+    ap.add_argument("--rows", default=None, help="encode する行番号の .npy（省略時は全行）")
+    args = ap.parse_args()
+
+    texts = load_texts(args.csv, args.col)
+    rows = np.load(args.rows) if args.rows else None
+    encode_corpus(
+        texts,
+        args.out_dir,
+        model_name=args.model,
+        n_workers=args.workers,
+        threads_per_worker=args.threads,
+        chunk_size=args.chunk_size,
+        batch_size=args.batch_size,
+        rows=rows,
+    )
+
+
+if __name__ == "__main__":
+    main()
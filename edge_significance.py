@@ -0,0 +1,259 @@
+# ========================================
+# 共起エッジの有意性（帰無モデルとの比較）
+#  - 共起回数そのままだと「どちらのタグも多いから多い」のか「本当に一緒に付きやすい」のか区別できない
+#  - 解析的：企業数 N、タグ a・b の企業数 K_a・K_b のとき、ランダムに付いたとすると
+#    共起企業数は超幾何分布 → 期待値・z・上側 p 値（P(X >= 観測値)）
+#    log 階乗の表を引いて、エッジ全部をまとめて（ragged に並べて）裾の確率を足す
+#  - ランダム化（任意）：企業×タグの2部グラフを、企業ごとのタグ数・タグごとの企業数を保ったまま
+#    curveball（全企業をランダムに2社ずつ組にして、組ごとに共有していないタグを入れ替える）で混ぜ、
+#    その上で同じエッジの共起回数を数える × samples 回 → 平均・標準偏差・z・経験 p 値
+#    チェーンごとにワーカープロセスで並列
+#  - 多重検定：Benjamini-Hochberg（検定数 = タグの組の総数。共起 0 の組は p = 1 として数える）
+#
+#  co_occurrence_new.py の significance ステージから使う（ランダム化は別プロセスで実行）:
+#    python edge_significance.py --tags tags.npz --out null.npz --samples 200 --workers 4
+# ========================================
+
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from tag_parse import TagTable, load_table, ragged_take
+from pipeline import run_pool
+
+_table = None
+_keys = None
+_burn_in = None
+_thin = None
+
+
+# ---------------------------
+# 1. 超幾何分布（解析的）
+# ---------------------------
+def hypergeom_test(co, k_a, k_b, n, chunk=200_000):
+    """
+    観測共起数 co、タグの企業数 k_a・k_b、企業数 n（エッジごとの配列）→ (期待値, z, 上側 p 値)
+    p = P(X >= co)、X ~ 超幾何(n, k_a, k_b)
+    """
+    co = np.asarray(co, dtype=np.int64)
+    k_a = np.asarray(k_a, dtype=np.int64)
+    k_b = np.asarray(k_b, dtype=np.int64)
+    expected = k_a * k_b / n
+    var = k_a * (k_b / n) * ((n - k_a) / n) * ((n - k_b) / max(n - 1, 1))
+    sd = np.sqrt(var)
+    z = np.divide(co - expected, sd, out=np.full(len(co), np.nan), where=sd > 0)
+
+    log_fact = np.r_[0.0, np.cumsum(np.log(np.arange(1, n + 1)))]
+
+    def log_comb(x, y):
+        return log_fact[x] - log_fact[y] - log_fact[x - y]
+
+    # 裾の和は mode（最頻値）を過ぎると急に小さくなるので、max(co, mode) + 12σ まで足せば十分
+    k_max = np.minimum(k_a, k_b)
+    mode = ((k_a + 1) * (k_b + 1)) // (n + 2)
+    end = np.minimum(k_max, np.maximum(co, mode) + np.ceil(12 * sd + 12).astype(np.int64))
+    n_terms = np.maximum(end - co + 1, 0)
+
+    p = np.zeros(len(co))
+    # 項数が多いエッジもあるので、項の合計が chunk 程度になるようにエッジを区切って足す
+    done = np.r_[0, np.cumsum(n_terms)]
+    lo = 0
+    while lo < len(co):
+        hi = max(int(np.searchsorted(done, done[lo] + chunk, side="right")) - 1, lo + 1)
+        idx = np.arange(lo, hi)
+        cnt = n_terms[idx]
+        has = cnt > 0
+        if has.any():
+            e = np.repeat(idx, cnt)
+            starts = np.cumsum(cnt) - cnt
+            k = np.repeat(co[idx], cnt) + np.arange(cnt.sum()) - np.repeat(starts, cnt)
+            log_pmf = log_comb(k_a[e], k) + log_comb(n - k_a[e], k_b[e] - k) - log_comb(n, k_b[e])
+            p[idx[has]] = np.add.reduceat(np.exp(log_pmf), starts[has])
+        lo = hi
+    return expected, z, np.clip(p, 0.0, 1.0)
+
+
+def bh_adjust(p, n_tests=None):
+    """Benjamini-Hochberg の q 値。n_tests を渡すと、ここに無い検定（p = 1）も数に入れる"""
+    p = np.asarray(p, dtype=float)
+    m = len(p) if n_tests is None else max(int(n_tests), len(p))
+    order = np.argsort(p, kind="stable")
+    ranked = p[order] * m / np.arange(1, len(p) + 1)
+    q = np.empty(len(p))
+    q[order] = np.minimum.accumulate(ranked[::-1])[::-1]
+    return np.clip(q, 0.0, 1.0)
+
+
+# ---------------------------
+# 2. curveball ランダム化
+# ---------------------------
+def curveball_round(table, rng):
+    """
+    全企業をランダムに2社ずつ組にし、組ごとに curveball の交換を1回ずつ（global curveball）
+    table は unique_per_row 済み。企業ごとのタグ数・タグごとの企業数は変わらない
+    """
+    n_tags = max(table.n_tags, 1)
+    perm = rng.permutation(table.n_rows)
+    m = table.n_rows // 2
+    rows_a, rows_b = perm[0:2 * m:2], perm[1:2 * m:2]
+    ids_a, len_a = ragged_take(table.offsets, table.ids, rows_a)
+    ids_b, len_b = ragged_take(table.offsets, table.ids, rows_b)
+
+    # (組, tag id) を並べ、2回出てくるもの = 両社が持つタグ（動かさない）、1回だけ = 入れ替え対象
+    key = np.sort(np.r_[
+        np.repeat(np.arange(m), len_a) * n_tags + ids_a,
+        np.repeat(np.arange(m), len_b) * n_tags + ids_b,
+    ])
+    same_next = np.r_[key[1:] == key[:-1], False]
+    same_prev = np.r_[False, key[1:] == key[:-1]]
+    shared = key[same_next]
+    free = key[~(same_next | same_prev)]
+
+    # 入れ替え対象を組の中でシャッフルし、A 社が元々持っていた数だけ A 社へ、残りは B 社へ
+    free_pair = free // n_tags
+    order = np.lexsort((rng.random(len(free)), free_pair))
+    free, free_pair = free[order], free_pair[order]
+    cnt = np.bincount(free_pair, minlength=m)
+    rank = np.arange(len(free)) - np.repeat(np.cumsum(cnt) - cnt, cnt)
+    take_a = len_a - np.bincount(shared // n_tags, minlength=m)
+    to_a = rank < take_a[free_pair]
+
+    shared_pair = shared // n_tags
+    rows = np.r_[
+        rows_a[shared_pair], rows_b[shared_pair],
+        np.where(to_a, rows_a[free_pair], rows_b[free_pair]),
+    ]
+    vals = np.r_[shared % n_tags, shared % n_tags, free % n_tags]
+    if table.n_rows % 2:
+        # 組にならなかった1社はそのまま
+        last = perm[-1:]
+        v, ln = ragged_take(table.offsets, table.ids, last)
+        rows = np.r_[rows, np.repeat(last, ln)]
+        vals = np.r_[vals, v]
+    order = np.lexsort((vals, rows))
+    return TagTable(table.vocab, table.offsets, vals[order].astype(np.int32))
+
+
+def pair_counts(table, keys):
+    """タグの組（key = a * n_tags + b、a < b）ごとの共起企業数（unique_per_row 済みの表）"""
+    a, b = table.pairs()
+    found = np.sort(a.astype(np.int64) * table.n_tags + b)
+    return np.searchsorted(found, keys, side="right") - np.searchsorted(found, keys, side="left")
+
+
+def _init_worker(table, keys, burn_in, thin):
+    global _table, _keys, _burn_in, _thin
+    _table, _keys, _burn_in, _thin = table, keys, burn_in, thin
+
+
+def _run_chain(task):
+    """1本のチェーン：burn_in ラウンド混ぜてから、thin ラウンドごとに共起数を数える"""
+    seed, n_samples = task
+    rng = np.random.default_rng(seed)
+    observed = pair_counts(_table, _keys)
+    total = np.zeros(len(_keys))
+    total_sq = np.zeros(len(_keys))
+    n_ge = np.zeros(len(_keys), dtype=np.int64)
+    table = _table
+    for _ in range(_burn_in):
+        table = curveball_round(table, rng)
+    for _ in range(n_samples):
+        for _ in range(_thin):
+            table = curveball_round(table, rng)
+        c = pair_counts(table, _keys)
+        total += c
+        total_sq += c.astype(np.float64) ** 2
+        n_ge += c >= observed
+    return total, total_sq, n_ge
+
+
+def randomized_null(table, samples=200, n_workers=1, burn_in=50, thin=5, seed=0):
+    """
+    共起のあるタグの組ごとに、curveball ランダム化での共起数の (組の key, 平均, 標準偏差, 観測値以上の回数)
+    key = a * n_tags + b（a < b）の昇順。n_workers 本のチェーンに samples を分ける
+    """
+    table = table.unique_per_row()
+    a, b = table.pairs()
+    keys = np.unique(a.astype(np.int64) * table.n_tags + b)
+    n_chains = max(1, min(n_workers, samples))
+    tasks = [(seed + c, samples // n_chains + (c < samples % n_chains)) for c in range(n_chains)]
+
+    parts = run_pool(_run_chain, tasks, n_workers, _init_worker, (table, keys, burn_in, thin))
+
+    total = sum(p[0] for p in parts)
+    total_sq = sum(p[1] for p in parts)
+    n_ge = sum(p[2] for p in parts)
+    mean = total / samples
+    sd = np.sqrt(np.maximum(total_sq / samples - mean ** 2, 0.0) * samples / max(samples - 1, 1))
+    return keys, mean, sd, n_ge
+
+
+# ---------------------------
+# 3. エッジ表に列を足す
+# ---------------------------
+def edge_significance(table, edges, null=None, samples=0):
+    """
+    edges（tag1, tag2, weight。タグは table の vocab にあるもの、並びは問わない）に有意性の列を足した DataFrame
+    null = randomized_null(...) の戻り値（samples 回）があれば、ランダム化の列も足す
+    """
+    table = table.unique_per_row()
+    n = table.n_rows
+    doc_freq = table.counts()
+    a = table.lookup(edges["tag1"])
+    b = table.lookup(edges["tag2"])
+    co = edges["weight"].to_numpy()
+    n_tests = table.n_tags * (table.n_tags - 1) // 2
+
+    expected, z, p = hypergeom_test(co, doc_freq[a], doc_freq[b], n)
+    out = edges.assign(
+        expected=expected,
+        z_hypergeom=z,
+        p_hypergeom=p,
+        q_hypergeom=bh_adjust(p, n_tests),
+    )
+    if null is not None:
+        # ランダム化の結果は組の key 順なので、edges の並びに合わせる
+        keys, mean, sd, n_ge = null
+        pos = np.searchsorted(keys, np.minimum(a, b).astype(np.int64) * table.n_tags + np.maximum(a, b))
+        mean, sd, n_ge = mean[pos], sd[pos], n_ge[pos]
+        p_null = (n_ge + 1) / (samples + 1)
+        out = out.assign(
+            null_mean=mean,
+            null_sd=sd,
+            z_null=np.divide(co - mean, sd, out=np.full(len(co), np.nan), where=sd > 0),
+            p_null=p_null,
+            q_null=bh_adjust(p_null, n_tests),
+        )
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser(description="共起エッジの curveball ランダム化（並列）")
+    ap.add_argument("--tags", required=True, help="save_table で書いた TagTable（.npz）")
+    ap.add_argument("--out", required=True, help="keys / null_mean / null_sd / n_ge の .npz")
+    ap.add_argument("--samples", type=int, default=200)
+    ap.add_argument("--burn-in", type=int, default=50)
+    ap.add_argument("--thin", type=int, default=5)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1))
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
+    table = load_table(args.tags)
+    keys, mean, sd, n_ge = randomized_null(
+        table,
+        samples=args.samples,
+        n_workers=args.workers,
+        burn_in=args.burn_in,
+        thin=args.thin,
+        seed=args.seed,
+    )
+    np.savez(args.out, keys=keys, null_mean=mean, null_sd=sd, n_ge=n_ge, samples=args.samples)
+    print(f"ランダム化 {args.samples} 回（{time.perf_counter() - t0:.1f}s）→ {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+# ========================================
+# タグの頻出アイテムセット（3〜5個のタグの組み合わせ。例：医療 × AI × SaaS）
+#  - タグ列のパースは tag_parse.py（REMOVE_TAGS の事業形態タグも同じく除く）
+#  - Eclat（縦持ち）：タグごとに「そのタグを持つ企業」のビット列（Python int）を持ち、
+#    組み合わせの企業数は AND → bit_count で数える。企業数が min_count 未満になった枝は打ち切る
+#    （全組み合わせを combinations で作らない。メモリはタグ数 × 企業数ビット程度）
+#  - 並列：先頭のタグごとに部分木を分けてワーカープロセスで探索
+#  - 出力：itemset ごとの企業数（count）・support（企業数 / 全企業数）・lift
+#      lift = support(itemset) / Π support(各タグ)  （各タグが独立に付くと仮定したときの何倍か）
+#
+#  使い方（co_occurrence_new.py から自動で呼ばれる。単体でも実行可）:
+#    python itemsets.py --csv <CSV> --out tag_itemsets.csv --min-support 0.005 --max-len 5 --workers 4
+#    （co_occurrence_new.py からはパース済みの TagTable を --tags <.npz>（tag_parse.save_table）で渡す）
+# ========================================
+
+import argparse
+import math
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from tag_parse import REMOVE_TAGS, parse_tags, load_table
+from pipeline import run_pool
+
+# ワーカー側で持つ 1タグ目候補のビット列（initializer で受け取る）
+_items = None
+_min_count = None
+_max_len = None
+
+
+# ---------------------------
+# 1. 縦持ちビット列
+# ---------------------------
+def item_bitsets(table, min_count):
+    """
+    TagTable → 企業数 min_count 以上のタグの [(tag id, ビット列, 企業数)]（企業数の少ない順）
+    ビット i = 行 i の企業がそのタグを持つ
+    """
+    table = table.unique_per_row()
+    doc_freq = table.counts()
+    frequent = np.flatnonzero(doc_freq >= min_count)
+    # 企業数の少ない順に並べると、後ろ（多い方）との AND だけを見れば良く、部分木も小さくなる
+    frequent = frequent[np.argsort(doc_freq[frequent], kind="stable")]
+
+    rows = table.row_index()
+    order = np.argsort(table.ids, kind="stable")
+    starts = np.r_[0, np.cumsum(doc_freq)]
+    items = []
+    for t in frequent:
+        mask = np.zeros(table.n_rows, dtype=bool)
+        mask[rows[order[starts[t]:starts[t + 1]]]] = True
+        bits = int.from_bytes(np.packbits(mask, bitorder="little").tobytes(), "little")
+        items.append((int(t), bits, int(doc_freq[t])))
+    return items
+
+
+# ---------------------------
+# 2. Eclat
+# ---------------------------
+def _eclat(prefix, items, min_count, max_len, out):
+    """items：prefix と一緒に min_count 社以上に付いている [(tag id, ビット列, 企業数)]"""
+    for i, (a, bits_a, cnt_a) in enumerate(items):
+        itemset = prefix + (a,)
+        out.append((itemset, cnt_a))
+        if len(itemset) >= max_len:
+            continue
+        ext = []
+        for b, bits_b, _ in items[i + 1:]:
+            bits = bits_a & bits_b
+            c = bits.bit_count()
+            if c >= min_count:
+                ext.append((b, bits, c))
+        if ext:
+            _eclat(itemset, ext, min_count, max_len, out)
+
+
+def _mine_from(i):
+    """items[i] を先頭に持つ itemset 全部（items[i + 1:] だけを足していく）"""
+    a, bits_a, cnt_a = _items[i]
+    out = [((a,), cnt_a)]
+    if _max_len < 2:
+        return out
+    ext = []
+    for b, bits_b, _ in _items[i + 1:]:
+        bits = bits_a & bits_b
+        c = bits.bit_count()
+        if c >= _min_count:
+            ext.append((b, bits, c))
+    if ext:
+        _eclat((a,), ext, _min_count, _max_len, out)
+    return out
+
+
+def _init_worker(items, min_count, max_len):
+    global _items, _min_count, _max_len
+    _items, _min_count, _max_len = items, min_count, max_len
+
+
+def mine_itemsets(table, min_support=0.005, min_len=3, max_len=5, n_workers=1):
+    """
+    TagTable → 頻出アイテムセットの DataFrame
+    min_support：全企業に対する割合（1 以上を渡すと企業数として扱う）
+    列：length, itemset（タグを " × " で連結）, tags（タプル）, count, support, lift
+    """
+    n_rows = table.n_rows
+    min_count = int(min_support) if min_support >= 1 else max(1, math.ceil(min_support * n_rows))
+    items = item_bitsets(table, min_count)
+    print(f"頻出タグ（{min_count}社以上）: {len(items)}")
+
+    # 企業数の少ないタグほど後ろに足せるタグが多く部分木が大きい（run_pool が1件ずつ配る）
+    parts = run_pool(_mine_from, range(len(items)), n_workers, _init_worker, (items, min_count, max_len))
+    found = [x for part in parts for x in part]
+
+    item_support = {t: c / n_rows for t, _, c in items}
+    recs = []
+    for itemset, cnt in found:
+        if len(itemset) < min_len:
+            continue
+        tags = tuple(sorted(table.vocab[list(itemset)].tolist()))
+        support = cnt / n_rows
+        expected = math.prod(item_support[t] for t in itemset)
+        recs.append({
+            "length": len(itemset),
+            "itemset": " × ".join(tags),
+            "tags": tags,
+            "count": cnt,
+            "support": support,
+            "lift": support / expected,
+        })
+    cols = ["length", "itemset", "tags", "count", "support", "lift"]
+    result = pd.DataFrame(recs, columns=cols)
+    return result.sort_values(["length", "count", "itemset"], ascending=[True, False, True], ignore_index=True)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="タグの頻出アイテムセット（Eclat・並列）")
+    src = ap.add_mutually_exclusive_group(required=True)
+    src.add_argument("--csv")
+    src.add_argument("--tags", help="tag_parse.save_table で書いた TagTable（.npz）。パース済みなので --col などは使わない")
+    ap.add_argument("--col", default="タグ")
+    ap.add_argument("--out", default="tag_itemsets.csv")
+    ap.add_argument("--min-support", type=float, default=0.005, help="割合（1 以上なら企業数）")
+    ap.add_argument("--min-len", type=int, default=3)
+    ap.add_argument("--max-len", type=int, default=5)
+    ap.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1))
+    ap.add_argument("--keep-business-model-tags", action="store_true", help="REMOVE_TAGS を除かない")
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
+    if args.tags:
+        table = load_table(args.tags)
+    else:
+        tag_col = pd.read_csv(args.csv, usecols=[args.col], encoding="utf-8-sig")[args.col]
+        table = parse_tags(tag_col, remove_tags=() if args.keep_business_model_tags else REMOVE_TAGS)
+    result = mine_itemsets(
+        table,
+        min_support=args.min_support,
+        min_len=args.min_len,
+        max_len=args.max_len,
+        n_workers=args.workers,
+    )
+    result.drop(columns="tags").to_csv(args.out, index=False, encoding="utf-8-sig")
+    print(f"itemset 数: {len(result)}（{time.perf_counter() - t0:.1f}s）→ {args.out}")
+    print(result.groupby("length").size().to_string())
+    print(result.sort_values("lift", ascending=False).head(10).drop(columns="tags").to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
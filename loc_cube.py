@@ -0,0 +1,192 @@
+# ========================================
+# LocName（例：東京都/渋谷区/渋谷/２丁目）の階層ロールアップ・キューブ
+#  - LocName を 1回だけ 都道府県 / 市区町村 / 町 / 丁目 の4階層に分解して整数コード化
+#  - 最下層（丁目）× カテゴリの集計行列を全都道府県ぶん1回で作る
+#  - 上位階層への集計・都道府県での切り出しは、行列の区間和（np.add.reduceat）だけで済む
+# ========================================
+
+import numpy as np
+import pandas as pd
+
+LEVELS = ("prefecture", "ward", "town", "chome")
+
+# 階層キーの区切り。地名に出てくるどの文字よりも小さいので、キーを sort すると
+# (都道府県, 市区町村, 町, 丁目) のタプル順になり、同じ親の子が必ず連続する
+# （"\x00" は numpy の文字列配列で末尾が落ちるので使わない）
+_SEP = "\x01"
+
+
+class LocCube:
+    """
+    leaf（丁目）× カテゴリの集計行列と、各階層の区間情報を持つ。
+
+    level_names[k]  : 階層 k の単位名（"東京都/渋谷区" のようなフルパス）
+    level_starts[k] : 階層 k の各単位が始まる leaf 番号（leaf は階層順に sort 済み）
+    measures[name]  : (n_leaf, n_cat) の集計行列
+    """
+
+    def __init__(self, level_names, level_starts, categories, measures):
+        self.level_names = [np.asarray(a) for a in level_names]
+        self.level_starts = [np.asarray(a, dtype=np.int64) for a in level_starts]
+        self.categories = np.asarray(categories)
+        self.measures = dict(measures)
+
+    @property
+    def n_leaf(self):
+        return len(self.level_names[-1])
+
+    def _level(self, level):
+        return LEVELS.index(level) if isinstance(level, str) else int(level)
+
+    def level_codes(self, level):
+        """leaf ごとの、階層 level での単位コード"""
+        starts = self.level_starts[self._level(level)]
+        return np.repeat(np.arange(len(starts)), np.diff(np.r_[starts, self.n_leaf]))
+
+    def rollup(self, measure, level):
+        """階層 level に集計した (単位名, (n_unit, n_cat) 行列)"""
+        k = self._level(level)
+        m = self.measures[measure]
+        if k == len(LEVELS) - 1:
+            return self.level_names[k], m
+        if self.n_leaf == 0:
+            return self.level_names[k], m[:0]
+        return self.level_names[k], np.add.reduceat(m, self.level_starts[k], axis=0)
+
+    def slice(self, measure, level, prefecture):
+        """都道府県 prefecture の中だけを階層 level に集計"""
+        k = self._level(level)
+        pref_names = self.level_names[0]
+        p = int(np.searchsorted(pref_names, prefecture))
+        if p >= len(pref_names) or pref_names[p] != prefecture:
+            raise KeyError(prefecture)
+        lo = self.level_starts[0][p]
+        hi = self.level_starts[0][p + 1] if p + 1 < len(pref_names) else self.n_leaf
+        # 階層 k の単位のうち leaf 区間 [lo, hi) に入るもの
+        starts = self.level_starts[k]
+        u_lo, u_hi = np.searchsorted(starts, [lo, hi])
+        m = self.measures[measure][lo:hi]
+        if k == len(LEVELS) - 1:
+            return self.level_names[k][u_lo:u_hi], m
+        return self.level_names[k][u_lo:u_hi], np.add.reduceat(m, starts[u_lo:u_hi] - lo, axis=0)
+
+    def to_frame(self, measure, level, prefecture=None, value_col="count", drop_zero=True):
+        """[地域, category, value_col] のロング形式（tag_genre.py の集計CSVと同じ形）"""
+        if prefecture is None:
+            names, m = self.rollup(measure, level)
+        else:
+            names, m = self.slice(measure, level, prefecture)
+        if m.ndim == 1:
+            # "firms" のようにカテゴリ軸を持たない measure
+            out = pd.DataFrame({LEVELS[self._level(level)]: names, value_col: m})
+            return out[out[value_col] != 0].reset_index(drop=True) if drop_zero else out
+        out = pd.DataFrame({
+            LEVELS[self._level(level)]: np.repeat(names, m.shape[1]),
+            "category": np.tile(self.categories, m.shape[0]),
+            value_col: m.ravel(),
+        })
+        if drop_zero:
+            out = out[out[value_col] != 0].reset_index(drop=True)
+        return out
+
+    def save(self, path):
+        arrays = {"categories": self.categories}
+        for k, level in enumerate(LEVELS):
+            arrays[f"names_{level}"] = self.level_names[k]
+            arrays[f"starts_{level}"] = self.level_starts[k]
+        for name, m in self.measures.items():
+            arrays[f"measure_{name}"] = m
+        np.savez_compressed(path, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as z:
+            level_names = [z[f"names_{level}"] for level in LEVELS]
+            level_starts = [z[f"starts_{level}"] for level in LEVELS]
+            measures = {
+                key[len("measure_"):]: z[key] for key in z.files if key.startswith("measure_")
+            }
+            return cls(level_names, level_starts, z["categories"], measures)
+
+
+def parse_locname(loc):
+    """
+    LocName の Series → (行ごとの leaf コード（欠損は -1）, level_names, level_starts)
+    階層が足りない LocName（"東京都/港区/赤坂" など）は下の階層を空文字として扱う
+    """
+    s = pd.Series(loc).fillna("").astype(str).str.strip()
+    parts = s.str.split("/", n=len(LEVELS) - 1, expand=True)
+    parts = parts.reindex(columns=range(len(LEVELS))).fillna("")
+
+    key = parts[0]
+    for k in range(1, len(LEVELS)):
+        key = key + _SEP + parts[k]
+    leaf_codes, leaf_keys = pd.factorize(key.where(s != ""), sort=True)
+    leaf_keys = leaf_keys.to_numpy().astype(str)
+
+    # leaf（ユニーク・階層順）ごとの各階層キー → 各単位の区間の始まり
+    leaf_parts = (
+        pd.Series(leaf_keys, dtype=object)
+        .str.split(_SEP, expand=True)
+        .reindex(columns=range(len(LEVELS)))
+        .fillna("")
+    )
+    level_names, level_starts = [], []
+    level_key = display = None
+    for k in range(len(LEVELS)):
+        part = leaf_parts[k]
+        if k == 0:
+            level_key, display = part, part
+        else:
+            level_key = level_key + _SEP + part
+            display = display.where(part == "", display + "/" + part)
+        key_arr = level_key.to_numpy()
+        starts = np.flatnonzero(np.r_[len(key_arr) > 0, key_arr[1:] != key_arr[:-1]])
+        level_names.append(display.to_numpy()[starts].astype(str))
+        level_starts.append(starts)
+    return leaf_codes.astype(np.int64), level_names, level_starts
+
+
+def build_cube(loc, categories, cats_per_row, primaries=None):
+    """
+    全行（全都道府県）ぶんのキューブを1回で作る。
+
+    loc          : LocName の Series
+    categories   : カテゴリ名の並び
+    cats_per_row : 行ごとのカテゴリ名リスト（categories_tags）
+    primaries    : {measure名: 行ごとの代表カテゴリ Series（None 可）}
+    measures には "firms"（leaf ごとの企業数）, "multilabel", "fractional" と primaries が入る
+    """
+    leaf_codes, level_names, level_starts = parse_locname(loc)
+    categories = np.asarray(categories, dtype=str)
+    n_leaf, n_cat = len(level_names[-1]), len(categories)
+    size = n_leaf * n_cat
+
+    def to_codes(values):
+        return pd.Categorical(values, categories=categories).codes.astype(np.int64)
+
+    cats_per_row = pd.Series(cats_per_row).reset_index(drop=True)
+    n_cats_row = cats_per_row.str.len().fillna(0).to_numpy().astype(np.int64)
+    exploded = cats_per_row.explode()
+    has_cat = exploded.notna().to_numpy()
+    row_pos = np.repeat(np.arange(len(cats_per_row)), np.maximum(n_cats_row, 1))[has_cat]
+    ex_leaf = leaf_codes[row_pos]
+    ok = ex_leaf >= 0
+    ex_key = ex_leaf[ok] * n_cat + to_codes(exploded[has_cat])[ok]
+
+    measures = {
+        "firms": np.bincount(leaf_codes[leaf_codes >= 0], minlength=n_leaf).astype(np.int32),
+        "multilabel": np.bincount(ex_key, minlength=size).reshape(n_leaf, n_cat).astype(np.int32),
+        "fractional": np.bincount(
+            ex_key, weights=1.0 / n_cats_row[row_pos][ok], minlength=size
+        ).reshape(n_leaf, n_cat),
+    }
+    for name, values in (primaries or {}).items():
+        codes = to_codes(pd.Series(values).reset_index(drop=True))
+        ok = (codes >= 0) & (leaf_codes >= 0)
+        measures[name] = (
+            np.bincount(leaf_codes[ok] * n_cat + codes[ok], minlength=size)
+            .reshape(n_leaf, n_cat)
+            .astype(np.int32)
+        )
+    return LocCube(level_names, level_starts, categories, measures), leaf_codes
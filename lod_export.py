@@ -0,0 +1,437 @@
+# ========================================
+# 全体ネットワークの段階読み込み（level of detail）用の書き出し
+#  - cooccurrence_network_overall_100plus*.html は weight >= 100 のエッジだけ（全部入れるとブラウザが固まる）
+#    → ここでは全エッジを書き出し、ビューア（index.html）がズーム・展開に合わせて必要な分だけ fetch する
+#  - 引いた表示：コミュニティを1つのノード（スーパーノード）にまとめ、コミュニティ間の weight 合計をスーパーエッジに
+#    → 最初に読むのは lod_index.json（コミュニティ数・階層数ぶんだけ。エッジ総数に依らない）
+#  - エッジの階層（tier）：weight 降順の順位で区切る。階層 k は TIER0_EDGES × 2^k 本
+#    （同じ weight は同じ階層に入れるので、階層 k まで = weight >= min_weight の部分グラフ）
+#  - ファイル：nodes/c{コミュニティ}.json（タグ・座標）、edges/t{階層}_c{コミュニティ}_{連番}.json
+#    コミュニティ c のファイルには c の中のエッジと、c と他のコミュニティをつなぐエッジ（両方のファイルに入る）
+#  - 座標：コミュニティの配置（スーパーエッジで spring_layout）＋ コミュニティ内の配置（weight 上位 LAYOUT_EDGES 本で spring_layout）
+#    を事前に計算して JSON に入れる（ブラウザ側では物理演算しない）
+#
+#  co_occurrence.py から自動で呼ばれる。単体でも実行可（コミュニティは tag_communities_*.csv を使う）:
+#    python lod_export.py --csv <CSV> --communities co_occurrence_output/tag_communities_all_edges_louvain.csv \
+#        --out-dir co_occurrence_output/lod
+#  表示（fetch を使うので file:// では開けない）:
+#    python -m http.server --directory co_occurrence_output/lod 8000  → http://localhost:8000/
+# ========================================
+
+import argparse
+import json
+import math
+import os
+import shutil
+
+import networkx as nx
+import numpy as np
+import pandas as pd
+
+from tag_parse import parse_tags, count_pairs
+from threshold_index import build_threshold_index
+
+TIER0_EDGES = 2000    # 最初の階層のエッジ数（以降 2 倍ずつ）
+CHUNK_EDGES = 20000   # 1ファイルに入れるエッジ数の上限
+LAYOUT_EDGES = 5000   # コミュニティ内の配置に使うエッジ数（weight 上位）
+LABEL_TAGS = 3        # スーパーノードのラベルに出すタグ数
+NODE_RADIUS = 40.0    # コミュニティの半径 = NODE_RADIUS × sqrt(タグ数)
+
+INDEX_JSON = "lod_index.json"
+VIEWER_HTML = "index.html"
+
+
+# ---------------------------
+# 1. 階層・コミュニティの割り当て
+# ---------------------------
+def tier_bounds(index, tier0_edges=TIER0_EDGES):
+    """weight 降順の順位で区切った階層の境界（bounds[k]:bounds[k + 1] が階層 k）。同じ weight は分けない"""
+    n = len(index)
+    bounds = [0]
+    size = tier0_edges
+    while bounds[-1] < n:
+        end = min(n, bounds[-1] + size)
+        # 区切りの weight と同じエッジは全部この階層に入れる
+        end = index.count(threshold=index.weights[end - 1])
+        bounds.append(end)
+        size *= 2
+    return np.array(bounds, dtype=np.int64)
+
+
+def node_communities(index, tag_to_comm):
+    """ノード id → コミュニティ id。どのコミュニティにも入っていないタグは最後の1つ（id = コミュニティ数）にまとめる"""
+    comm = pd.Series(index.node_names).map(tag_to_comm).to_numpy(dtype=float)
+    n_comm = int(np.nanmax(comm)) + 1 if np.isfinite(comm).any() else 0
+    if np.isnan(comm).any():
+        comm[np.isnan(comm)] = n_comm
+        n_comm += 1
+    return comm.astype(np.int64), n_comm
+
+
+def super_edges(index, weight, node_comm, n_comm):
+    """コミュニティ間のエッジを (comm_a < comm_b) ごとにまとめる → from, to, weight 合計, エッジ数"""
+    ca, cb = node_comm[index.src], node_comm[index.dst]
+    inter = ca != cb
+    lo, hi = np.minimum(ca, cb)[inter], np.maximum(ca, cb)[inter]
+    w = weight[inter]
+    keys, inv = np.unique(lo * n_comm + hi, return_inverse=True)
+    return keys // n_comm, keys % n_comm, np.bincount(inv, weights=w).astype(np.int64), np.bincount(inv)
+
+
+def intra_edges(index, node_comm, n_comm):
+    """
+    コミュニティ内（両端が同じ node_comm）のエッジを (コミュニティ, weight 降順) に並べた edge id と、コミュニティごとの offsets
+    「どこにも入っていない」バケットは ThresholdIndex のグループではないので index.edge_ids(group=...) は使わない
+    """
+    order = index.order
+    comm = node_comm[index.src[order]]
+    same = comm == node_comm[index.dst[order]]
+    ids = order[same][np.argsort(comm[same], kind="stable")]
+    offsets = np.r_[0, np.cumsum(np.bincount(comm[same], minlength=n_comm))].astype(np.int64)
+    return ids, offsets
+
+
+# ---------------------------
+# 2. 座標（コミュニティの配置 ＋ コミュニティ内の配置）
+# ---------------------------
+def layout_positions(index, node_comm, n_comm, s_from, s_to, s_weight, intra, layout_edges=LAYOUT_EDGES, seed=0):
+    """ノード id ごとの (x, y)、コミュニティごとの中心 (x, y) と半径。intra は intra_edges() の結果"""
+    sizes = np.bincount(node_comm, minlength=n_comm)
+    radius = NODE_RADIUS * np.sqrt(np.maximum(sizes, 1))
+
+    # コミュニティの配置：スーパーエッジの weight（対数）で spring_layout
+    G_super = nx.Graph()
+    G_super.add_nodes_from(range(n_comm))
+    for a, b, w in zip(s_from.tolist(), s_to.tolist(), s_weight.tolist()):
+        G_super.add_edge(a, b, weight=math.log1p(w))
+    pos_super = nx.spring_layout(G_super, seed=seed, weight="weight")
+    # [-1, 1] の範囲を、全コミュニティの円の面積が収まるくらいに広げる
+    spread = 1.5 * math.sqrt(float((radius ** 2).sum()))
+    center = np.array([pos_super[c] for c in range(n_comm)], dtype=float).reshape(n_comm, 2) * spread
+
+    # コミュニティ内：中のエッジの weight 上位だけでレイアウトし、中心のまわりに半径 radius で置く
+    xy = np.zeros((index.n_nodes, 2))
+    members = np.argsort(node_comm, kind="stable")
+    starts = np.r_[0, np.cumsum(sizes)]
+    intra_ids, intra_offsets = intra
+    for c in range(n_comm):
+        nodes_c = members[starts[c]:starts[c + 1]]
+        if len(nodes_c) == 1:
+            xy[nodes_c] = center[c]
+            continue
+        G_c = nx.Graph()
+        G_c.add_nodes_from(nodes_c.tolist())
+        ids = intra_ids[intra_offsets[c]:intra_offsets[c + 1]][:layout_edges]
+        for a, b in zip(index.src[ids].tolist(), index.dst[ids].tolist()):
+            G_c.add_edge(a, b)
+        pos_c = nx.spring_layout(G_c, seed=seed, iterations=50)
+        xy[nodes_c] = np.array([pos_c[n] for n in nodes_c.tolist()]) * radius[c] + center[c]
+    return xy, center, radius
+
+
+# ---------------------------
+# 3. 書き出し
+# ---------------------------
+def _dump(path, obj):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(obj, f, ensure_ascii=False, separators=(",", ":"))
+
+
+def export_lod(edges, tag_to_comm, out_dir, index=None, tier0_edges=TIER0_EDGES,
+               chunk_edges=CHUNK_EDGES, layout_edges=LAYOUT_EDGES, seed=0):
+    """
+    edges（tag1, tag2, weight）と tag→コミュニティ から、段階読み込み用の JSON 一式とビューアを out_dir に書く
+    index は build_threshold_index(edges, tag_to_comm) の結果（あれば使い回す）
+    戻り値：lod_index.json の中身（dict）
+    """
+    if index is None:
+        index = build_threshold_index(edges, tag_to_comm)
+    weight = np.asarray(edges["weight"].to_numpy(), dtype=np.int64)
+    node_comm, n_comm = node_communities(index, tag_to_comm)
+    s_from, s_to, s_weight, s_count = super_edges(index, weight, node_comm, n_comm)
+    intra = intra_edges(index, node_comm, n_comm)
+    xy, center, radius = layout_positions(index, node_comm, n_comm, s_from, s_to, s_weight, intra, layout_edges, seed)
+
+    # 前回の分は消してから書く（コミュニティ数・階層数が変わると古いファイルが残るので）
+    for sub in ("nodes", "edges"):
+        shutil.rmtree(os.path.join(out_dir, sub), ignore_errors=True)
+        os.makedirs(os.path.join(out_dir, sub))
+
+    # ノードの強さ（そのタグのエッジの weight 合計）。ラベルの順とノードの大きさに使う
+    strength = np.bincount(index.src, weights=weight, minlength=index.n_nodes)
+    strength += np.bincount(index.dst, weights=weight, minlength=index.n_nodes)
+    names = np.asarray(index.node_names, dtype=object)
+
+    members = np.lexsort((-strength, node_comm))
+    starts = np.r_[0, np.cumsum(np.bincount(node_comm, minlength=n_comm))]
+    communities = []
+    for c in range(n_comm):
+        nodes_c = members[starts[c]:starts[c + 1]]
+        path = f"nodes/c{c}.json"
+        _dump(os.path.join(out_dir, path), {
+            "id": nodes_c.tolist(),
+            "label": names[nodes_c].tolist(),
+            "x": np.round(xy[nodes_c, 0], 1).tolist(),
+            "y": np.round(xy[nodes_c, 1], 1).tolist(),
+            "strength": strength[nodes_c].astype(np.int64).tolist(),
+        })
+        communities.append({
+            "id": c,
+            "label": " / ".join(names[nodes_c[:LABEL_TAGS]].tolist()),
+            "size": len(nodes_c),
+            "intra_edges": int(intra[1][c + 1] - intra[1][c]),
+            "x": round(float(center[c, 0]), 1),
+            "y": round(float(center[c, 1]), 1),
+            "radius": round(float(radius[c]), 1),
+            "nodes": path,
+            "edges": [],
+        })
+
+    # エッジ → (階層, コミュニティ)。コミュニティ間のエッジは両側のコミュニティに入れる
+    bounds = tier_bounds(index, tier0_edges)
+    rank = np.empty(len(index), dtype=np.int64)
+    rank[index.order] = np.arange(len(index))
+    ca, cb = node_comm[index.src], node_comm[index.dst]
+    inter = np.flatnonzero(ca != cb)
+    e_id = np.r_[np.arange(len(index)), inter]
+    e_comm = np.r_[ca, cb[inter]]
+    e_tier = np.searchsorted(bounds, rank[e_id], side="right") - 1
+    order = np.lexsort((rank[e_id], e_comm, e_tier))
+    e_id, e_comm, e_tier = e_id[order], e_comm[order], e_tier[order]
+
+    n_tiers = len(bounds) - 1
+    for comm in communities:
+        comm["edges"] = [[] for _ in range(n_tiers)]
+    cut = np.flatnonzero(np.diff(e_tier * n_comm + e_comm)) + 1
+    # エッジが1本もないときは区間 [0, 0) だけになり e_tier[0] が読めないので、ファイルは書かない
+    if len(e_id):
+        for a, b in zip(np.r_[0, cut].tolist(), np.r_[cut, len(e_id)].tolist()):
+            t, c = int(e_tier[a]), int(e_comm[a])
+            for p, s in enumerate(range(a, b, chunk_edges)):
+                ids = e_id[s:min(b, s + chunk_edges)]
+                path = f"edges/t{t}_c{c}_{p}.json"
+                _dump(os.path.join(out_dir, path), {
+                    "from": index.src[ids].tolist(),
+                    "to": index.dst[ids].tolist(),
+                    "weight": weight[ids].tolist(),
+                })
+                communities[c]["edges"][t].append(path)
+
+    tiers = [
+        {
+            "tier": t,
+            "max_weight": int(index.weights[bounds[t]]),
+            "min_weight": int(index.weights[bounds[t + 1] - 1]),
+            "edges": int(bounds[t + 1] - bounds[t]),
+        }
+        for t in range(n_tiers)
+    ]
+    meta = {
+        "n_nodes": int(index.n_nodes),
+        "n_edges": len(index),
+        "tiers": tiers,
+        "communities": communities,
+        "super_edges": {
+            "from": s_from.tolist(),
+            "to": s_to.tolist(),
+            "weight": s_weight.tolist(),
+            "edges": s_count.tolist(),
+        },
+    }
+    _dump(os.path.join(out_dir, INDEX_JSON), meta)
+    with open(os.path.join(out_dir, VIEWER_HTML), "w", encoding="utf-8") as f:
+        f.write(VIEWER_TEMPLATE.replace("__INDEX_JSON__", INDEX_JSON))
+    return meta
+
+
+# ---------------------------
+# 4. ビューア（vis-network。PyVis の HTML と同じ CDN）
+#    - 最初はスーパーノード・スーパーエッジだけ。ダブルクリックでコミュニティを展開 / 展開したタグのダブルクリックで畳む
+#    - ズームインすると次の階層のエッジを、展開中のコミュニティの分だけ fetch（「詳細」ボタンでも変えられる）
+# ---------------------------
+VIEWER_TEMPLATE = """<!DOCTYPE html>
+<html lang="ja">
+<head>
+<meta charset="utf-8">
+<title>タグ共起ネットワーク（段階読み込み）</title>
+<script src="https://cdnjs.cloudflare.com/ajax/libs/vis-network/9.1.2/dist/vis-network.min.js"></script>
+<style>
+  body { margin: 0; font-family: sans-serif; }
+  #bar { padding: 6px 10px; border-bottom: 1px solid #ddd; font-size: 13px; }
+  #bar button { margin-right: 4px; }
+  #net { width: 100%; height: calc(100vh - 40px); }
+</style>
+</head>
+<body>
+<div id="bar">
+  <button id="less">詳細 −</button><button id="more">詳細 ＋</button>
+  <button id="expandAll">すべて展開</button><button id="collapseAll">すべて畳む</button>
+  <span id="status">読み込み中…</span>
+</div>
+<div id="net"></div>
+<script>
+const nodes = new vis.DataSet();
+const edges = new vis.DataSet();
+const expanded = new Map();  // コミュニティ id → 読み込み済みの階層（-1 = ノードだけ）
+const cache = new Map();     // ファイル名 → fetch 済みの JSON（Promise）
+let meta, network, baseScale = null, detail = 0, busy = Promise.resolve();
+
+function load(path) {
+  if (!cache.has(path)) cache.set(path, fetch(path).then(r => r.json()));
+  return cache.get(path);
+}
+
+function superNode(c) {
+  return {
+    id: "c" + c.id, label: c.label, shape: "dot", group: c.id, x: c.x, y: c.y,
+    value: c.size, title: `Community: ${c.id}<br>タグ数: ${c.size}<br>内部エッジ数: ${c.intra_edges}<br>ダブルクリックで展開`,
+  };
+}
+
+function addSuperEdges(c) {
+  const s = meta.super_edges, add = [];
+  for (let k = 0; k < s.from.length; k++) {
+    const a = s.from[k], b = s.to[k];
+    if ((c !== undefined && a !== c && b !== c) || expanded.has(a) || expanded.has(b)) continue;
+    add.push({ id: "s" + k, from: "c" + a, to: "c" + b, value: s.weight[k], color: { opacity: 0.3 },
+               title: `共起回数合計: ${s.weight[k]}（${s.edges[k]} 本）` });
+  }
+  edges.update(add);
+}
+
+async function loadEdges(c, upto) {
+  const comm = meta.communities[c];
+  for (let t = expanded.get(c) + 1; t <= upto; t++) {
+    const parts = await Promise.all(comm.edges[t].map(load));
+    if (!expanded.has(c)) return;
+    const add = [];
+    for (const e of parts) {
+      for (let k = 0; k < e.from.length; k++) {
+        // 相手側のコミュニティが畳まれているエッジは、そちらを展開したときに足す
+        if (!nodes.get("n" + e.from[k]) || !nodes.get("n" + e.to[k])) continue;
+        add.push({ id: `e${e.from[k]}_${e.to[k]}`, from: "n" + e.from[k], to: "n" + e.to[k],
+                   value: e.weight[k], tier: t, title: `共起回数: ${e.weight[k]}` });
+      }
+    }
+    edges.update(add);
+    expanded.set(c, t);
+  }
+}
+
+async function expand(c) {
+  if (expanded.has(c)) return;
+  const n = await load(meta.communities[c].nodes);
+  if (expanded.has(c)) return;
+  expanded.set(c, -1);
+  edges.remove(edges.getIds({ filter: e => e.from === "c" + c || e.to === "c" + c }));
+  nodes.remove("c" + c);
+  nodes.add(n.id.map((id, k) => ({
+    id: "n" + id, label: n.label[k], x: n.x[k], y: n.y[k], group: c, value: n.strength[k], comm: c,
+    title: `Tag: ${n.label[k]}<br>Community: ${c}<br>ダブルクリックでコミュニティを畳む`,
+  })));
+  await loadEdges(c, detail);
+}
+
+function collapse(c) {
+  if (!expanded.has(c)) return;
+  const ids = new Set(nodes.getIds({ filter: n => n.comm === c }));
+  edges.remove(edges.getIds({ filter: e => ids.has(e.from) || ids.has(e.to) }));
+  nodes.remove([...ids]);
+  expanded.delete(c);
+  nodes.add(superNode(meta.communities[c]));
+  addSuperEdges(c);
+}
+
+function setDetail(t) {
+  t = Math.max(0, Math.min(meta.tiers.length - 1, t));
+  if (t === detail) return;
+  if (t < detail) {
+    edges.remove(edges.getIds({ filter: e => e.tier > t }));
+    for (const c of expanded.keys()) expanded.set(c, Math.min(expanded.get(c), t));
+  }
+  detail = t;
+  run(() => Promise.all([...expanded.keys()].map(c => loadEdges(c, t))));
+}
+
+function run(task) {
+  busy = busy.then(task).then(status, err => { console.error(err); status(); });
+}
+
+function status() {
+  const tier = meta.tiers[detail];
+  document.getElementById("status").textContent =
+    `表示中: ノード ${nodes.length} / エッジ ${edges.length}（全 ${meta.n_nodes} / ${meta.n_edges}）` +
+    ` ・ 詳細 ${detail + 1}/${meta.tiers.length}（共起回数 >= ${tier.min_weight}）` +
+    ` ・ 展開中のコミュニティ ${expanded.size}/${meta.communities.length}`;
+}
+
+load("__INDEX_JSON__").then(m => {
+  meta = m;
+  nodes.add(meta.communities.map(superNode));
+  addSuperEdges();
+  network = new vis.Network(document.getElementById("net"), { nodes, edges }, {
+    physics: { enabled: false },
+    interaction: { hover: true, tooltipDelay: 100 },
+    nodes: { shape: "dot", scaling: { min: 5, max: 60 } },
+    edges: { scaling: { min: 0.5, max: 8 }, smooth: false },
+  });
+  network.once("afterDrawing", () => { baseScale = network.getScale(); });
+  network.on("doubleClick", p => {
+    if (!p.nodes.length) return;
+    const id = p.nodes[0];
+    if (id.startsWith("c")) run(() => expand(Number(id.slice(1))));
+    else run(() => collapse(nodes.get(id).comm));
+  });
+  // 2倍ズームするごとに1階層ずつ細かく
+  network.on("zoom", () => {
+    if (baseScale === null) return;
+    const t = Math.floor(Math.log2(network.getScale() / baseScale));
+    if (t > detail) setDetail(t);
+  });
+  document.getElementById("more").onclick = () => setDetail(detail + 1);
+  document.getElementById("less").onclick = () => setDetail(detail - 1);
+  document.getElementById("expandAll").onclick = () =>
+    run(() => Promise.all(meta.communities.map(c => expand(c.id))));
+  document.getElementById("collapseAll").onclick = () =>
+    run(() => [...expanded.keys()].forEach(collapse));
+  status();
+});
+</script>
+</body>
+</html>
+"""
+
+
+def main():
+    ap = argparse.ArgumentParser(description="全体ネットワークの段階読み込み用 JSON・ビューアを書き出す")
+    ap.add_argument("--csv", required=True)
+    ap.add_argument("--col", default="タグ")
+    ap.add_argument("--communities", required=True, help="tag, community_id の CSV（tag_communities_*.csv）")
+    ap.add_argument("--out-dir", default="lod")
+    ap.add_argument("--tier0-edges", type=int, default=TIER0_EDGES)
+    ap.add_argument("--chunk-edges", type=int, default=CHUNK_EDGES)
+    ap.add_argument("--layout-edges", type=int, default=LAYOUT_EDGES)
+    args = ap.parse_args()
+
+    tag_col = pd.read_csv(args.csv, usecols=[args.col], encoding="utf-8-sig")[args.col]
+    tags = parse_tags(tag_col)
+    tag1_ids, tag2_ids, co_weights = count_pairs(tags)
+    edges = pd.DataFrame({"tag1": tags.vocab[tag1_ids], "tag2": tags.vocab[tag2_ids], "weight": co_weights})
+    tag_comm = pd.read_csv(args.communities, encoding="utf-8-sig")
+    tag_to_comm = dict(zip(tag_comm["tag"], tag_comm["community_id"]))
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    meta = export_lod(
+        edges,
+        tag_to_comm,
+        args.out_dir,
+        tier0_edges=args.tier0_edges,
+        chunk_edges=args.chunk_edges,
+        layout_edges=args.layout_edges,
+    )
+    print(f"ノード {meta['n_nodes']}・エッジ {meta['n_edges']}・コミュニティ {len(meta['communities'])}・階層 {len(meta['tiers'])}")
+    print(f"→ {os.path.join(args.out_dir, VIEWER_HTML)}（python -m http.server --directory {args.out_dir} で表示）")
+
+
+if __name__ == "__main__":
+    main()
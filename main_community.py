@@ -1,52 +1,72 @@
+import argparse
+import os
+import tempfile
+
+import numpy as np
 import pandas as pd
-import ast
+
+from community_io import COMPANY_COMM_PARQUET, load_company_communities
+from pipeline import run_script
 
 PATH = "startups_with_communities_louvain.csv"
-df = pd.read_csv(PATH, encoding="utf-8-sig")
-
-# 1. コミュニティIDリストを Python のリストに変換
-def parse_comm_list(x):
-    if pd.isna(x):
-        return []
-    if isinstance(x, list):
-        return x
-    s = str(x).strip()
-    if s == "":
-        return []
-    try:
-        return ast.literal_eval(s)
-    except Exception:
-        # 万一おかしな文字列が来たときは空リストにしておく
-        return []
-
-df["comm_list"] = df["コミュニティIDリスト"].apply(parse_comm_list)
 
-# 2. 「少なくとも1つコミュニティに属している企業」のみカウント対象
-df["num_comms"] = df["comm_list"].apply(len)
-df_comm_valid = df[df["num_comms"] > 0].copy()
+# シェアのブートストラップ区間（bootstrap_share.py）。0 なら点推定だけ
+#   使うときはここを変えるか python main_community.py --bootstrap 5000
+BOOTSTRAP_REPLICATES = 0
+BOOTSTRAP_SEED = 0
+BOOTSTRAP_CI = 95.0
+BOOTSTRAP_WORKERS = max(1, (os.cpu_count() or 2) - 1)
 
-total_firms_with_comm = len(df_comm_valid)
-print(f"少なくとも1つのコミュニティに属している企業数: {total_firms_with_comm}")
+ap = argparse.ArgumentParser(description="コミュニティ別シェア（延べカウント）")
+ap.add_argument("--bootstrap", type=int, default=BOOTSTRAP_REPLICATES, help="ブートストラップの回数（0 なら行わない）")
+BOOTSTRAP_REPLICATES = ap.parse_args().bootstrap
 
-# 3. 延べカウント：企業を「コミュニティごとに」展開して数える
-#    → 1社が [0,1] なら 0側・1側の両方に1社としてカウント
-df_exploded = df_comm_valid[["comm_list"]].explode("comm_list")
-df_exploded = df_exploded.rename(columns={"comm_list": "community_id"})
+# 1. 企業 × コミュニティ所属を (company_row, community_id) のロング形式で読む
+#    co_occurrence の Parquet があればその2列だけ、なければ CSV の「コミュニティIDリスト_str」を split
+company_row, community_id, n_companies, src = load_company_communities(COMPANY_COMM_PARQUET, PATH)
+print(f"読み込み: {src}（企業数 {n_companies}, 所属行数 {len(community_id)}）")
 
-# コミュニティごとの企業数（延べ）
-comm_counts = df_exploded["community_id"].value_counts().sort_index()
+# 2. 「少なくとも1つコミュニティに属している企業」のみカウント対象
+total_firms_with_comm = len(np.unique(company_row))
+print(f"少なくとも1つのコミュニティに属している企業数: {total_firms_with_comm}")
+
+# 3. 延べカウント：1社が [0,1] なら 0側・1側の両方に1社としてカウント
+#    （ロング形式は1社1コミュニティ1行なので、community_id の bincount がそのまま延べ企業数）
+counts = np.bincount(community_id)
+present = np.flatnonzero(counts)
 
 # 割合（母数 = total_firms_with_comm）
 comm_share = (
-    comm_counts
-    .to_frame(name="n_firms")
+    pd.DataFrame(
+        {"n_firms": counts[present]},
+        index=pd.Index(present, name="community_id"),
+    )
     .assign(
         pct=lambda d: d["n_firms"] / total_firms_with_comm * 100
     )
 )
 
+# 3-2. ブートストラップ（企業を復元抽出して pct を作り直す）→ pct_se, pct_lo, pct_hi
+if BOOTSTRAP_REPLICATES > 0:
+    with tempfile.TemporaryDirectory() as tmp:
+        boot_path = os.path.join(tmp, "bootstrap.csv")
+        run_script(
+            "bootstrap_share.py",
+            "--parquet", COMPANY_COMM_PARQUET,
+            "--csv", PATH,
+            "--out", boot_path,
+            "--replicates", BOOTSTRAP_REPLICATES,
+            "--seed", BOOTSTRAP_SEED,
+            "--ci", BOOTSTRAP_CI,
+            "--workers", BOOTSTRAP_WORKERS,
+        )
+        boot = pd.read_csv(boot_path, index_col="community_id", encoding="utf-8-sig")
+    comm_share = comm_share.join(boot[["pct_se", "pct_lo", "pct_hi"]])
+
 print("\n=== コミュニティ別シェア（延べカウント） ===")
 print("※母数 = 少なくとも1つコミュニティに属している企業数")
+if BOOTSTRAP_REPLICATES > 0:
+    print(f"※pct_lo〜pct_hi = 企業を復元抽出 {BOOTSTRAP_REPLICATES} 回したときの {BOOTSTRAP_CI:g}% 区間（seed={BOOTSTRAP_SEED}）")
 print(comm_share)
 
 # 4. 必要なら CSV にも出力
@@ -0,0 +1,324 @@
+# ========================================
+# 企業のタグ集合の MinHash + LSH（似たタグ構成の企業検索・重複検出）
+#  - 同じタグ集合の企業は1つにまとめ（完全一致）、タグ集合ごとに MinHash 署名を作る
+#    tag id は 0..n_tags-1 なので、ハッシュ関数の代わりに tag id のランダム置換を num_perm 個使う
+#    署名 = 行ごとの「置換後の順位」の最小値（np.minimum.reduceat で全行まとめて）
+#  - LSH：署名を bands 個の帯に分け、帯が丸ごと一致するタグ集合を同じバケットに入れる
+#    → 同じバケットに入った組だけを候補にし、Jaccard は tag id 配列から正確に計算
+#    （全企業×全企業の比較はしない。候補数 ≒ 企業数に比例）
+#  - 帯 b 個・1帯 r 行のとき、Jaccard s の組が候補になる確率は 1 - (1 - s^r)^b
+#    （既定の 120 = 40 × 3 なら s = 0.3 で 66%、s = 0.5 で 99.5%、s = 0.8 ならほぼ確実）
+#
+#  co_occurrence.py のステージから使う（企業ごとの類似企業 top-k・重複グループ）
+#  納品データ間の重複チェックは単体で:
+#    python minhash_lsh.py --csv <新しいCSV> --against <前回のCSV> --threshold 0.8 --out dup_pairs.csv
+#    python minhash_lsh.py --csv <CSV> --query 123 --k 10   # 行 123 の企業に似た企業
+# ========================================
+
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from tag_parse import TagTable, parse_tags, ragged_take
+
+NUM_PERM = 120
+BANDS = 40
+MAX_BUCKET = 2000  # これより大きいバケット（1〜2タグの小さい集合が集まりやすい）は候補にしない
+
+_EMPTY = np.iinfo(np.uint32).max
+
+
+def minhash_signatures(table, num_perm=NUM_PERM, seed=0, chunk=16):
+    """TagTable → (n_rows, num_perm) uint32 の MinHash 署名（タグなしの行は全部 _EMPTY）"""
+    rng = np.random.default_rng(seed)
+    ranks = np.empty((num_perm, table.n_tags), dtype=np.uint32)
+    for k in range(num_perm):
+        ranks[k] = rng.permutation(table.n_tags)
+
+    sig = np.full((table.n_rows, num_perm), _EMPTY, dtype=np.uint32)
+    nonempty = table.lengths > 0
+    starts = table.offsets[:-1][nonempty]
+    if len(starts) == 0:
+        return sig
+    # (chunk, 延べタグ数) ずつ作って行ごとの最小値を取る（一度に全置換ぶん作らない）
+    for a in range(0, num_perm, chunk):
+        b = min(a + chunk, num_perm)
+        sig[nonempty, a:b] = np.minimum.reduceat(ranks[a:b][:, table.ids], starts, axis=1).T
+    return sig
+
+
+def jaccard(table, a, b):
+    """unique_per_row 済みの TagTable の行の組 (a[k], b[k]) ごとの正確な Jaccard"""
+    a = np.asarray(a, dtype=np.int64)
+    b = np.asarray(b, dtype=np.int64)
+    ids_a, len_a = ragged_take(table.offsets, table.ids, a)
+    ids_b, len_b = ragged_take(table.offsets, table.ids, b)
+    # (組の番号, tag id) を並べ、同じ値が2つ続いたところ = 共通のタグ
+    pair = np.r_[np.repeat(np.arange(len(a)), len_a), np.repeat(np.arange(len(b)), len_b)]
+    key = np.sort(pair * max(table.n_tags, 1) + np.r_[ids_a, ids_b])
+    dup = key[1:] == key[:-1]
+    inter = np.bincount(key[1:][dup] // max(table.n_tags, 1), minlength=len(a))
+    union = len_a + len_b - inter
+    return np.divide(inter, union, out=np.zeros(len(a)), where=union > 0)
+
+
+def _find(parent, x):
+    while parent[x] != x:
+        parent[x] = parent[parent[x]]  # 経路半減
+        x = parent[x]
+    return x
+
+
+def _run_pairs(starts, sizes):
+    """長さ sizes の区間（starts から）ごとに、区間内の位置の組 (p, q)（p < q）を全部"""
+    n = int(sizes.sum())
+    pos = np.arange(n, dtype=np.int64)
+    run_start = np.repeat(starts, sizes)
+    local = pos - np.repeat(np.cumsum(sizes) - sizes, sizes)
+    n_partner = np.repeat(sizes, sizes) - 1 - local
+    p = np.repeat(run_start + local, n_partner)
+    group_start = np.cumsum(n_partner) - n_partner
+    q = p + 1 + (np.arange(len(p), dtype=np.int64) - np.repeat(group_start, n_partner))
+    return p, q
+
+
+class MinHashLSH:
+    """
+    table     : 企業ごとのタグ（TagTable。行 = 企業 = 入力CSVの行番号）
+    set_of_row: 企業 → タグ集合の番号（同じタグ集合の企業は同じ番号。タグなしは -1）
+    sets      : タグ集合の TagTable（行 = タグ集合）
+    members   : タグ集合ごとの企業（set_offsets + set_rows の ragged array、行番号昇順）
+    """
+
+    def __init__(self, table, num_perm=NUM_PERM, bands=BANDS, seed=0, max_bucket=MAX_BUCKET):
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) は bands ({bands}) で割り切れる数にする")
+        table = table.unique_per_row()
+        self.table = table
+        self.bands = bands
+        self.rows_per_band = num_perm // bands
+        self.max_bucket = max_bucket
+        self.seed = seed
+
+        # 完全に同じタグ集合をまとめる（id 昇順に並んでいるので bytes が同じ = 同じ集合）
+        has = table.lengths > 0
+        keys = [table.ids[a:b].tobytes() for a, b in zip(table.offsets[:-1][has], table.offsets[1:][has])]
+        self.set_of_row = np.full(table.n_rows, -1, dtype=np.int64)
+        self.set_of_row[has] = pd.factorize(pd.Series(keys, dtype=object))[0]
+        n_sets = int(self.set_of_row.max()) + 1 if has.any() else 0
+        self.n_sets = n_sets
+
+        order = np.argsort(self.set_of_row[has], kind="stable")
+        self.set_rows = np.flatnonzero(has)[order]
+        self.set_offsets = np.r_[0, np.cumsum(np.bincount(self.set_of_row[has], minlength=n_sets))]
+        first = self.set_rows[self.set_offsets[:-1]]
+        ids, lengths = ragged_take(table.offsets, table.ids, first)
+        self.sets = TagTable(table.vocab, np.r_[0, np.cumsum(lengths)], ids)
+
+        self.signatures = minhash_signatures(self.sets, num_perm, seed)
+
+        # 帯ごとに、帯の値が同じタグ集合に同じバケット番号をふり、バケット順に並べておく
+        self.bucket = np.empty((bands, n_sets), dtype=np.int64)
+        self.bucket_order = np.empty((bands, n_sets), dtype=np.int64)
+        r = self.rows_per_band
+        for k in range(bands):
+            band = np.ascontiguousarray(self.signatures[:, k * r:(k + 1) * r])
+            _, inv = np.unique(band.view(np.dtype((np.void, band.dtype.itemsize * r))).ravel(), return_inverse=True)
+            self.bucket[k] = inv
+            self.bucket_order[k] = np.argsort(inv, kind="stable")
+
+    def members(self, s):
+        return self.set_rows[self.set_offsets[s]:self.set_offsets[s + 1]]
+
+    # ---------------------------
+    # 候補の組（全組）
+    # ---------------------------
+    def candidate_pairs(self):
+        """どれかの帯で同じバケットに入ったタグ集合の組 (a, b)（a < b、重複なし）"""
+        found = []
+        skipped = 0
+        for k in range(self.bands):
+            order = self.bucket_order[k]
+            b = self.bucket[k][order]
+            starts = np.flatnonzero(np.r_[True, b[1:] != b[:-1]])
+            sizes = np.diff(np.r_[starts, len(b)])
+            big = sizes > self.max_bucket
+            skipped += int(big.sum())
+            keep = (sizes >= 2) & ~big
+            p, q = _run_pairs(starts[keep], sizes[keep])
+            a, c = order[p], order[q]
+            found.append(np.minimum(a, c) * self.n_sets + np.maximum(a, c))
+        if skipped:
+            print(f"[minhash] {self.max_bucket} 件を超えるバケット {skipped} 個は候補にしていません")
+        key = np.unique(np.concatenate(found)) if found else np.empty(0, dtype=np.int64)
+        return key // max(self.n_sets, 1), key % max(self.n_sets, 1)
+
+    def similar_set_pairs(self, threshold):
+        """Jaccard >= threshold のタグ集合の組 (a, b, jaccard)"""
+        a, b = self.candidate_pairs()
+        jac = jaccard(self.sets, a, b)
+        ok = jac >= threshold
+        return a[ok], b[ok], jac[ok]
+
+    # ---------------------------
+    # 重複（近い重複）
+    # ---------------------------
+    def near_duplicates(self, threshold=0.8):
+        """
+        Jaccard >= threshold の企業の組（row_a, row_b, jaccard）と、企業ごとの重複グループ番号（なしは -1）
+        同じタグ集合の企業は、その集合の代表（最初の行）との組だけ出す（全組にすると二乗になるため）
+        """
+        a, b, jac = self.similar_set_pairs(threshold)
+
+        # 重複グループ = タグ集合を近い重複の組でつないだ連結成分（union-find）のうち、企業が2社以上のもの
+        parent = list(range(self.n_sets))
+        for x, y in zip(a.tolist(), b.tolist()):
+            x, y = _find(parent, x), _find(parent, y)
+            if x != y:
+                parent[max(x, y)] = min(x, y)
+        root = np.array([_find(parent, x) for x in range(self.n_sets)], dtype=np.int64)
+        n_companies = np.bincount(root, weights=np.diff(self.set_offsets), minlength=self.n_sets)
+        set_root = np.where(n_companies[root] >= 2, root, -1)
+        row_root = np.where(self.set_of_row >= 0, set_root[self.set_of_row], -1)
+        # グループ番号は、グループの企業が最初に出てくる行の順
+        row_group = np.full(len(row_root), -1, dtype=np.int64)
+        in_group = row_root >= 0
+        row_group[in_group] = pd.factorize(row_root[in_group])[0]
+
+        rep = self.set_rows[self.set_offsets[:-1]]
+        sizes = np.diff(self.set_offsets)
+        same_rep = np.repeat(rep, sizes - 1)
+        same_row = np.delete(self.set_rows, self.set_offsets[:-1])
+        pairs = pd.DataFrame({
+            "row_a": np.r_[rep[a], same_rep],
+            "row_b": np.r_[rep[b], same_row],
+            "jaccard": np.r_[jac, np.ones(len(same_row))],
+        })
+        pairs = pairs.sort_values(["row_a", "row_b"], ignore_index=True)
+        return pairs, row_group
+
+    # ---------------------------
+    # 似た企業 top-k
+    # ---------------------------
+    def query(self, row=None, tags=None, k=10):
+        """
+        企業（行番号 row）またはタグのリスト tags に似た企業の上位 k 件
+        戻り値 [row, jaccard] の DataFrame（Jaccard の大きい順、同じなら行番号順。row 自身は除く）
+        """
+        if row is not None:
+            s = int(self.set_of_row[row])
+            q_ids = self.sets.ids[self.sets.offsets[s]:self.sets.offsets[s + 1]] if s >= 0 else []
+        else:
+            q_ids = np.unique(self.table.lookup(tags))
+            q_ids = q_ids[q_ids >= 0]
+        if len(q_ids) == 0:
+            return pd.DataFrame({"row": np.empty(0, dtype=np.int64), "jaccard": np.empty(0)})
+        q_ids = np.asarray(q_ids, dtype=np.int32)
+        if row is not None:
+            q_sig = self.signatures[s]
+        else:
+            q_sig = minhash_signatures(TagTable(self.table.vocab, [0, len(q_ids)], q_ids), self.signatures.shape[1], self.seed)[0]
+
+        # どれかの帯が丸ごと一致するタグ集合が候補
+        shape = (self.n_sets, self.bands, self.rows_per_band)
+        hit = (self.signatures.reshape(shape) == q_sig.reshape(shape[1:])).all(axis=2).any(axis=1)
+        cand = np.flatnonzero(hit)
+
+        # 候補のタグ集合との Jaccard（クエリを1行目に足した表で計算）
+        q = TagTable(
+            self.table.vocab,
+            np.r_[0, len(q_ids) + self.sets.offsets],
+            np.r_[q_ids, self.sets.ids].astype(np.int32),
+        )
+        jac = jaccard(q, np.zeros(len(cand), dtype=np.int64), cand + 1)
+        rows, lengths = ragged_take(self.set_offsets, self.set_rows, cand)
+        out = pd.DataFrame({"row": rows, "jaccard": np.repeat(jac, lengths)})
+        if row is not None:
+            out = out[out["row"] != row]
+        out = out.sort_values(["jaccard", "row"], ascending=[False, True], ignore_index=True)
+        return out.head(k)
+
+    def top_k(self, k=5, threshold=0.5):
+        """
+        全企業の、Jaccard >= threshold の似た企業の上位 k 件
+        戻り値 (offsets, rows, jaccard) の ragged array（企業ごと。Jaccard の大きい順、同じなら行番号順）
+        """
+        a, b, jac = self.similar_set_pairs(threshold)
+        # 同じタグ集合（Jaccard 1）も近傍に入れる
+        s_all = np.arange(self.n_sets)
+        src = np.r_[a, b, s_all]
+        dst = np.r_[b, a, s_all]
+        w = np.r_[jac, jac, np.ones(self.n_sets)]
+        order = np.lexsort((dst, -w, src))
+        src, dst, w = src[order], dst[order], w[order]
+        nb_offsets = np.r_[0, np.cumsum(np.bincount(src, minlength=self.n_sets))]
+
+        # タグ集合ごとに、近い順の近傍集合の企業を k + 1 件以上（自分自身を除くため +1。同じ Jaccard は全部）
+        set_best = []
+        for s in range(self.n_sets):
+            best = []
+            lo, hi = nb_offsets[s], nb_offsets[s + 1]
+            for t, wt in zip(dst[lo:hi].tolist(), w[lo:hi].tolist()):
+                if len(best) > k and wt < best[-1][0]:
+                    break
+                best.extend((wt, r_) for r_ in self.members(t)[:k + 1].tolist())
+            best.sort(key=lambda x: (-x[0], x[1]))
+            set_best.append(best)
+
+        out_rows, out_w, lengths = [], [], np.zeros(self.table.n_rows, dtype=np.int64)
+        for i, s in enumerate(self.set_of_row.tolist()):
+            if s < 0:
+                continue
+            picked = [(w_, r_) for w_, r_ in set_best[s] if r_ != i][:k]
+            lengths[i] = len(picked)
+            out_rows.extend(r_ for _, r_ in picked)
+            out_w.extend(w_ for w_, _ in picked)
+        return np.r_[0, np.cumsum(lengths)], np.array(out_rows, dtype=np.int64), np.array(out_w)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="タグ集合の MinHash + LSH（似た企業・重複検出）")
+    ap.add_argument("--csv", required=True)
+    ap.add_argument("--against", help="前回の納品CSV。指定すると csv と against の間の重複だけ出す")
+    ap.add_argument("--col", default="タグ")
+    ap.add_argument("--threshold", type=float, default=0.8)
+    ap.add_argument("--query", type=int, help="この行番号の企業に似た企業を出す")
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--num-perm", type=int, default=NUM_PERM)
+    ap.add_argument("--bands", type=int, default=BANDS)
+    ap.add_argument("--out", default="near_duplicate_pairs.csv")
+    args = ap.parse_args()
+
+    tag_col = pd.read_csv(args.csv, usecols=[args.col], encoding="utf-8-sig")[args.col]
+    n_new = len(tag_col)
+    if args.against:
+        # 2つの CSV を縦につないで1つの語彙で索引を作り、両方にまたがる組だけ残す
+        old_col = pd.read_csv(args.against, usecols=[args.col], encoding="utf-8-sig")[args.col]
+        tag_col = pd.concat([tag_col, old_col], ignore_index=True)
+    lsh = MinHashLSH(parse_tags(tag_col), num_perm=args.num_perm, bands=args.bands)
+
+    if args.query is not None:
+        print(lsh.query(row=args.query, k=args.k).to_string(index=False))
+        return
+
+    if args.against:
+        # 近いタグ集合の組（と同じ集合どうし）の企業のうち、新旧にまたがる組を全部
+        a, b, jac = lsh.similar_set_pairs(args.threshold)
+        same = np.arange(lsh.n_sets)
+        recs = []
+        for x, y, j in zip(np.r_[a, b, same].tolist(), np.r_[b, a, same].tolist(), np.r_[jac, jac, np.ones(lsh.n_sets)].tolist()):
+            mx, my = lsh.members(x), lsh.members(y)
+            for r_new in mx[mx < n_new].tolist():
+                for r_old in my[my >= n_new].tolist():
+                    recs.append((r_new, r_old - n_new, j))
+        pairs = pd.DataFrame(recs, columns=["row", "row_against", "jaccard"])
+        pairs = pairs.sort_values(["row", "row_against"], ignore_index=True)
+    else:
+        pairs, _ = lsh.near_duplicates(args.threshold)
+    pairs.to_csv(args.out, index=False, encoding="utf-8-sig")
+    print(f"Jaccard >= {args.threshold} の組: {len(pairs)} → {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+# ========================================
+# ステージ DAG ＋ 中間成果物のキャッシュ（co_occurrence*.py / tag_genre.py で共通）
+#  - スクリプトの各処理を「ステージ」として宣言する
+#      edges = pipe.stage("count_pairs", count_edges, inputs={"tags": tags})
+#    inputs  : 上流ステージ（の Artifact）
+#    params  : そのステージだけが使うパラメータ（閾値・REMOVE_TAGS など）
+#    files   : 読み込む入力ファイル（中身の sha256 をキーに含める）
+#    outputs : 書き出すファイル（CSV/HTML など。消えていたら再実行）
+#    deps    : 関数から呼んでいる補助関数（そのソースもキーに含める）
+#  - ステージのキー = hash(ステージ名, 関数と deps のソース, params, 入力ファイルの中身, 上流ステージのキー)
+#    → 戻り値を .pipeline_cache/<ステージ名>/<キー>.pkl に保存し、次回キーが同じなら実行しない
+#    例）THRESHOLD_OVERALL を変える → 全体 HTML のステージだけ再実行
+#        REMOVE_TAGS を変える → parse_tags とその下流すべてが再実行
+#  - 上流の値は必要になった時だけ pickle から読む（HTML だけ作り直すときに CSV は読まない）
+#  - 関数が引数 st を持っていれば RunReport の件数 dict を渡す
+#  - deps に書いていない補助関数・モジュールの変更はキーに入らないので、その場合は version を上げるか
+#    PIPELINE_FORCE=<ステージ名>（カンマ区切り、all で全部）で強制再実行
+#  - 並列ワーカーを使う補助スクリプト（itemsets.py など）は run_script で別プロセスとして実行し、
+#    その中で run_pool を使う
+# ========================================
+
+import hashlib
+import inspect
+import json
+import multiprocessing as mp
+import os
+import pickle
+import subprocess
+import sys
+from contextlib import nullcontext
+
+from run_report import _jsonable
+
+CACHE_DIR = ".pipeline_cache"
+KEEP_PER_STAGE = 3  # ステージごとに残すキャッシュの数（閾値を戻したときに再利用できるように）
+
+
+def file_digest(path, memo):
+    """ファイルの sha256。サイズ・更新日時が同じなら memo の値を使う（毎回全部読まない）"""
+    st = os.stat(path)
+    fp = f"{st.st_size}:{st.st_mtime_ns}"
+    hit = memo.get(os.path.abspath(path))
+    if hit and hit[0] == fp:
+        return hit[1]
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    memo[os.path.abspath(path)] = [fp, h.hexdigest()]
+    return h.hexdigest()
+
+
+def _source(func):
+    try:
+        return inspect.getsource(func)
+    except (OSError, TypeError):
+        return getattr(func, "__qualname__", repr(func))
+
+
+def run_script(name, *args):
+    """
+    このディレクトリの補助スクリプト name を別プロセスで実行（失敗したら CalledProcessError）
+    run_pool のワーカーは spawn で起動し、__main__ のスクリプトを読み直す。呼び出し元
+    （co_occurrence_new.py など）を再実行しないよう、ワーカーを使う処理はこれで別プロセスにする
+    """
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), name)
+    subprocess.run([sys.executable, path, *map(str, args)], check=True)
+
+
+def run_pool(func, tasks, n_workers, initializer, initargs=()):
+    """
+    [func(t) for t in tasks] を最大 n_workers 個の spawn ワーカーで（結果は tasks の順）
+    initializer(*initargs) でワーカーのグローバルに共有データを渡す。n_workers <= 1 ならこのプロセスで実行
+    run_script で起動したスクリプトの中からだけ使う
+    """
+    tasks = list(tasks)
+    if n_workers > 1 and len(tasks) > 1:
+        ctx = mp.get_context("spawn")
+        with ctx.Pool(min(n_workers, len(tasks)), initializer=initializer, initargs=initargs) as pool:
+            # 重さの偏ったタスクも空いたワーカーに回るよう、1件ずつ配る
+            return list(pool.imap(func, tasks, chunksize=1))
+    initializer(*initargs)
+    return [func(t) for t in tasks]
+
+
+def _fingerprint(path):
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+class Artifact:
+    """ステージの結果。value は初めて参照されたときに（キャッシュから）読む"""
+
+    _MISSING = object()
+
+    def __init__(self, pipeline, name, key, path):
+        self.pipeline = pipeline
+        self.name = name
+        self.key = key
+        self.path = path
+        self.cached = False
+        self._value = self._MISSING
+
+    @property
+    def value(self):
+        if self._value is self._MISSING:
+            with open(self.path, "rb") as f:
+                self._value = pickle.load(f)
+        return self._value
+
+
+class Pipeline:
+    def __init__(self, name, report=None, cache_dir=CACHE_DIR, force=None):
+        self.name = name
+        self.report = report
+        self.cache_dir = os.path.join(cache_dir, name)
+        if force is None:
+            force = os.environ.get("PIPELINE_FORCE", "")
+        self.force = {s.strip() for s in force.split(",") if s.strip()}
+        self.artifacts = {}
+        self._memo_path = os.path.join(self.cache_dir, "file_digests.json")
+        try:
+            with open(self._memo_path, encoding="utf-8") as f:
+                self._file_memo = json.load(f)
+        except (OSError, ValueError):
+            self._file_memo = {}
+
+    def stage_key(self, name, func, inputs, params, files, deps, version):
+        spec = {
+            "stage": name,
+            "version": version,
+            "source": [_source(f) for f in (func, *deps)],
+            "params": _jsonable(params),
+            "files": {k: file_digest(p, self._file_memo) for k, p in files.items()},
+            "inputs": {k: a.key for k, a in inputs.items()},
+        }
+        blob = json.dumps(spec, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    def stage(self, name, func, inputs=None, params=None, files=None, outputs=(), deps=(), version=1):
+        """
+        ステージを宣言し、キーが変わっていれば実行する。戻り値は Artifact（.value で結果）
+        func は inputs / params / files のキーをキーワード引数で受け取る
+        """
+        inputs = dict(inputs or {})
+        params = dict(params or {})
+        files = dict(files or {})
+        outputs = [outputs] if isinstance(outputs, str) else list(outputs)
+
+        key = self.stage_key(name, func, inputs, params, files, deps, version)
+        stage_dir = os.path.join(self.cache_dir, name)
+        art = Artifact(self, name, key, os.path.join(stage_dir, f"{key[:20]}.pkl"))
+        self.artifacts[name] = art
+
+        if self._is_fresh(art, outputs) and not ({name, "all"} & self.force):
+            art.cached = True
+            print(f"[pipeline] {name}: キャッシュ済み（{key[:12]}）→ スキップ")
+            if self.report is not None:
+                self.report.stages.append({"name": name, "cached": True, "key": key[:12]})
+            return art
+
+        kwargs = {k: a.value for k, a in inputs.items()}
+        kwargs.update(params)
+        kwargs.update(files)
+        ctx = self.report.stage(name, key=key[:12]) if self.report is not None else nullcontext({})
+        with ctx as st:
+            if "st" in inspect.signature(func).parameters:
+                kwargs["st"] = st
+            value = func(**kwargs)
+
+        os.makedirs(stage_dir, exist_ok=True)
+        tmp = art.path + ".tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        meta = {"key": key, "outputs": {p: _fingerprint(p) for p in outputs if os.path.exists(p)}}
+        with open(art.path + ".json", "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, art.path)
+        art._value = value
+        self._prune(stage_dir, keep=art.path)
+        self._save_memo()
+        return art
+
+    def _is_fresh(self, art, outputs):
+        if not os.path.exists(art.path):
+            return False
+        try:
+            with open(art.path + ".json", encoding="utf-8") as f:
+                recorded = json.load(f)["outputs"]
+        except (OSError, ValueError, KeyError):
+            return False
+        # 前回書いた出力ファイルが消えた・別の実行で上書きされた場合は作り直す
+        # （条件によって書かない出力は recorded に入っていないので見ない）
+        for p in outputs:
+            if p in recorded and (not os.path.exists(p) or recorded[p] != _fingerprint(p)):
+                return False
+        return True
+
+    def _prune(self, stage_dir, keep):
+        pkls = sorted(
+            (os.path.join(stage_dir, f) for f in os.listdir(stage_dir) if f.endswith(".pkl")),
+            key=os.path.getmtime,
+            reverse=True,
+        )
+        for p in pkls[KEEP_PER_STAGE:]:
+            if p != keep:
+                for q in (p, p + ".json"):
+                    if os.path.exists(q):
+                        os.remove(q)
+
+    def _save_memo(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with open(self._memo_path, "w", encoding="utf-8") as f:
+            json.dump(self._file_memo, f, ensure_ascii=False, indent=2)
@@ -0,0 +1,135 @@
+# ========================================
+# 実行レポート（ステージごとの時間・メモリ・件数を JSON に残す）
+#  - with report.stage("louvain") as st: ... ; st["communities"] = n
+#    → 経過時間（wall）・CPU時間・ピークRSS・件数を記録
+#  - report.finish() で run_reports/<script>_<日時>.json を書く
+#    （途中でエラー終了しても atexit で書き出し、"completed": false になる）
+#  - 環境変数 PROFILE_STAGE=<ステージ名> で、そのステージだけプロファイルを出力
+#    （pyinstrument があればサンプリングプロファイラ、無ければ cProfile）
+# ========================================
+
+import atexit
+import json
+import os
+import platform
+import resource
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+REPORT_DIR = "run_reports"
+
+
+def peak_rss_mb():
+    # ru_maxrss は Linux では KB、macOS では byte 単位
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return rss / 1024 / 1024
+    return rss / 1024
+
+
+def _jsonable(v):
+    if isinstance(v, (str, int, float, bool)) or v is None:
+        return v
+    if isinstance(v, dict):
+        return {str(k): _jsonable(x) for k, x in v.items()}
+    if isinstance(v, (list, tuple, set, frozenset)):
+        items = [_jsonable(x) for x in v]
+        return sorted(items, key=str) if isinstance(v, (set, frozenset)) else items
+    if hasattr(v, "item"):  # numpy のスカラー
+        return v.item()
+    return str(v)
+
+
+class RunReport:
+    def __init__(self, script, params=None, report_dir=REPORT_DIR, profile_stage=None):
+        self.script = script
+        self.params = dict(params or {})
+        self.report_dir = report_dir
+        self.profile_stage = profile_stage or os.environ.get("PROFILE_STAGE")
+        self.stages = []
+        self.started_at = datetime.now()
+        self._t0 = time.perf_counter()
+        self._cpu0 = time.process_time()
+        self._written = None
+        self._finished = False
+        atexit.register(self.write)
+
+    @contextmanager
+    def stage(self, name, **counts):
+        rec = {"name": name}
+        st = dict(counts)
+        rss_before = peak_rss_mb()
+        profiler = self._start_profiler() if name == self.profile_stage else None
+        t0, cpu0 = time.perf_counter(), time.process_time()
+        try:
+            yield st
+        except BaseException as e:
+            rec["error"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            rec["wall_s"] = round(time.perf_counter() - t0, 4)
+            rec["cpu_s"] = round(time.process_time() - cpu0, 4)
+            rec["peak_rss_mb"] = round(peak_rss_mb(), 1)
+            rec["peak_rss_growth_mb"] = round(peak_rss_mb() - rss_before, 1)
+            rec["counts"] = _jsonable(st)
+            if profiler is not None:
+                rec["profile"] = self._stop_profiler(profiler, name)
+            self.stages.append(rec)
+
+    def _path(self, suffix):
+        os.makedirs(self.report_dir, exist_ok=True)
+        stamp = self.started_at.strftime("%Y%m%d-%H%M%S")
+        return os.path.join(self.report_dir, f"{self.script}_{stamp}{suffix}")
+
+    def _start_profiler(self):
+        try:
+            from pyinstrument import Profiler
+            p = Profiler()
+            p.start()
+            return ("pyinstrument", p)
+        except ImportError:
+            import cProfile
+            p = cProfile.Profile()
+            p.enable()
+            return ("cProfile", p)
+
+    def _stop_profiler(self, profiler, name):
+        kind, p = profiler
+        if kind == "pyinstrument":
+            p.stop()
+            path = self._path(f"_{name}.profile.html")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(p.output_html())
+        else:
+            p.disable()
+            path = self._path(f"_{name}.prof")  # python -m pstats / snakeviz で開く
+            p.dump_stats(path)
+        return {"profiler": kind, "path": path}
+
+    def finish(self):
+        """スクリプトの最後に呼ぶ。レポートのパスを返す"""
+        self._finished = True
+        return self.write()
+
+    def write(self):
+        # finish() のあと atexit でも呼ばれるが、同じファイルを上書きするだけ
+        report = {
+            "script": self.script,
+            "started_at": self.started_at.isoformat(timespec="seconds"),
+            "finished_at": datetime.now().isoformat(timespec="seconds"),
+            "total_wall_s": round(time.perf_counter() - self._t0, 4),
+            "total_cpu_s": round(time.process_time() - self._cpu0, 4),
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+            "completed": self._finished and not any("error" in s for s in self.stages),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "params": _jsonable(self.params),
+            "stages": self.stages,
+        }
+        path = self._written or self._path(".json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        self._written = path
+        return path
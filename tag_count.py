@@ -1,26 +1,82 @@
-import pandas as pd
-from collections import Counter
+import os
+import re
 
-# Excelファイルの読み込み
-df = pd.read_excel("/Users/monetanikawa/Downloads/作業用‼️INITIAL_三菱地所様提供データ.xlsx")  # ←ファイル名を指定
-sheet= "tags"
+import pandas as pd
 
-# 対象の列名を指定
+# Excelファイル・シート・対象列
+XLSX_PATH = "/Users/monetanikawa/Downloads/作業用‼️INITIAL_三菱地所様提供データ.xlsx"  # ←ファイル名を指定
+sheet = "tags"
 target_col = "タグ"
 
+# 一度読んだ列は Parquet にキャッシュ（ブックの更新日時・サイズが同じなら Excel を開かない）
+CACHE_DIR = ".tag_count_cache"
+
+
+def read_column_streaming(path, sheet_name, col):
+    """openpyxl の read_only モードで、対象シートの対象列だけを1行ずつ読む"""
+    from openpyxl import load_workbook
+
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        if sheet_name in wb.sheetnames:
+            ws = wb[sheet_name]
+        else:
+            # 以前は先頭シートを読んでいたので、シートが無い場合はそれに合わせる
+            print(f"シート '{sheet_name}' が無いため先頭シート '{wb.sheetnames[0]}' を使います")
+            ws = wb[wb.sheetnames[0]]
+        rows = ws.iter_rows(values_only=True)
+        header = next(rows, ())
+        if col not in header:
+            raise KeyError(f"列 '{col}' がシート '{ws.title}' にありません")
+        j = header.index(col)
+        values = [row[j] if j < len(row) else None for row in rows]
+    finally:
+        wb.close()
+    return pd.Series(values, name=col, dtype=object)
+
+
+def cache_path(path, sheet_name, col):
+    st = os.stat(path)
+    stem = os.path.splitext(os.path.basename(path))[0]
+    key = f"{sheet_name}_{col}_{st.st_mtime_ns}_{st.st_size}"
+    return os.path.join(CACHE_DIR, re.sub(r"[\\/:*?\"<>|\s]", "_", f"{stem}__{key}") + ".parquet")
+
+
+def load_column(path, sheet_name, col):
+    cpath = cache_path(path, sheet_name, col)
+    try:
+        if os.path.exists(cpath):
+            print(f"キャッシュから読み込み: {cpath}")
+            return pd.read_parquet(cpath, columns=[col])[col]
+    except ImportError:
+        pass
+
+    s = read_column_streaming(path, sheet_name, col)
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        # 数値と文字列が混ざると Parquet に書けないので、欠損以外は文字列にそろえる
+        s.where(s.isna(), s.astype(str)).to_frame().to_parquet(cpath, index=False)
+        print(f"キャッシュを作成: {cpath}")
+    except ImportError:
+        print("pyarrow が無いためキャッシュは作成しません")
+    return s
+
+
 # 列を文字列として読み込み（NaNを除外）
-words = df[target_col].dropna().astype(str)
+words = load_column(XLSX_PATH, sheet, target_col).dropna().astype(str)
 
-# スペース区切りで単語に分割（必要に応じて）
-all_words = []
-for text in words:
-    all_words.extend(text.split())
+# スペース区切りで単語に分割（必要に応じて）し、列全体でまとめて数える
+all_words = words.str.split().explode().dropna()
 
-# 単語の出現回数をカウント
-word_counts = Counter(all_words)
+# 単語の出現回数をカウント（同数は先に出てきた順）
+word_counts = all_words.value_counts(sort=False)
 
 # 結果をDataFrame化
-result = pd.DataFrame(word_counts.items(), columns=["単語", "出現回数"]).sort_values("出現回数", ascending=False)
+result = (
+    word_counts.rename_axis("単語")
+    .reset_index(name="出現回数")
+    .sort_values("出現回数", ascending=False, kind="stable")
+)
 
 # 結果の確認
 print(f"総単語数: {len(all_words)}")
@@ -28,4 +84,4 @@ print(f"ユニーク単語数: {len(word_counts)}")
 print(result.head(20))  # 上位20単語を表示
 
 # 必要ならCSV出力
-result.to_csv("word_count_result.csv", index=False)
\ No newline at end of file
+result.to_csv("word_count_result.csv", index=False)
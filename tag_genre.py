@@ -1,11 +1,21 @@
+import os
+import tempfile
+import time
 import pandas as pd
 import numpy as np
-from collections import Counter
-from tqdm import tqdm
 import re
 
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
+import desc_encode
+from loc_cube import build_cube, parse_locname
+from company_cube import COMPANY_CODES, save_company_codes
+from tag_parse import parse_tags, assign_groups, primary_group, ragged_lists
+from run_report import RunReport, peak_rss_mb
+from pipeline import Pipeline, run_script
+
+# sentence_transformers は重いので、実際に encode が必要になった時点で import する
+# （ルールだけで済む実行・キャッシュヒットだけの実行ではモデルを読み込まない）
+
+T_START = time.perf_counter()
 
 # =========================================================
 # 0. 設定
@@ -24,20 +34,118 @@ OUT_MULTI_TAGS      = "chome_category_multilabel_tags.csv"
 OUT_FRACTION_TAGS   = "chome_category_fractional_tags.csv"
 OUT_PRIMARY_TEXT    = "chome_category_primary_text.csv"
 
+# 全都道府県 × 4階層（都道府県/市区町村/町/丁目）× カテゴリの集計キューブ（loc_cube.py）
+OUT_LOC_CUBE        = "loc_category_cube.npz"
+
+# 企業ごとのカテゴリ・所在地コード（company_cube.py でコミュニティと結合する）
+OUT_COMPANY_CODES   = COMPANY_CODES
+COMPANY_KEY_COL     = None  # 企業を突き合わせる列（例："企業名"）。co_occurrence 側と行の並びが同じなら None
+
+BERT_MODEL_NAME = "sonoisa/sentence-bert-base-ja-mean-tokens"
+
+# 文字列 → embedding のキャッシュ（2回目以降はモデルを読まずに済む）
+EMB_CACHE_PATH = "bert_embedding_cache.npz"
+
+# 事業内容テキストの embedding（desc_encode.py：マルチプロセス・チャンク保存・再開可能）
+DESC_EMB_DIR        = "desc_embeddings"
+DESC_ENCODE_WORKERS = 4      # ワーカープロセス数（各プロセスがモデルを1つ持つ）
+DESC_ENCODE_THREADS = 2      # ワーカー1つあたりの torch スレッド数
+DESC_ENCODE_CHUNK   = 2000   # チャンク1つあたりのテキスト数（この単位で保存・再開）
+
+BERT_THRESHOLD = 0.35  # タグの BERT 判定の閾値（必要なら 0.3〜0.5 で調整）
+
+# 実行レポート（各ステージの時間・メモリ・件数）→ run_reports/tag_genre_<日時>.json
+report = RunReport("tag_genre", params={
+    "data_path": DATA_PATH,
+    "bert_model": BERT_MODEL_NAME,
+    "bert_threshold": BERT_THRESHOLD,
+    "desc_encode_workers": DESC_ENCODE_WORKERS,
+    "desc_encode_threads": DESC_ENCODE_THREADS,
+    "desc_encode_chunk": DESC_ENCODE_CHUNK,
+})
+
+# 中間成果物は .pipeline_cache/tag_genre/ に保存（bert_threshold を変えたらタグのカテゴリ付与から下流だけ再実行）
+pipe = Pipeline("tag_genre", report=report)
+
+# =========================================================
+# 0-1. BERT の遅延読み込み & embedding キャッシュ
+# =========================================================
+_model = None
+_emb_cache = {}
+_emb_cache_dirty = False
+
+def get_model():
+    global _model
+    if _model is None:
+        t0 = time.perf_counter()
+        print("Loading Japanese Sentence-BERT model...")
+        from sentence_transformers import SentenceTransformer
+        _model = SentenceTransformer(BERT_MODEL_NAME)
+        print(f"model loaded: {time.perf_counter() - t0:.1f}s, peak RSS {peak_rss_mb():.0f} MB")
+    return _model
+
+def load_emb_cache():
+    global _emb_cache
+    if not os.path.exists(EMB_CACHE_PATH):
+        return
+    with np.load(EMB_CACHE_PATH, allow_pickle=False) as z:
+        if str(z["model"]) != BERT_MODEL_NAME:
+            return
+        _emb_cache = dict(zip(z["keys"].tolist(), z["vecs"]))
+    print("embedding cache:", len(_emb_cache), "entries")
+
+def save_emb_cache():
+    if not _emb_cache_dirty:
+        return
+    keys = list(_emb_cache)
+    np.savez(
+        EMB_CACHE_PATH,
+        model=np.array(BERT_MODEL_NAME),
+        keys=np.array(keys),
+        vecs=np.stack([_emb_cache[k] for k in keys]),
+    )
+    print("saved embedding cache:", EMB_CACHE_PATH, len(keys), "entries")
+
+def encode(texts):
+    """normalize 済み embedding (len(texts), dim) を返す。未キャッシュ分だけモデルで encode。"""
+    global _emb_cache_dirty
+    missing = list(dict.fromkeys(t for t in texts if t not in _emb_cache))
+    if missing:
+        vecs = get_model().encode(
+            missing, normalize_embeddings=True, show_progress_bar=len(missing) > 100
+        )
+        _emb_cache.update(zip(missing, vecs))
+        _emb_cache_dirty = True
+    return np.stack([_emb_cache[t] for t in texts])
+
+def cosine_similarity(a, b):
+    # sklearn.metrics.pairwise.cosine_similarity と同じ計算（import を避けるため numpy で）
+    a = a / np.linalg.norm(a, axis=1, keepdims=True)
+    b = b / np.linalg.norm(b, axis=1, keepdims=True)
+    return a @ b.T
+
+load_emb_cache()
+
 # =========================================================
 # 1. データ読み込み & タグをリスト化
 # =========================================================
-df = pd.read_csv(DATA_PATH)
+def load_csv(csv, st):
+    df = pd.read_csv(csv)
+    st.update(rows=len(df), columns=len(df.columns))
+    print("rows:", len(df))
+    print(f"CSV loaded: {time.perf_counter() - T_START:.1f}s, peak RSS {peak_rss_mb():.0f} MB")
+    return df
 
-df["tag_list"] = (
-    df[TAG_COL]
-    .fillna("")
-    .astype(str)
-    .apply(lambda s: [t.strip() for t in s.split(",") if t.strip() != ""])
-)
+df_art = pipe.stage("load_csv", load_csv, files={"csv": DATA_PATH})
+
+# タグは tag id の ragged array で持つ（tag_parse.py）。tag_list 列は保存時だけ作る
+def parse_tag_col(df, tag_col, st):
+    tags = parse_tags(df[tag_col])
+    st.update(tags=tags.n_tags, tag_occurrences=len(tags.ids))
+    print("example tags:", tags.row_tags(0))
+    return tags
 
-print("rows:", len(df))
-print("example tags:", df["tag_list"].iloc[0])
+tags_art = pipe.stage("parse_tags", parse_tag_col, inputs={"df": df_art}, params={"tag_col": TAG_COL})
 
 # =========================================================
 # 2. 岡本さん 7分類の「アンカー」定義（タグ用）
@@ -86,38 +194,22 @@ for cat, words in anchors.items():
 
 # =========================================================
 # 3. 全タグ一覧 → ルール＋BERTでカテゴリ付与
+#    anchors・bert_threshold を変えるとこのステージから下流だけ再実行
 # =========================================================
-all_tags = sorted({t for tags in df["tag_list"] for t in tags})
-print("unique tags:", len(all_tags))
-
-tag2cat = {}
-tag2how = {}
-
-# まずルール
-for t in all_tags:
-    if t in rule_map:
-        tag2cat[t] = rule_map[t]
-        tag2how[t] = "rule"
-    else:
-        tag2cat[t] = None
-        tag2how[t] = None
-
-unmapped_tags = [t for t in all_tags if tag2cat[t] is None]
-print("unmapped after rule:", len(unmapped_tags))
-
-# BERTモデル読み込み（タグ用＆テキスト用で共通に使う）
-print("Loading Japanese Sentence-BERT model...")
-model = SentenceTransformer("sonoisa/sentence-bert-base-ja-mean-tokens")
 
 # カテゴリごとのアンカー単語をembedding → 平均ベクトル
+# （ルールで全タグ埋まった場合は使わないので、必要になった時点で計算）
 anchor_vecs = {}
-for cat, words in anchors.items():
-    vecs = model.encode(words, normalize_embeddings=True)
-    anchor_vecs[cat] = vecs.mean(axis=0, keepdims=True)
+
+def get_anchor_vecs():
+    if not anchor_vecs:
+        for cat, words in anchors.items():
+            anchor_vecs[cat] = encode(words).mean(axis=0, keepdims=True)
+    return anchor_vecs
 
 def bert_assign_tag(tag, threshold=0.35):
-    v = model.encode([tag], normalize_embeddings=True)  # (1, dim)
-    sims = {cat: cosine_similarity(v, anchor_vecs[cat])[0, 0] for cat in anchors}
+    v = encode([tag])  # (1, dim)
+    sims = {cat: cosine_similarity(v, get_anchor_vecs()[cat])[0, 0] for cat in anchors}
     best_cat = max(sims, key=sims.get)
     best_sim = sims[best_cat]
     if best_sim >= threshold:
@@ -125,44 +217,83 @@ def bert_assign_tag(tag, threshold=0.35):
     else:
         return None, best_sim
 
-bert_threshold = 0.35  # 必要なら 0.3〜0.5 で調整
+def map_tags(tags, anchors, bert_threshold, model, out_path, st):
+    all_tags = tags.vocab.tolist()  # sort 済み（tag id の並び）
+    print("unique tags:", len(all_tags))
 
-print("Assigning categories to remaining tags by BERT...")
-for t in tqdm(unmapped_tags):
-    cat, sim = bert_assign_tag(t, threshold=bert_threshold)
-    tag2cat[t] = cat
-    if cat is not None:
-        tag2how[t] = f"bert({sim:.2f})"
-    else:
-        tag2how[t] = f"unclassified({sim:.2f})"
+    tag2cat = {}
+    tag2how = {}
 
-# タグ→カテゴリ表を書き出し（後で目視チェック用）
-tagmap_df = pd.DataFrame({
-    "tag": all_tags,
-    "category": [tag2cat[t] for t in all_tags],
-    "assigned_by": [tag2how[t] for t in all_tags],
-})
-tagmap_df.to_csv(OUT_TAGMAP, index=False, encoding="utf-8-sig")
-print("saved tag map:", OUT_TAGMAP)
+    # まずルール
+    for t in all_tags:
+        if t in rule_map:
+            tag2cat[t] = rule_map[t]
+            tag2how[t] = "rule"
+        else:
+            tag2cat[t] = None
+            tag2how[t] = None
+
+    unmapped_tags = [t for t in all_tags if tag2cat[t] is None]
+    print("unmapped after rule:", len(unmapped_tags))
+
+    print("Assigning categories to remaining tags by BERT...")
+    if unmapped_tags:
+        encode(unmapped_tags)  # まとめて encode（キャッシュ済みならモデル不要）
+    for t in unmapped_tags:
+        cat, sim = bert_assign_tag(t, threshold=bert_threshold)
+        tag2cat[t] = cat
+        if cat is not None:
+            tag2how[t] = f"bert({sim:.2f})"
+        else:
+            tag2how[t] = f"unclassified({sim:.2f})"
+
+    # タグ→カテゴリ表を書き出し（後で目視チェック用）
+    tagmap_df = pd.DataFrame({
+        "tag": all_tags,
+        "category": [tag2cat[t] for t in all_tags],
+        "assigned_by": [tag2how[t] for t in all_tags],
+    })
+    tagmap_df.to_csv(out_path, index=False, encoding="utf-8-sig")
+    print("saved tag map:", out_path)
+    st.update(
+        tags=len(all_tags),
+        unmapped_after_rule=len(unmapped_tags),
+        unclassified=int(tagmap_df["category"].isna().sum()),
+        model_loaded=_model is not None,
+    )
+    return tag2cat
+
+tag2cat_art = pipe.stage(
+    "map_tags", map_tags,
+    inputs={"tags": tags_art},
+    params={"anchors": anchors, "bert_threshold": BERT_THRESHOLD, "model": BERT_MODEL_NAME, "out_path": OUT_TAGMAP},
+    outputs=[OUT_TAGMAP],
+    deps=(get_anchor_vecs, bert_assign_tag),
+)
 
 # =========================================================
 # 4. 企業ごとにカテゴリ付与（タグベース）
+#    tag id → category id の配列を引くだけで企業ごとのカテゴリを作る
 # =========================================================
-def tags_to_categories(tags):
-    cats = [tag2cat.get(t) for t in tags]
-    return sorted({c for c in cats if c is not None})
-
-def primary_from_tags(tags):
-    cats = [tag2cat.get(t) for t in tags]
-    cats = [c for c in cats if c is not None]
-    if len(cats) == 0:
-        return None
-    return Counter(cats).most_common(1)[0][0]
-
-df["categories_tags"]    = df["tag_list"].apply(tags_to_categories)
-df["primary_from_tags"]  = df["tag_list"].apply(primary_from_tags)
-
-print("sample categories_tags:", df["categories_tags"].head(3))
+cat_sorted = np.array(sorted(anchors.keys()), dtype=object)  # category id = この並びの番号
+n_cat = len(cat_sorted)
+
+def assign_categories(tags, tag2cat, categories, st):
+    cat_index = {c: i for i, c in enumerate(categories)}
+    tag_cat = np.array([cat_index.get(tag2cat[t], -1) for t in tags.vocab], dtype=np.int64)
+
+    # categories_tags：企業のタグから付いたカテゴリ（重複なし・名前順）
+    cat_offsets, cat_ids = assign_groups(tags, tag_cat, n_groups=len(categories))
+    # primary_from_tags：最も多く付いたカテゴリ（同数なら先に出てきたタグのカテゴリ）
+    primary_tag_ids = primary_group(tags, tag_cat, len(categories))
+    st.update(categories=len(categories), memberships=len(cat_ids))
+    return cat_offsets, cat_ids, primary_tag_ids
+
+cats_art = pipe.stage(
+    "assign_categories", assign_categories,
+    inputs={"tags": tags_art, "tag2cat": tag2cat_art},
+    params={"categories": cat_sorted.tolist()},
+)
 
 # =========================================================
 # 5. 事業内容テキストから primary を決める（キーワード＋BERT）
@@ -226,20 +357,29 @@ category_labels = {
 
 cat_texts = [category_labels[c] for c in anchors.keys()]
 cat_names  = list(anchors.keys())
-cat_embs   = model.encode(cat_texts, normalize_embeddings=True)
-
-def classify_by_bert_text(text):
-    v = model.encode([str(text)], normalize_embeddings=True)
+_cat_embs  = None
+
+def get_cat_embs():
+    global _cat_embs
+    if _cat_embs is None:
+        _cat_embs = encode(cat_texts)
+    return _cat_embs
+
+def classify_by_bert_text(text, v=None):
+    if v is None:
+        v = encode([str(text)])
+    cat_embs = get_cat_embs()
     sims = cosine_similarity(v, cat_embs)[0]  # 各カテゴリとの類似度
     idx = int(np.argmax(sims))
     return cat_names[idx], float(sims[idx])
 
 # --- 5-3. ハイブリッド判定 ---
-def decide_primary_from_text(text, kw_first=True, bert_threshold=0.35):
+def decide_primary_from_text(text, v=None, kw_first=True, bert_threshold=0.35):
     """
     1. キーワードでスコア > 0 のカテゴリがあればそれを優先
        （同点が複数あればBERTでタイブレーク）
     2. 全カテゴリ0点なら BERT だけで判定（類似度閾値付き）
+    v: text の embedding (1, dim)。None ならその場で encode
     """
     if not isinstance(text, str) or text.strip() == "":
         return None, "empty"
@@ -255,8 +395,9 @@ def decide_primary_from_text(text, kw_first=True, bert_threshold=0.35):
             return best_cats[0], f"keyword(max={max_score})"
         else:
             # 複数同点ならBERTで一番近いカテゴリに
-            _, sims = [], []
-            v = model.encode([text], normalize_embeddings=True)
+            if v is None:
+                v = encode([text])
+            cat_embs = get_cat_embs()
             # best_catsの中で最も類似度が高いカテゴリを選ぶ
             best_cat = None
             best_sim = -1
@@ -269,26 +410,102 @@ def decide_primary_from_text(text, kw_first=True, bert_threshold=0.35):
             return best_cat, f"keyword+tiebreak_bert(sim={best_sim:.2f})"
 
     # キーワードが全滅 → BERTのみ
-    cat_b, sim_b = classify_by_bert_text(text)
+    cat_b, sim_b = classify_by_bert_text(text, v)
     if sim_b >= bert_threshold:
         return cat_b, f"bert_only(sim={sim_b:.2f})"
     else:
         return None, f"bert_low(sim={sim_b:.2f})"
 
-# --- 5-4. 実行 ---
-primary_text_list = []
-text_method_list  = []
-
-print("Classifying primary_from_text by keyword + BERT...")
-for txt in tqdm(df[DESC_COL].fillna("").astype(str)):
-    cat, how = decide_primary_from_text(txt)
-    primary_text_list.append(cat)
-    text_method_list.append(how)
-
-df["primary_from_text"] = primary_text_list
-df["text_method"]       = text_method_list
+def needs_text_embedding(text):
+    """decide_primary_from_text が embedding を使うか（キーワードが全滅、または最高点が同点）"""
+    if not isinstance(text, str) or text.strip() == "":
+        return False
+    cat_kw, scores_kw = classify_by_keywords(text)
+    if cat_kw is None:
+        return True
+    max_score = max(scores_kw.values())
+    return sum(s == max_score for s in scores_kw.values()) > 1
+
+# --- 5-4. キーワードで決まらない事業内容テキストだけ encode（別プロセス群・チャンク単位で再開可能） ---
+def desc_embeddings(df, csv, desc_col, category_keywords, model, out_dir, workers, threads, chunk_size, st):
+    desc_texts = df[desc_col].fillna("").astype(str).tolist()
+    rows = np.array([i for i, t in enumerate(desc_texts) if needs_text_embedding(t)], dtype=np.int64)
+    if not desc_encode.is_complete(out_dir, desc_texts, model, rows):
+        if len(rows) == 0:
+            # キーワードで全部決まる → モデルを読み込まずに空の embedding を書くだけ
+            desc_encode.encode_corpus(desc_texts, out_dir, model_name=model, rows=rows)
+        else:
+            with tempfile.TemporaryDirectory() as tmp:
+                rows_path = os.path.join(tmp, "rows.npy")
+                np.save(rows_path, rows)
+                run_script(
+                    "desc_encode.py",
+                    "--csv", csv,
+                    "--col", desc_col,
+                    "--out-dir", out_dir,
+                    "--model", model,
+                    "--workers", workers,
+                    "--threads", threads,
+                    "--chunk-size", chunk_size,
+                    "--rows", rows_path,
+                )
+    st.update(texts=len(desc_texts), encoded=len(rows))
+    print(f"事業内容の embedding: {len(rows)} / {len(desc_texts)} 件（残りはキーワードで決定）")
+    return out_dir  # embedding 本体は desc_encode.py の出力（memmap で読む）
+
+emb_dir_art = pipe.stage(
+    "desc_encode", desc_embeddings,
+    inputs={"df": df_art},
+    params={
+        "csv": DATA_PATH,
+        "desc_col": DESC_COL,
+        "category_keywords": category_keywords,
+        "model": BERT_MODEL_NAME,
+        "out_dir": DESC_EMB_DIR,
+        "workers": DESC_ENCODE_WORKERS,
+        "threads": DESC_ENCODE_THREADS,
+        "chunk_size": DESC_ENCODE_CHUNK,
+    },
+    outputs=[os.path.join(DESC_EMB_DIR, "embeddings.npy"), os.path.join(DESC_EMB_DIR, "rows.npy")],
+    deps=(classify_by_keywords, needs_text_embedding),
+)
 
-print(df[[DESC_COL, "primary_from_tags", "primary_from_text", "text_method"]].head(5))
+# --- 5-5. 実行 ---
+def classify_text(df, emb_dir, desc_col, category_keywords, category_labels, model, st):
+    # キーワード辞書・代表文・モデルは判定関数側で使う（ここではステージのキーに入れるために受け取る）
+    desc_texts = df[desc_col].fillna("").astype(str).tolist()
+    # embedding があるのはキーワードで決まらない行だけ（行番号 → embedding の位置）
+    emb_rows, desc_embs = desc_encode.load_embeddings(emb_dir)
+    emb_pos = dict(zip(emb_rows.tolist(), range(len(emb_rows))))
+
+    primary_text_list = []
+    text_method_list  = []
+
+    print("Classifying primary_from_text by keyword + BERT...")
+    for i, txt in enumerate(desc_texts):
+        k = emb_pos.get(i)
+        cat, how = decide_primary_from_text(txt, None if k is None else desc_embs[k:k+1])
+        primary_text_list.append(cat)
+        text_method_list.append(how)
+
+    st.update(
+        texts=len(desc_texts),
+        unclassified=sum(c is None for c in primary_text_list),
+        model_loaded=_model is not None,
+    )
+    return primary_text_list, text_method_list
+
+text_art = pipe.stage(
+    "classify_text", classify_text,
+    inputs={"df": df_art, "emb_dir": emb_dir_art},
+    params={
+        "desc_col": DESC_COL,
+        "category_keywords": category_keywords,
+        "category_labels": category_labels,
+        "model": BERT_MODEL_NAME,
+    },
+    deps=(classify_by_keywords, classify_by_bert_text, decide_primary_from_text),
+)
 
 # =========================================================
 # 6. タグ由来＋テキスト由来の和集合カテゴリも持たせる
@@ -299,71 +516,179 @@ def union_categories(row):
         cats.add(row["primary_from_text"])
     return sorted(cats)
 
-df["all_categories_union"] = df.apply(union_categories, axis=1)
+def enrich_startups(df, tags, cats, text, out_path, st):
+    cat_offsets, cat_ids, primary_tag_ids = cats
+    primary_text_list, text_method_list = text
+    n_src_cols = len(df.columns)
+    df = df.copy(deep=False)  # キャッシュから読んだ元の df には列を足さない
+
+    df["categories_tags"]    = ragged_lists(cat_offsets, cat_sorted[cat_ids])
+    df["primary_from_tags"]  = np.where(primary_tag_ids >= 0, cat_sorted[primary_tag_ids], None)
+
+    print("sample categories_tags:", df["categories_tags"].head(3))
 
-# 保存
-df.to_csv(OUT_STARTUP, index=False, encoding="utf-8-sig")
-print("saved enriched startup data:", OUT_STARTUP)
+    df["primary_from_text"] = primary_text_list
+    df["text_method"]       = text_method_list
+
+    print(df[[DESC_COL, "primary_from_tags", "primary_from_text", "text_method"]].head(5))
+
+    df["all_categories_union"] = df.apply(union_categories, axis=1)
+
+    # 保存
+    out_cols = list(df.columns[:n_src_cols]) + ["tag_list"] + list(df.columns[n_src_cols:])
+    df.assign(tag_list=tags.to_lists())[out_cols].to_csv(out_path, index=False, encoding="utf-8-sig")
+    print("saved enriched startup data:", out_path)
+    st.update(rows=len(df))
+    return df
+
+enriched_art = pipe.stage(
+    "enrich_startups", enrich_startups,
+    inputs={"df": df_art, "tags": tags_art, "cats": cats_art, "text": text_art},
+    params={"out_path": OUT_STARTUP},
+    outputs=[OUT_STARTUP],
+    deps=(union_categories,),
+)
+
+save_emb_cache()
 
 # =========================================================
 # 7. 東京都だけ抜き出して町丁目 × 分野で集計
+#    4種類の集計（primary_from_tags / マルチラベル / 按分 / primary_from_text）を
+#    町丁目・カテゴリを整数コード化したうえで 1回の explode からまとめて作る
 # =========================================================
-df_tokyo = df[df[LOC_COL].astype(str).str.startswith("東京都/")].copy()
-
-# --- 7-1. primary_from_tags でカウント ---
-primary_tags_df = (
-    df_tokyo
-    .dropna(subset=["primary_from_tags"])
-    .groupby([LOC_COL, "primary_from_tags"])
-    .size()
-    .reset_index(name="count")
+def aggregate_chome(df, cats, out_primary_tags, out_multi_tags, out_fraction_tags, out_primary_text, st):
+    cat_offsets, cat_ids, _ = cats
+
+    is_tokyo = df[LOC_COL].astype(str).str.startswith("東京都/").to_numpy()
+    df_tokyo = df[is_tokyo]
+
+    # 町丁目のコード（groupby と同じ文字列順になるよう sort）。カテゴリは 4. の category id
+    loc_codes, loc_names = pd.factorize(df_tokyo[LOC_COL], sort=True)
+    loc_names = loc_names.to_numpy()
+    row_loc = np.full(len(df), -1, dtype=np.int64)
+    row_loc[is_tokyo] = loc_codes
+
+    def to_cat_codes(values):
+        # カテゴリ名 → category id（None は -1）
+        return pd.Categorical(values, categories=cat_sorted).codes.astype(np.int64)
+
+    def key_frame(keys, cat_col, value_col, values):
+        # (町丁目コード * n_cat + カテゴリコード) → [LOC_COL, cat_col, value_col]
+        return pd.DataFrame({
+            LOC_COL: loc_names[keys // n_cat],
+            cat_col: cat_sorted[keys % n_cat],
+            value_col: values,
+        })
+
+    def primary_counts(col):
+        # 企業ごとの primary カテゴリを (町丁目, カテゴリ) で bincount
+        cat_codes = to_cat_codes(df_tokyo[col])
+        ok = cat_codes >= 0
+        counts = np.bincount(loc_codes[ok] * n_cat + cat_codes[ok], minlength=len(loc_names) * n_cat)
+        keys = np.flatnonzero(counts)
+        return key_frame(keys, col, "count", counts[keys])
+
+    # --- 7-0. categories_tags（cat_offsets + cat_ids）を展開（町丁目コード × カテゴリコード × 按分重み） ---
+    n_cats_row = np.diff(cat_offsets)
+    cat_row = np.repeat(np.arange(len(df)), n_cats_row)
+    in_tokyo = row_loc[cat_row] >= 0
+
+    exploded = pd.DataFrame({
+        "key": row_loc[cat_row][in_tokyo] * n_cat + cat_ids[in_tokyo],
+        "weight": 1.0 / n_cats_row[cat_row][in_tokyo],
+    })
+
+    # --- 7-1. primary_from_tags でカウント ---
+    primary_tags_df = primary_counts("primary_from_tags")
+    primary_tags_df.to_csv(out_primary_tags, index=False, encoding="utf-8-sig")
+    print("saved:", out_primary_tags)
+
+    # --- 7-2 / 7-3. categories_tags（マルチラベル重複カウント & 按分カウント）を同じ groupby で ---
+    cat_agg = exploded.groupby("key")["weight"].agg(["size", "sum"])
+    cat_keys = cat_agg.index.to_numpy()
+
+    multi_agg = key_frame(cat_keys, "category", "count", cat_agg["size"].to_numpy())
+    multi_agg.to_csv(out_multi_tags, index=False, encoding="utf-8-sig")
+    print("saved:", out_multi_tags)
+
+    frac_agg = key_frame(cat_keys, "category", "weight", cat_agg["sum"].to_numpy())
+    frac_agg.to_csv(out_fraction_tags, index=False, encoding="utf-8-sig")
+    print("saved:", out_fraction_tags)
+
+    # --- 7-4. primary_from_text でカウント（テキスト版） ---
+    primary_text_df = primary_counts("primary_from_text")
+    primary_text_df.to_csv(out_primary_text, index=False, encoding="utf-8-sig")
+    print("saved:", out_primary_text)
+    st.update(tokyo_rows=len(df_tokyo), chome=len(loc_names), multilabel_cells=len(multi_agg))
+
+pipe.stage(
+    "aggregate_chome", aggregate_chome,
+    inputs={"df": enriched_art, "cats": cats_art},
+    params={
+        "out_primary_tags": OUT_PRIMARY_TAGS,
+        "out_multi_tags": OUT_MULTI_TAGS,
+        "out_fraction_tags": OUT_FRACTION_TAGS,
+        "out_primary_text": OUT_PRIMARY_TEXT,
+    },
+    outputs=[OUT_PRIMARY_TAGS, OUT_MULTI_TAGS, OUT_FRACTION_TAGS, OUT_PRIMARY_TEXT],
 )
-primary_tags_df.to_csv(OUT_PRIMARY_TAGS, index=False, encoding="utf-8-sig")
-print("saved:", OUT_PRIMARY_TAGS)
-
-# --- 7-2. categories_tags（マルチラベルで重複カウント） ---
-rows = []
-for _, r in df_tokyo.iterrows():
-    for cat in r["categories_tags"]:
-        rows.append([r[LOC_COL], cat])
-
-multi_df = pd.DataFrame(rows, columns=[LOC_COL, "category"])
-multi_agg = (
-    multi_df
-    .groupby([LOC_COL, "category"])
-    .size()
-    .reset_index(name="count")
+
+# =========================================================
+# 8. 全都道府県の LocName 階層キューブ
+#    LocName を1回だけ 都道府県/市区町村/町/丁目 に分解し、丁目 × カテゴリの集計を保存。
+#    区単位・都道府県単位などへの集計は LocCube.rollup / slice（配列の区間和）で取り出す
+#      例）LocCube.load(OUT_LOC_CUBE).to_frame("multilabel", "ward", prefecture="東京都")
+# =========================================================
+def make_loc_cube(df, out_path, st):
+    loc_cube, _ = build_cube(
+        df[LOC_COL],
+        cat_sorted,
+        df["categories_tags"],
+        primaries={
+            "primary_from_tags": df["primary_from_tags"],
+            "primary_from_text": df["primary_from_text"],
+        },
+    )
+    loc_cube.save(out_path)
+    st.update(leaf_units=loc_cube.n_leaf)
+    print("saved:", out_path, "leaf(丁目) units:", loc_cube.n_leaf)
+    print(loc_cube.to_frame("firms", "prefecture").sort_values("count", ascending=False).head(10))
+    print(loc_cube.to_frame("multilabel", "ward", prefecture="東京都").head(10))
+
+pipe.stage(
+    "loc_cube", make_loc_cube,
+    inputs={"df": enriched_art},
+    params={"out_path": OUT_LOC_CUBE},
+    outputs=[OUT_LOC_CUBE],
 )
-multi_agg.to_csv(OUT_MULTI_TAGS, index=False, encoding="utf-8-sig")
-print("saved:", OUT_MULTI_TAGS)
-
-# --- 7-3. categories_tags を按分カウント ---
-rows = []
-for _, r in df_tokyo.iterrows():
-    cats = r["categories_tags"]
-    if len(cats) == 0:
-        continue
-    w = 1.0 / len(cats)
-    for cat in cats:
-        rows.append([r[LOC_COL], cat, w])
-
-frac_df = pd.DataFrame(rows, columns=[LOC_COL, "category", "weight"])
-frac_agg = (
-    frac_df
-    .groupby([LOC_COL, "category"])["weight"]
-    .sum()
-    .reset_index()
+
+# =========================================================
+# 9. 企業ごとのカテゴリ・所在地コード（company_cube.py 用）
+#    categories_tags / primary / LocName の leaf を整数コードのまま保存し、
+#    co_occurrence 側の企業×コミュニティと CSV を介さずに結合できるようにする
+# =========================================================
+def company_codes(df, cats, key_col, out_path, st):
+    cat_offsets, cat_ids, primary_tag_ids = cats
+    leaf, level_names, level_starts = parse_locname(df[LOC_COL])
+    primary_text = pd.Categorical(df["primary_from_text"], categories=cat_sorted).codes
+    save_company_codes(
+        out_path, cat_sorted, cat_offsets, cat_ids, primary_tag_ids, primary_text,
+        leaf, level_names, level_starts,
+        keys=df[key_col].astype(str).to_numpy() if key_col else None,
+    )
+    st.update(companies=len(df), memberships=len(cat_ids))
+    print("saved:", out_path)
+
+pipe.stage(
+    "company_codes", company_codes,
+    inputs={"df": enriched_art, "cats": cats_art},
+    params={"key_col": COMPANY_KEY_COL, "out_path": OUT_COMPANY_CODES},
+    outputs=[OUT_COMPANY_CODES],
 )
-frac_agg.to_csv(OUT_FRACTION_TAGS, index=False, encoding="utf-8-sig")
-print("saved:", OUT_FRACTION_TAGS)
-
-# --- 7-4. primary_from_text でカウント（テキスト版） ---
-primary_text_df = (
-    df_tokyo
-    .dropna(subset=["primary_from_text"])
-    .groupby([LOC_COL, "primary_from_text"])
-    .size()
-    .reset_index(name="count")
+
+print(
+    f"\n=== done: {time.perf_counter() - T_START:.1f}s, peak RSS {peak_rss_mb():.0f} MB, "
+    f"BERT model loaded: {_model is not None} ==="
 )
-primary_text_df.to_csv(OUT_PRIMARY_TEXT, index=False, encoding="utf-8-sig")
-print("saved:", OUT_PRIMARY_TEXT)
+report.params["bert_model_loaded"] = _model is not None
+print("run report:", report.finish())
@@ -0,0 +1,182 @@
+# ========================================
+# タグ列（カンマ区切り）の共通パース
+#  - タグ文字列は語彙（vocab）に1回だけ持ち、各企業のタグは int32 の tag id で持つ
+#  - 企業ごとのタグ列は ragged array（offsets + ids）で表す
+#      企業 i のタグ id = ids[offsets[i]:offsets[i + 1]]
+#  - 集計・カテゴリ付与・コミュニティ付与は id の配列演算で行う
+#  co_occurrence.py / co_occurrence_new.py / tag_genre.py で共通に使う
+# ========================================
+
+import numpy as np
+import pandas as pd
+
+# 分析から除くタグ（事業形態）
+REMOVE_TAGS = {
+    "B2B", "BtoB", "B2C", "BtoC", "CtoC", "D2C",
+}
+
+
+class TagTable:
+    """
+    vocab   : タグ文字列（sort 済み。id はこの並びの番号なので、id の大小 = 文字列の大小）
+    offsets : (n_rows + 1,) int64
+    ids     : (総タグ数,) int32。元のタグ順・重複ありのまま
+    """
+
+    def __init__(self, vocab, offsets, ids):
+        self.vocab = np.asarray(vocab, dtype=object)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.ids = np.asarray(ids, dtype=np.int32)
+
+    @property
+    def n_rows(self):
+        return len(self.offsets) - 1
+
+    @property
+    def n_tags(self):
+        return len(self.vocab)
+
+    @property
+    def lengths(self):
+        return np.diff(self.offsets)
+
+    def row_index(self):
+        """ids と同じ長さの、各要素が属する行番号"""
+        return np.repeat(np.arange(self.n_rows, dtype=np.int64), self.lengths)
+
+    def row_tags(self, i):
+        return self.vocab[self.ids[self.offsets[i]:self.offsets[i + 1]]].tolist()
+
+    def counts(self):
+        """タグごとの出現回数（重複込み）"""
+        return np.bincount(self.ids, minlength=self.n_tags)
+
+    def doc_freq(self):
+        """タグごとの企業数（企業内の重複は1回）"""
+        return self.unique_per_row().counts()
+
+    def lookup(self, tags):
+        """タグ文字列 → id（vocab にないものは -1）"""
+        tags = np.asarray(list(tags), dtype=object)
+        if self.n_tags == 0:
+            return np.full(len(tags), -1, dtype=np.int64)
+        pos = np.searchsorted(self.vocab, tags).clip(max=self.n_tags - 1)
+        return np.where(self.vocab[pos] == tags, pos, -1).astype(np.int64)
+
+    def unique_per_row(self):
+        """企業内の重複タグを消し、各行を id 昇順（= タグ文字列順）にした TagTable"""
+        key = np.unique(self.row_index() * self.n_tags + self.ids)
+        rows = key // max(self.n_tags, 1)
+        offsets = np.r_[0, np.cumsum(np.bincount(rows, minlength=self.n_rows))]
+        return TagTable(self.vocab, offsets, (key % max(self.n_tags, 1)).astype(np.int32))
+
+    def to_lists(self):
+        """行ごとのタグ文字列リスト（CSV 出力用）"""
+        return ragged_lists(self.offsets, self.vocab[self.ids])
+
+    def pairs(self):
+        """
+        各行の中のタグ2つ組 (a, b)（a < b）を全部並べた id 配列。
+        unique_per_row() 済みの表に対して使うと、
+        行ごとの combinations(sorted(set(tags)), 2) と同じ順番になる
+        """
+        lengths = self.lengths
+        n = len(self.ids)
+        # 要素 p（行内 k 番目・行長 L）は、同じ行の後ろ L-1-k 個と組になる
+        local = np.arange(n, dtype=np.int64) - np.repeat(self.offsets[:-1], lengths)
+        n_partner = np.repeat(lengths, lengths) - 1 - local
+        a_pos = np.repeat(np.arange(n, dtype=np.int64), n_partner)
+        group_start = np.cumsum(n_partner) - n_partner
+        b_pos = a_pos + 1 + (np.arange(len(a_pos), dtype=np.int64) - np.repeat(group_start, n_partner))
+        return self.ids[a_pos], self.ids[b_pos]
+
+
+def ragged_lists(offsets, values):
+    """offsets + values → 行ごとの Python リスト"""
+    values = np.asarray(values)
+    return [values[offsets[i]:offsets[i + 1]].tolist() for i in range(len(offsets) - 1)]
+
+
+def ragged_take(offsets, values, rows):
+    """行 rows の values を連結したものと、各行の長さ（offsets + values の ragged から行を抜き出す）"""
+    lengths = offsets[rows + 1] - offsets[rows]
+    pos = np.repeat(offsets[rows] - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+    return values[pos], lengths
+
+
+def parse_tags(tag_col, remove_tags=()):
+    """
+    タグ列（"AI, SaaS, 医療" のようなカンマ区切り文字列）→ TagTable
+    空白は前後を strip し、空タグと remove_tags に含まれるタグは除く
+    """
+    s = pd.Series(tag_col).reset_index(drop=True).fillna("").astype(str)
+    exploded = s.str.split(",").explode().str.strip()
+    keep = (exploded != "").to_numpy()
+    if remove_tags:
+        keep &= ~exploded.isin(remove_tags).to_numpy()
+    rows = exploded.index.to_numpy()[keep]
+    ids, vocab = pd.factorize(exploded[keep].to_numpy(dtype=object), sort=True)
+    offsets = np.r_[0, np.cumsum(np.bincount(rows, minlength=len(s)))]
+    return TagTable(vocab, offsets, ids.astype(np.int32))
+
+
+def save_table(path, table):
+    """TagTable → .npz（別プロセスのスクリプトに渡すとき用。CSV を読み直さない）"""
+    np.savez(path, vocab=table.vocab.astype(str), offsets=table.offsets, ids=table.ids)
+
+
+def load_table(path):
+    with np.load(path, allow_pickle=False) as z:
+        return TagTable(z["vocab"].astype(object), z["offsets"], z["ids"])
+
+
+def count_pairs(table):
+    """
+    タグ2つ組の共起回数（同じ企業内の重複タグは1回）。
+    戻り値 (tag1 id, tag2 id, weight) は、企業を上から順に見て初めて出てきた順
+    （Counter で数えていたときの並びと同じ）
+    """
+    a, b = table.unique_per_row().pairs()
+    key = a.astype(np.int64) * table.n_tags + b
+    uniq, first, weight = np.unique(key, return_index=True, return_counts=True)
+    order = np.argsort(first, kind="stable")
+    uniq = uniq[order]
+    return uniq // table.n_tags, uniq % table.n_tags, weight[order]
+
+
+def assign_groups(table, tag_group, n_groups=None):
+    """
+    tag id → グループ id（-1 は所属なし）の配列から、行ごとのグループ id リスト（昇順・重複なし）
+    コミュニティ付与（get_comms）やカテゴリ付与（categories_tags）に使う
+    戻り値は (offsets, group ids) の ragged array
+    """
+    tag_group = np.asarray(tag_group, dtype=np.int64)
+    if n_groups is None:
+        n_groups = int(tag_group.max()) + 1 if len(tag_group) else 0
+    g = tag_group[table.ids]
+    ok = g >= 0
+    key = np.unique(table.row_index()[ok] * max(n_groups, 1) + g[ok])
+    rows = key // max(n_groups, 1)
+    offsets = np.r_[0, np.cumsum(np.bincount(rows, minlength=table.n_rows))]
+    return offsets, key % max(n_groups, 1)
+
+
+def primary_group(table, tag_group, n_groups):
+    """
+    行ごとに最も多く出てくるグループ id（タグの重複も数える。なければ -1）。
+    同数なら先に出てきた方 = Counter(groups).most_common(1) と同じ決め方
+    """
+    tag_group = np.asarray(tag_group, dtype=np.int64)
+    n_groups = max(n_groups, 1)
+    g = tag_group[table.ids]
+    ok = g >= 0
+    key = table.row_index()[ok] * n_groups + g[ok]
+    uniq, first, cnt = np.unique(key, return_index=True, return_counts=True)
+    rows, groups = uniq // n_groups, uniq % n_groups
+    # 行ごとに (出現回数の多い順, 先に出た順) で並べて先頭を取る
+    order = np.lexsort((first, -cnt, rows))
+    rows, groups = rows[order], groups[order]
+    head = np.r_[len(rows) > 0, rows[1:] != rows[:-1]]
+    out = np.full(table.n_rows, -1, dtype=np.int64)
+    out[rows[head]] = groups[head]
+    return out
@@ -0,0 +1,40 @@
+# ========================================
+# テスト共通：リポジトリ直下のスクリプトを import できるようにし、乱数固定の小さなタグ表を用意する
+#  実行：python -m pytest tests
+# ========================================
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tag_parse import parse_tags  # noqa: E402
+
+TOY_ROWS = 240
+TOY_TAGS = [f"t{i:02d}" for i in range(14)]
+
+
+def toy_tag_column(seed=0, n_rows=TOY_ROWS):
+    """
+    カンマ区切りのタグ列（pd.Series）。タグの付きやすさに偏りをつけ、
+    タグなしの企業・同じタグの重複・前後の空白も混ぜる
+    """
+    rng = np.random.default_rng(seed)
+    prob = np.linspace(0.45, 0.04, len(TOY_TAGS))
+    rows = []
+    for _ in range(n_rows):
+        tags = [t for t, p in zip(TOY_TAGS, prob) if rng.random() < p]
+        if tags and rng.random() < 0.1:
+            tags.append(tags[0])
+        rng.shuffle(tags)
+        rows.append(" , ".join(tags))
+    return pd.Series(rows)
+
+
+@pytest.fixture
+def toy_table():
+    return parse_tags(toy_tag_column())
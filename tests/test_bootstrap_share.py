@@ -0,0 +1,75 @@
+# bootstrap_share.py：復元抽出の数え上げを1回ずつのループと比べ、標準誤差を多項分布の理論値と比べる
+
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from bootstrap_share import bootstrap_counts, bootstrap_share, membership_by_community
+
+
+@pytest.fixture
+def membership():
+    """所属のロング形式 (company_row, community_id)。企業の行番号は飛び飛び、複数コミュニティ所属あり"""
+    rng = np.random.default_rng(4)
+    rows = rng.choice(1000, size=300, replace=False)
+    company_row, community_id = [], []
+    for r in rows:
+        for c in rng.choice(6, size=rng.integers(1, 4), replace=False, p=[0.3, 0.25, 0.2, 0.12, 0.08, 0.05]):
+            company_row.append(r)
+            community_id.append(c * 10)
+    return np.array(company_row), np.array(community_id)
+
+
+def test_point_estimate(membership):
+    company_row, community_id = membership
+    out = bootstrap_share(company_row, community_id, replicates=10)
+    df = pd.DataFrame({"company_row": company_row, "community_id": community_id})
+    n = df["company_row"].nunique()
+    counts = df.groupby("community_id")["company_row"].nunique()
+    assert out.index.tolist() == counts.index.tolist()
+    assert out["n_firms"].tolist() == counts.tolist()
+    np.testing.assert_allclose(out["pct"], counts / n * 100)
+
+
+def test_counts_match_loop(membership):
+    company_row, community_id = membership
+    firm, starts, n_firms, comms = membership_by_community(company_row, community_id)
+    seed_seq = np.random.SeedSequence(5)
+    got = bootstrap_counts(firm, starts, n_firms, seed_seq, 30)
+
+    # 同じ乱数列で、replicate ごとに選ばれた企業を1社ずつ見て数える
+    firms = np.unique(company_row)
+    drawn = np.random.default_rng(seed_seq).integers(0, n_firms, size=(30, n_firms))
+    expected = np.zeros((30, len(comms)), dtype=np.int64)
+    for r in range(30):
+        picked = Counter(firms[drawn[r]].tolist())
+        for j, c in enumerate(comms):
+            members = set(company_row[community_id == c].tolist())
+            expected[r, j] = sum(k for f, k in picked.items() if f in members)
+    np.testing.assert_array_equal(got, expected)
+
+
+def test_se_matches_multinomial(membership):
+    company_row, community_id = membership
+    out = bootstrap_share(company_row, community_id, replicates=4000, seed=6)
+    n = len(np.unique(company_row))
+    p = out["n_firms"] / n
+    # 1社を n 回復元抽出 → コミュニティ c の延べ企業数 ~ Binomial(n, p_c)
+    np.testing.assert_allclose(out["pct_se"], 100 * np.sqrt(p * (1 - p) / n), rtol=0.06)
+    assert ((out["pct_lo"] < out["pct"]) & (out["pct"] < out["pct_hi"])).all()
+
+
+def test_workers_give_same_result(membership):
+    company_row, community_id = membership
+    serial = bootstrap_share(company_row, community_id, replicates=1000, seed=7, n_workers=1)
+    pooled = bootstrap_share(company_row, community_id, replicates=1000, seed=7, n_workers=3)
+    pd.testing.assert_frame_equal(serial, pooled)
+
+
+def test_no_members():
+    out = bootstrap_share(np.array([], dtype=np.int64), np.array([], dtype=np.int64), replicates=10)
+    assert out.empty
+    assert out.index.name == "community_id"
+    assert out.columns.tolist() == ["n_firms", "pct", "pct_se", "pct_lo", "pct_hi"]
@@ -0,0 +1,85 @@
+# edge_significance.py：超幾何の p 値・BH の q 値を scipy.stats と比べ、curveball が周辺和を保つか見る
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from tag_parse import count_pairs
+from edge_significance import bh_adjust, curveball_round, edge_significance, hypergeom_test, randomized_null
+
+stats = pytest.importorskip("scipy.stats")
+
+
+def _edges(table):
+    a, b, w = count_pairs(table)
+    return pd.DataFrame({"tag1": table.vocab[a], "tag2": table.vocab[b], "weight": w})
+
+
+def test_hypergeom_matches_scipy():
+    rng = np.random.default_rng(1)
+    n = 5000
+    k_a = rng.integers(1, 2500, size=300)
+    k_b = rng.integers(1, 2500, size=300)
+    # 期待値の周り・上側の裾の奥（p が極端に小さい）・下側（p ≒ 1）を混ぜる
+    dist = stats.hypergeom(n, k_a, k_b)
+    co = np.clip(np.round(dist.mean() + dist.std() * rng.uniform(-4, 30, size=300)), 0, np.minimum(k_a, k_b))
+    co = co.astype(np.int64)
+
+    expected, z, p = hypergeom_test(co, k_a, k_b, n)
+    np.testing.assert_allclose(expected, dist.mean(), rtol=1e-12)
+    np.testing.assert_allclose(z, (co - dist.mean()) / dist.std(), rtol=1e-9)
+    np.testing.assert_allclose(p, dist.sf(co - 1), rtol=1e-6, atol=1e-300)
+
+
+def test_bh_matches_scipy():
+    rng = np.random.default_rng(2)
+    p = np.r_[rng.uniform(size=200), rng.uniform(0, 1e-4, size=20), [0.5, 0.5]]
+    np.testing.assert_allclose(bh_adjust(p), stats.false_discovery_control(p), rtol=1e-12)
+    # 渡していない検定は p = 1 として数に入る
+    n_tests = 1000
+    padded = stats.false_discovery_control(np.r_[p, np.ones(n_tests - len(p))])[:len(p)]
+    np.testing.assert_allclose(bh_adjust(p, n_tests), padded, rtol=1e-12)
+
+
+def test_edge_significance_matches_scipy(toy_table):
+    edges = _edges(toy_table)
+    # 並びと tag1/tag2 の向きは問わない
+    edges = edges.sample(frac=1, random_state=0).reset_index(drop=True)
+    flip = np.arange(len(edges)) % 2 == 1
+    edges.loc[flip, ["tag1", "tag2"]] = edges.loc[flip, ["tag2", "tag1"]].to_numpy()
+
+    out = edge_significance(toy_table, edges)
+    doc_freq = dict(zip(toy_table.vocab, toy_table.doc_freq()))
+    k_a = edges["tag1"].map(doc_freq).to_numpy()
+    k_b = edges["tag2"].map(doc_freq).to_numpy()
+    n = toy_table.n_rows
+    np.testing.assert_allclose(out["p_hypergeom"], stats.hypergeom(n, k_a, k_b).sf(edges["weight"] - 1), rtol=1e-6)
+    n_tests = toy_table.n_tags * (toy_table.n_tags - 1) // 2
+    padded = np.r_[out["p_hypergeom"], np.ones(n_tests - len(out))]
+    np.testing.assert_allclose(out["q_hypergeom"], stats.false_discovery_control(padded)[:len(out)], rtol=1e-9)
+
+
+def test_curveball_keeps_margins(toy_table):
+    table = toy_table.unique_per_row()
+    rng = np.random.default_rng(3)
+    mixed = table
+    for _ in range(20):
+        mixed = curveball_round(mixed, rng)
+    np.testing.assert_array_equal(mixed.lengths, table.lengths)
+    np.testing.assert_array_equal(mixed.counts(), table.counts())
+    # 行内は重複なし・id 昇順のまま
+    np.testing.assert_array_equal(mixed.unique_per_row().ids, mixed.ids)
+    assert not np.array_equal(mixed.ids, table.ids)
+
+
+def test_null_aligns_with_edges(toy_table):
+    samples = 12
+    keys, mean, sd, n_ge = null = randomized_null(toy_table, samples=samples, burn_in=5, thin=2)
+    assert (np.diff(keys) > 0).all()
+    assert ((n_ge >= 0) & (n_ge <= samples)).all()
+
+    edges = _edges(toy_table)
+    out = edge_significance(toy_table, edges, null, samples)
+    reordered = edge_significance(toy_table, edges.iloc[::-1], null, samples).iloc[::-1]
+    pd.testing.assert_frame_equal(out, reordered)
+    assert ((out["p_null"] > 0) & (out["p_null"] <= 1)).all()
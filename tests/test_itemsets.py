@@ -0,0 +1,44 @@
+# itemsets.py：Eclat の企業数・support・lift を combinations の総当たりと比べる
+
+from itertools import combinations
+
+import numpy as np
+import pytest
+
+from itemsets import mine_itemsets
+
+
+def _brute_force(table, min_count, min_len, max_len):
+    """{tags（文字列の昇順タプル）: 企業数}"""
+    rows = [set(table.row_tags(i)) for i in range(table.n_rows)]
+    tags = sorted(set().union(*rows))
+    found = {}
+    for k in range(min_len, max_len + 1):
+        for combo in combinations(tags, k):
+            cnt = sum(1 for r in rows if r.issuperset(combo))
+            if cnt >= min_count:
+                found[combo] = cnt
+    return found
+
+
+@pytest.mark.parametrize("min_support, min_len, max_len", [(0.03, 3, 5), (12, 2, 3), (0.1, 1, 4)])
+def test_counts_match_brute_force(toy_table, min_support, min_len, max_len):
+    n = toy_table.n_rows
+    min_count = int(min_support) if min_support >= 1 else int(np.ceil(min_support * n))
+    expected = _brute_force(toy_table, min_count, min_len, max_len)
+    got = mine_itemsets(toy_table, min_support, min_len, max_len)
+    assert len(got) == len(expected) > 0
+    assert dict(zip(got["tags"], got["count"])) == expected
+
+    doc_freq = dict(zip(toy_table.vocab, toy_table.doc_freq()))
+    for row in got.itertuples():
+        assert row.length == len(row.tags)
+        assert row.support == pytest.approx(row.count / n)
+        independent = np.prod([doc_freq[t] / n for t in row.tags])
+        assert row.lift == pytest.approx(row.support / independent)
+
+
+def test_workers_give_same_result(toy_table):
+    serial = mine_itemsets(toy_table, 0.03, 3, 5, n_workers=1)
+    pooled = mine_itemsets(toy_table, 0.03, 3, 5, n_workers=2)
+    assert serial.to_dict("list") == pooled.to_dict("list")
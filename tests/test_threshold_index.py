@@ -0,0 +1,68 @@
+# threshold_index.py：閾値カーブ（union-find）を networkx で数え直した値と比べる
+
+import networkx as nx
+import numpy as np
+import pandas as pd
+import pytest
+
+from tag_parse import count_pairs
+from threshold_index import build_threshold_index
+
+
+def _edges(table):
+    a, b, w = count_pairs(table)
+    return pd.DataFrame({"tag1": table.vocab[a], "tag2": table.vocab[b], "weight": w})
+
+
+def _nx_counts(edges):
+    G = nx.Graph()
+    G.add_edges_from(zip(edges["tag1"], edges["tag2"]))
+    return G.number_of_nodes(), G.number_of_edges(), nx.number_connected_components(G)
+
+
+@pytest.fixture
+def edges(toy_table):
+    return _edges(toy_table)
+
+
+@pytest.fixture
+def tag_to_comm(toy_table):
+    # 最後の2タグはどのコミュニティにも入れない
+    return {t: i % 3 for i, t in enumerate(toy_table.vocab[:-2])}
+
+
+def test_curve_matches_networkx(edges):
+    index = build_threshold_index(edges)
+    curve = index.curve()
+    assert curve["threshold"].is_monotonic_increasing
+    assert set(curve["threshold"]) == set(edges["weight"])
+    for row in curve.itertuples():
+        expected = _nx_counts(edges[edges["weight"] >= row.threshold])
+        assert (row.nodes, row.edges, row.components) == expected
+
+
+def test_curves_by_group_match_networkx(edges, tag_to_comm):
+    index = build_threshold_index(edges, tag_to_comm)
+    by_comm = index.curves_by_group()
+    assert sorted(by_comm["community_id"].unique()) == [0, 1, 2]
+    c1 = edges["tag1"].map(tag_to_comm)
+    c2 = edges["tag2"].map(tag_to_comm)
+    for row in by_comm.itertuples():
+        intra = edges[(c1 == row.community_id) & (c2 == row.community_id)]
+        expected = _nx_counts(intra[intra["weight"] >= row.threshold])
+        assert (row.nodes, row.edges, row.components) == expected
+
+
+def test_edge_ids_match_boolean_filter(edges, tag_to_comm):
+    index = build_threshold_index(edges, tag_to_comm)
+    c1 = edges["tag1"].map(tag_to_comm)
+    same = (c1 == edges["tag2"].map(tag_to_comm)).to_numpy()
+    for t in np.unique(edges["weight"]).tolist() + [0, int(edges["weight"].max()) + 1]:
+        hit = (edges["weight"] >= t).to_numpy()
+        assert index.count(t) == hit.sum()
+        assert index.edge_ids(t).tolist() == np.flatnonzero(hit).tolist()
+        for c in range(3):
+            in_c = hit & same & (c1 == c).to_numpy()
+            assert index.edge_ids(t, group=c).tolist() == np.flatnonzero(in_c).tolist()
+            ids = index.edge_ids(t, group=c, table_order=False)
+            assert (np.diff(edges["weight"].to_numpy()[ids]) <= 0).all()
@@ -0,0 +1,153 @@
+# ========================================
+# 共起エッジの閾値インデックス
+#  - エッジを weight の降順に並べた id 列（全体 / コミュニティ内ごと）と offsets を持つ
+#    → 「weight >= t」の部分グラフは先頭からの区間（searchsorted 1回）で取れる
+#      コミュニティ c のエッジ = group_order[group_offsets[c]:group_offsets[c + 1]]（weight 降順）
+#  - 閾値カーブ：weight の大きいエッジから union-find に1本ずつ足していき、
+#    各 weight の値ごとに ノード数・エッジ数・連結成分数 を記録（全体・コミュニティ別とも1パス）
+#  co_occurrence.py / co_occurrence_new.py で edges_100・edges_comm を作るのに使い、
+#  閾値カーブを CSV に出して閾値を決める材料にする
+# ========================================
+
+import numpy as np
+import pandas as pd
+
+CURVE_COLUMNS = ["threshold", "nodes", "edges", "components"]
+
+
+class ThresholdIndex:
+    """
+    src, dst : エッジ両端のノード id（int）
+    weight   : エッジの weight（共起回数）
+    group    : エッジが属するコミュニティ id（両端が同じコミュニティのとき。それ以外は -1）
+    id は元のエッジ表の行番号（edges.iloc に渡せる）
+    """
+
+    def __init__(self, src, dst, weight, n_nodes, group=None, node_names=None):
+        self.src = np.asarray(src, dtype=np.int64)
+        self.dst = np.asarray(dst, dtype=np.int64)
+        weight = np.asarray(weight)
+        self.n_nodes = int(n_nodes)
+        self.node_names = node_names
+
+        # 全体：weight 降順（同じ weight は元の並び）
+        self.order = np.argsort(-weight, kind="stable")
+        self.weights = weight[self.order]
+
+        # コミュニティ内：(コミュニティ, weight 降順) に並べ、コミュニティごとの offsets
+        if group is None:
+            group = np.full(len(weight), -1, dtype=np.int64)
+        group = np.asarray(group, dtype=np.int64)
+        intra = np.flatnonzero(group >= 0)
+        self.n_groups = int(group.max()) + 1 if len(intra) else 0
+        self.group_order = intra[np.lexsort((-weight[intra], group[intra]))]
+        self.group_weights = weight[self.group_order]
+        self.group_offsets = np.r_[
+            0, np.cumsum(np.bincount(group[intra], minlength=self.n_groups))
+        ].astype(np.int64)
+
+    def __len__(self):
+        return len(self.order)
+
+    def _sorted(self, group):
+        if group is None:
+            return self.weights, self.order
+        if not 0 <= group < self.n_groups:
+            return self.weights[:0], self.order[:0]
+        a, b = self.group_offsets[group], self.group_offsets[group + 1]
+        return self.group_weights[a:b], self.group_order[a:b]
+
+    def count(self, threshold=None, group=None):
+        """weight >= threshold のエッジ数（threshold=None なら全部）"""
+        w, _ = self._sorted(group)
+        if threshold is None:
+            return len(w)
+        return int(np.searchsorted(-w, -threshold, side="right"))
+
+    def edge_ids(self, threshold=None, group=None, table_order=True):
+        """
+        weight >= threshold のエッジ id。table_order=True なら元の表の並び
+        （edges[edges["weight"] >= t] と同じ行・同じ順）、False なら weight 降順
+        """
+        _, ids = self._sorted(group)
+        ids = ids[:self.count(threshold, group)]
+        return np.sort(ids) if table_order else ids
+
+    def curve(self, group=None):
+        """閾値ごとの ノード数・エッジ数・連結成分数（threshold 昇順の DataFrame）"""
+        w, ids = self._sorted(group)
+        parent = list(range(self.n_nodes))
+        seen = bytearray(self.n_nodes)
+        return _curve_frame(_curve(self.src[ids].tolist(), self.dst[ids].tolist(), w.tolist(), parent, seen))
+
+    def curves_by_group(self):
+        """全コミュニティの閾値カーブ（community_id 列つき）。コミュニティ同士はノードを共有しないので union-find を1つで回す"""
+        parent = list(range(self.n_nodes))
+        seen = bytearray(self.n_nodes)
+        frames = []
+        for g in range(self.n_groups):
+            w, ids = self._sorted(g)
+            rows = _curve(self.src[ids].tolist(), self.dst[ids].tolist(), w.tolist(), parent, seen)
+            frame = _curve_frame(rows)
+            frame.insert(0, "community_id", g)
+            frames.append(frame)
+        if not frames:
+            return pd.DataFrame(columns=["community_id"] + CURVE_COLUMNS)
+        return pd.concat(frames, ignore_index=True)
+
+
+def _curve(src, dst, w, parent, seen):
+    """weight 降順のエッジを1本ずつ union し、weight の値が変わる直前ごとに (t, nodes, edges, components)"""
+    rows = []
+    nodes = comps = 0
+    n = len(w)
+    for k in range(n):
+        a, b = src[k], dst[k]
+        for x in (a, b):
+            if not seen[x]:
+                seen[x] = 1
+                nodes += 1
+                comps += 1
+        # find（経路半減）
+        while parent[a] != a:
+            parent[a] = parent[parent[a]]
+            a = parent[a]
+        while parent[b] != b:
+            parent[b] = parent[parent[b]]
+            b = parent[b]
+        if a != b:
+            parent[a] = b
+            comps -= 1
+        if k + 1 == n or w[k + 1] != w[k]:
+            rows.append((w[k], nodes, k + 1, comps))
+    return rows
+
+
+def _curve_frame(rows):
+    return pd.DataFrame(rows[::-1], columns=CURVE_COLUMNS)
+
+
+def build_threshold_index(edges, tag_to_comm=None):
+    """
+    edges（tag1, tag2, weight の DataFrame）→ ThresholdIndex
+    tag_to_comm があれば、両端が同じコミュニティのエッジをそのコミュニティに入れる
+    """
+    codes, names = pd.factorize(
+        np.concatenate([edges["tag1"].to_numpy(dtype=object), edges["tag2"].to_numpy(dtype=object)])
+    )
+    m = len(edges)
+    src, dst = codes[:m], codes[m:]
+    group = None
+    if tag_to_comm is not None:
+        node_comm = pd.Series(names).map(tag_to_comm).fillna(-1).to_numpy(dtype=np.int64)
+        group = np.where(node_comm[src] == node_comm[dst], node_comm[src], -1)
+    return ThresholdIndex(src, dst, edges["weight"].to_numpy(), len(names), group, names)
+
+
+def write_threshold_curves(index, overall_path, by_comm_path):
+    """閾値カーブを CSV に（全体・コミュニティ別）。閾値を決めるときに見る"""
+    overall = index.curve()
+    overall.to_csv(overall_path, index=False, encoding="utf-8-sig")
+    by_comm = index.curves_by_group()
+    by_comm.to_csv(by_comm_path, index=False, encoding="utf-8-sig")
+    return overall, by_comm